@@ -0,0 +1,115 @@
+"""
+protobuf编解码基准测试，对比json_format往返与直接属性映射
+
+运行: python -m benchmark.codec
+"""
+import timeit
+
+from google.protobuf import json_format
+
+from wechatferry_client.grpc import wcf_pb2
+from wechatferry_client.grpc.codec import decode_response, encode_request
+from wechatferry_client.grpc.model import Functions, Request, Response
+
+
+def json_decode(v) -> Response:
+    """旧版解析路径"""
+    data = json_format.MessageToDict(
+        message=v,
+        including_default_value_fields=True,
+        use_integers_for_enums=True,
+        preserving_proto_field_name=True,
+    )
+    return Response.parse_obj(data)
+
+
+def json_encode(request: Request) -> bytes:
+    """旧版编码路径"""
+    pb = json_format.ParseDict(
+        request.dict(exclude_defaults=True),
+        wcf_pb2.Request(),
+        ignore_unknown_fields=True,
+    )
+    return pb.SerializeToString()
+
+
+def make_wxmsg():
+    rsp = wcf_pb2.Response(func=Functions.FUNC_ENABLE_RECV_TXT)
+    rsp.wxmsg.is_group = True
+    rsp.wxmsg.type = 1
+    rsp.wxmsg.id = "1234567890123456789"
+    rsp.wxmsg.xml = "<msgsource><silence>1</silence></msgsource>"
+    rsp.wxmsg.sender = "wxid_sender"
+    rsp.wxmsg.roomid = "12345678@chatroom"
+    rsp.wxmsg.content = "hello " * 20
+    return rsp
+
+
+def make_contacts(n: int):
+    rsp = wcf_pb2.Response(func=Functions.FUNC_GET_CONTACTS)
+    for i in range(n):
+        c = rsp.contacts.contacts.add()
+        c.wxid = f"wxid_{i}"
+        c.code = f"code_{i}"
+        c.name = f"name_{i}"
+        c.country = "CN"
+        c.province = "Guangdong"
+        c.city = "Shenzhen"
+        c.gender = i % 3
+    return rsp
+
+
+def make_rows(n: int, cols: int):
+    rsp = wcf_pb2.Response(func=Functions.FUNC_EXEC_DB_QUERY)
+    for i in range(n):
+        row = rsp.rows.rows.add()
+        for j in range(cols):
+            f = row.fields.add()
+            f.type = 1
+            f.column = f"col_{j}"
+            f.content = str(i * cols + j).encode()
+    return rsp
+
+
+def bench(name: str, old, new, number: int) -> None:
+    t_old = min(timeit.repeat(old, number=number, repeat=3)) / number
+    t_new = min(timeit.repeat(new, number=number, repeat=3)) / number
+    print(
+        f"{name:<24} json_format {t_old * 1e6:>10.1f}us"
+        f"  codec {t_new * 1e6:>10.1f}us  x{t_old / t_new:.1f}"
+    )
+
+
+def main() -> None:
+    wxmsg = make_wxmsg()
+    contacts = make_contacts(5000)
+    rows = make_rows(1000, 8)
+    txt = Request(
+        func=Functions.FUNC_SEND_TXT,
+        txt={"msg": "hello", "receiver": "wxid_receiver", "aters": ""},
+    )
+    assert json_decode(wxmsg).dict() == decode_response(wxmsg).dict()
+    assert json_encode(txt) == encode_request(txt)
+
+    bench(
+        "decode wxmsg", lambda: json_decode(wxmsg), lambda: decode_response(wxmsg), 5000
+    )
+    bench(
+        "decode contacts x5000",
+        lambda: json_decode(contacts),
+        lambda: decode_response(contacts),
+        5,
+    )
+    bench(
+        "decode rows 1000x8",
+        lambda: json_decode(rows),
+        lambda: decode_response(rows),
+        5,
+    )
+    bench(
+        "encode send_text", lambda: json_encode(txt), lambda: encode_request(txt), 5000
+    )
+
+
+if __name__ == "__main__":
+    main()
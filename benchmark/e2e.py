@@ -0,0 +1,197 @@
+"""
+端到端基准测试，客户端连接本地模拟后端，测量http api吞吐、延迟分位数和消息接收吞吐
+
+模拟后端和客户端各自在子进程中运行，客户端的工作目录为临时目录，不会读取仓库中的 `.env`。
+
+运行: python -m benchmark.e2e [--actions get_db_names,send_text] [--requests 2000]
+      [--concurrency 32] [--msg-rate 2000] [--duration 10] [--workers 4] [模拟后端参数...]
+"""
+import argparse
+import asyncio
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+from benchmark.fake_wcf import add_arguments
+
+ROOT = Path(__file__).resolve().parent.parent
+"""仓库根目录"""
+
+PARAMS: dict[str, dict[str, Any]] = {
+    "send_text": {"txt": {"msg": "hello", "receiver": "wxid_bench", "aters": ""}},
+    "get_db_tables": {"str": "MicroMsg.db"},
+    "exec_db_query": {"query": {"db": "MicroMsg.db", "sql": "SELECT * FROM Contact"}},
+}
+"""各action的请求参数，未列出的不带参数"""
+
+
+def start_fake(args: argparse.Namespace) -> subprocess.Popen:
+    cmd = [
+        sys.executable,
+        "-m",
+        "benchmark.fake_wcf",
+        "--latency",
+        str(args.latency),
+        "--contacts",
+        str(args.contacts),
+        "--rows",
+        str(args.rows),
+        "--cols",
+        str(args.cols),
+        "--content-size",
+        str(args.content_size),
+        "--msg-rate",
+        str(args.msg_rate),
+        "--msg-types",
+        args.msg_types,
+    ]
+    return subprocess.Popen(cmd, cwd=ROOT)
+
+
+def start_client(args: argparse.Namespace, workdir: str) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update(
+        {
+            "PYTHONPATH": str(ROOT),
+            "inject": "false",
+            "port": str(args.port),
+            "workers": str(args.workers),
+            "log_level": args.log_level,
+            "send_rate": "0",
+            "send_receiver_rate": "0",
+            "api_timeout": "10",
+            "http_post_url": "",
+            "ws_address": "",
+        }
+    )
+    return subprocess.Popen([sys.executable, str(ROOT / "main.py")], cwd=workdir, env=env)
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/ready")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("客户端启动超时")
+
+
+def percentile(values: list[float], p: float) -> float:
+    index = min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))
+    return values[index]
+
+
+async def bench_action(
+    client: httpx.AsyncClient, action: str, total: int, concurrency: int
+) -> None:
+    params = PARAMS.get(action, {})
+    latencies: list[float] = []
+    errors = 0
+    remaining = iter(range(total))
+
+    async def worker() -> None:
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            rsp = await client.post(f"/{action}", json=params)
+            latencies.append(time.perf_counter() - start)
+            if rsp.status_code != 200 or rsp.json().get("status") != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    cost = time.perf_counter() - start
+    latencies.sort()
+    print(
+        f"{action:<16} {total / cost:>9.1f} req/s"
+        f"  p50 {percentile(latencies, 50) * 1000:>7.2f}ms"
+        f"  p90 {percentile(latencies, 90) * 1000:>7.2f}ms"
+        f"  p99 {percentile(latencies, 99) * 1000:>7.2f}ms"
+        f"  max {latencies[-1] * 1000:>7.2f}ms"
+        f"  errors {errors}"
+    )
+
+
+async def scrape_messages(client: httpx.AsyncClient) -> float:
+    """从 `/metrics` 读取已接收的消息总数"""
+    text = (await client.get("/metrics")).text
+    return sum(
+        float(value)
+        for value in re.findall(r'^wcf_messages_total\{[^}]*\} (\S+)$', text, re.M)
+    )
+
+
+async def bench_messages(client: httpx.AsyncClient, duration: float) -> None:
+    before = await scrape_messages(client)
+    start = time.perf_counter()
+    await asyncio.sleep(duration)
+    after = await scrape_messages(client)
+    cost = time.perf_counter() - start
+    print(f"{'inbound':<16} {(after - before) / cost:>9.1f} msg/s")
+
+
+async def run(args: argparse.Namespace) -> None:
+    async with httpx.AsyncClient(
+        base_url=f"http://127.0.0.1:{args.port}",
+        timeout=30,
+        limits=httpx.Limits(max_connections=args.concurrency),
+    ) as client:
+        await wait_ready(client, args.startup_timeout)
+        print(
+            f"{args.requests} 个请求，并发 {args.concurrency}，"
+            f"工作进程 {args.workers}，后端延迟 {args.latency * 1000:.1f}ms"
+        )
+        for action in args.actions.split(","):
+            await bench_action(client, action, args.requests, args.concurrency)
+        if args.msg_rate > 0:
+            print(f"后端推送速率 {args.msg_rate:.0f} msg/s，统计 {args.duration:.0f}s")
+            await bench_messages(client, args.duration)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument("--port", type=int, default=18000, help="客户端http端口")
+    parser.add_argument("--workers", type=int, default=1, help="客户端http工作进程数")
+    parser.add_argument(
+        "--actions",
+        type=str,
+        default="get_db_names,send_text,get_contacts,exec_db_query",
+        help="要测试的action，逗号分隔",
+    )
+    parser.add_argument("--requests", type=int, default=2000, help="每个action的请求数")
+    parser.add_argument("--concurrency", type=int, default=32, help="并发数")
+    parser.add_argument("--duration", type=float, default=10, help="消息接收统计时长(s)")
+    parser.add_argument("--log-level", type=str, default="WARNING", help="客户端日志等级")
+    parser.add_argument("--startup-timeout", type=float, default=30, help="启动超时(s)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        fake = start_fake(args)
+        client = None
+        try:
+            time.sleep(0.5)
+            client = start_client(args, workdir)
+            asyncio.run(run(args))
+        finally:
+            for process in (client, fake):
+                if process is not None:
+                    process.terminate()
+                    try:
+                        process.wait(10)
+                    except subprocess.TimeoutExpired:
+                        process.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+本地模拟的WeChatFerry后端，不需要wcf.exe和微信即可运行客户端
+
+api socket逐个应答所有 `Functions`，可设置应答延迟和返回数据量；
+开启接收消息后，消息socket按目标速率推送合成的 `WxMsg`。
+
+运行: python -m benchmark.fake_wcf [--latency 秒] [--contacts 数量] [--msg-rate 条/s] ...
+客户端以 `inject=false` 启动即可连接到它。
+"""
+import argparse
+import threading
+import time
+from typing import Callable, Union
+
+from pynng import Pair1
+from pynng.exceptions import Closed, Timeout
+
+from wechatferry_client.grpc import wcf_pb2
+from wechatferry_client.grpc.model import Functions
+
+API_ADDRESS = "tcp://127.0.0.1:10086"
+"""api socket地址"""
+MSG_ADDRESS = "tcp://127.0.0.1:10087"
+"""消息socket地址"""
+SELF_WXID = "wxid_fake_self"
+"""模拟的自身wxid"""
+
+
+class FakeWcf:
+    """
+    模拟后端
+
+    api和消息推送各用一个线程，`start` 后即可被客户端连接。
+    """
+
+    latency: float
+    """每次应答前的延迟(s)"""
+    contacts: int
+    """`FUNC_GET_CONTACTS` 返回的联系人数"""
+    rows: int
+    """`FUNC_EXEC_DB_QUERY` 返回的行数"""
+    cols: int
+    """`FUNC_EXEC_DB_QUERY` 返回的列数"""
+    content_size: int
+    """推送消息的内容长度"""
+    msg_rate: float
+    """推送消息速率(条/s)，为0则不推送"""
+    msg_types: tuple[int, ...]
+    """推送消息的类型，轮流使用"""
+
+    def __init__(
+        self,
+        api_address: str = API_ADDRESS,
+        msg_address: str = MSG_ADDRESS,
+        latency: float = 0,
+        contacts: int = 1000,
+        rows: int = 100,
+        cols: int = 8,
+        content_size: int = 64,
+        msg_rate: float = 0,
+        msg_types: tuple[int, ...] = (1,),
+    ) -> None:
+        self.api_address = api_address
+        self.msg_address = msg_address
+        self.latency = latency
+        self.contacts = contacts
+        self.rows = rows
+        self.cols = cols
+        self.content_size = content_size
+        self.msg_rate = msg_rate
+        self.msg_types = msg_types
+        self.requests = 0
+        """已应答的请求数"""
+        self.pushed = 0
+        """已推送的消息数"""
+        self.dropped = 0
+        """客户端来不及接收而丢弃的消息数"""
+        self._api_socket = Pair1(recv_timeout=200, send_timeout=2000)
+        self._msg_socket = Pair1(send_timeout=2000)
+        self._receiving = threading.Event()
+        self._stopped = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._cache: dict[int, bytes] = {}
+        self._handlers: dict[
+            int, Callable[[wcf_pb2.Request], Union[wcf_pb2.Response, bytes]]
+        ] = {
+            Functions.FUNC_IS_LOGIN: lambda _: self._status(Functions.FUNC_IS_LOGIN, 1),
+            Functions.FUNC_GET_SELF_WXID: self._self_wxid,
+            Functions.FUNC_GET_MSG_TYPES: self._msg_types,
+            Functions.FUNC_GET_CONTACTS: self._contacts,
+            Functions.FUNC_GET_DB_NAMES: self._db_names,
+            Functions.FUNC_GET_DB_TABLES: self._db_tables,
+            Functions.FUNC_EXEC_DB_QUERY: self._db_rows,
+            Functions.FUNC_ENABLE_RECV_TXT: self._enable_recv,
+            Functions.FUNC_DISABLE_RECV_TXT: self._disable_recv,
+        }
+
+    def start(self) -> None:
+        """监听两个socket并启动应答和推送线程"""
+        self._api_socket.listen(self.api_address)
+        self._msg_socket.listen(self.msg_address)
+        for target, name in ((self._serve_api, "fake_api"), (self._push, "fake_msg")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        """停止线程并关闭socket"""
+        self._stopped.set()
+        self._receiving.set()
+        for thread in self._threads:
+            thread.join()
+        self._api_socket.close()
+        self._msg_socket.close()
+
+    def _serve_api(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                data = self._api_socket.recv()
+            except Timeout:
+                continue
+            except Closed:
+                return
+            req = wcf_pb2.Request()
+            req.ParseFromString(data)
+            if self.latency > 0:
+                time.sleep(self.latency)
+            handler = self._handlers.get(req.func)
+            if handler is None:
+                rsp = self._status(req.func, 0)
+            else:
+                rsp = handler(req)
+            try:
+                self._api_socket.send(
+                    rsp if isinstance(rsp, bytes) else rsp.SerializeToString()
+                )
+            except Timeout:
+                # 客户端在应答前断开，丢弃这次回复
+                continue
+            except Closed:
+                return
+            self.requests += 1
+
+    def _push(self) -> None:
+        """按速率推送消息，速率较高时每次醒来补发落后的条数"""
+        content = "x" * self.content_size
+        while not self._stopped.is_set():
+            self._receiving.wait()
+            if self._stopped.is_set() or self.msg_rate <= 0:
+                return
+            start = time.perf_counter()
+            sent = 0
+            while self._receiving.is_set() and not self._stopped.is_set():
+                due = int((time.perf_counter() - start) * self.msg_rate) + 1
+                while sent < due:
+                    try:
+                        self._msg_socket.send(self._wxmsg(sent, content))
+                    except Timeout:
+                        self.dropped += 1
+                    except Closed:
+                        return
+                    sent += 1
+                    self.pushed += 1
+                time.sleep(min(1 / self.msg_rate, 0.01))
+
+    def _wxmsg(self, index: int, content: str) -> bytes:
+        rsp = wcf_pb2.Response(func=Functions.FUNC_ENABLE_RECV_TXT)
+        msg = rsp.wxmsg
+        msg.is_group = index % 2 == 0
+        msg.type = self.msg_types[index % len(self.msg_types)]
+        msg.id = str(10**18 + self.pushed)
+        msg.xml = "<msgsource><silence>0</silence></msgsource>"
+        msg.sender = f"wxid_sender_{index % 100}"
+        msg.roomid = f"{index % 10}@chatroom" if msg.is_group else ""
+        msg.content = content
+        return rsp.SerializeToString()
+
+    def _status(self, func: int, status: int) -> wcf_pb2.Response:
+        return wcf_pb2.Response(func=func, status=status)
+
+    def _self_wxid(self, _) -> wcf_pb2.Response:
+        return wcf_pb2.Response(func=Functions.FUNC_GET_SELF_WXID, str=SELF_WXID)
+
+    def _msg_types(self, _) -> wcf_pb2.Response:
+        rsp = wcf_pb2.Response(func=Functions.FUNC_GET_MSG_TYPES)
+        rsp.types.types.update({1: "文字", 3: "图片", 34: "语音", 49: "卡片"})
+        return rsp
+
+    def _contacts(self, _) -> bytes:
+        """联系人列表较大，只生成一次"""
+        data = self._cache.get(Functions.FUNC_GET_CONTACTS)
+        if data is None:
+            rsp = wcf_pb2.Response(func=Functions.FUNC_GET_CONTACTS)
+            for i in range(self.contacts):
+                c = rsp.contacts.contacts.add()
+                c.wxid = f"wxid_{i}"
+                c.code = f"code_{i}"
+                c.name = f"name_{i}"
+                c.country = "CN"
+                c.province = "Guangdong"
+                c.city = "Shenzhen"
+                c.gender = i % 3
+            data = self._cache[Functions.FUNC_GET_CONTACTS] = rsp.SerializeToString()
+        return data
+
+    def _db_names(self, _) -> wcf_pb2.Response:
+        rsp = wcf_pb2.Response(func=Functions.FUNC_GET_DB_NAMES)
+        rsp.dbs.names.extend(["MicroMsg.db", "ChatMsg.db", "Misc.db"])
+        return rsp
+
+    def _db_tables(self, req: wcf_pb2.Request) -> wcf_pb2.Response:
+        rsp = wcf_pb2.Response(func=Functions.FUNC_GET_DB_TABLES)
+        for i in range(10):
+            table = rsp.tables.tables.add()
+            table.name = f"table_{i}"
+            table.sql = f"CREATE TABLE table_{i}(id INTEGER PRIMARY KEY, value TEXT)"
+        return rsp
+
+    def _db_rows(self, _) -> bytes:
+        data = self._cache.get(Functions.FUNC_EXEC_DB_QUERY)
+        if data is None:
+            rsp = wcf_pb2.Response(func=Functions.FUNC_EXEC_DB_QUERY)
+            for i in range(self.rows):
+                row = rsp.rows.rows.add()
+                for j in range(self.cols):
+                    field = row.fields.add()
+                    field.type = 1
+                    field.column = f"col_{j}"
+                    field.content = str(i * self.cols + j).encode()
+            data = self._cache[Functions.FUNC_EXEC_DB_QUERY] = rsp.SerializeToString()
+        return data
+
+    def _enable_recv(self, _) -> wcf_pb2.Response:
+        self._receiving.set()
+        return self._status(Functions.FUNC_ENABLE_RECV_TXT, 0)
+
+    def _disable_recv(self, _) -> wcf_pb2.Response:
+        self._receiving.clear()
+        return self._status(Functions.FUNC_DISABLE_RECV_TXT, 0)
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """模拟后端的命令行参数，e2e基准测试共用"""
+    parser.add_argument("--latency", type=float, default=0, help="应答延迟(s)")
+    parser.add_argument("--contacts", type=int, default=1000, help="联系人数")
+    parser.add_argument("--rows", type=int, default=100, help="查询返回行数")
+    parser.add_argument("--cols", type=int, default=8, help="查询返回列数")
+    parser.add_argument("--content-size", type=int, default=64, help="消息内容长度")
+    parser.add_argument("--msg-rate", type=float, default=0, help="推送速率(条/s)")
+    parser.add_argument(
+        "--msg-types", type=str, default="1", help="推送的消息类型，逗号分隔"
+    )
+
+
+def from_arguments(args: argparse.Namespace) -> FakeWcf:
+    return FakeWcf(
+        latency=args.latency,
+        contacts=args.contacts,
+        rows=args.rows,
+        cols=args.cols,
+        content_size=args.content_size,
+        msg_rate=args.msg_rate,
+        msg_types=tuple(int(t) for t in args.msg_types.split(",")),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_arguments(parser)
+    fake = from_arguments(parser.parse_args())
+    fake.start()
+    print(f"模拟后端已启动：{fake.api_address} {fake.msg_address}", flush=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+图片解密基准测试，使用随机生成的 `.dat` 文件，对比逐字节异或、单进程流式解密与进程池解密
+
+运行: python -m benchmark.image_decode [文件数] [单个文件KB]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from wechatferry_client.config import Config
+from wechatferry_client.image_decoder import ImageDecoder, decode_dat
+
+KEY = 0x5A
+
+
+def make_dat_files(root: Path, count: int, size: int) -> list[str]:
+    """生成以JPEG/PNG/GIF开头、异或KEY的 `.dat` 文件"""
+    heads = (b"\xff\xd8\xff\xe0", b"\x89PNG\r\n\x1a\n", b"GIF89a")
+    table = bytes(i ^ KEY for i in range(256))
+    paths = []
+    for i in range(count):
+        data = heads[i % len(heads)] + os.urandom(size)
+        path = root / f"{i:06d}.dat"
+        path.write_bytes(data.translate(table))
+        paths.append(str(path))
+    return paths
+
+
+def naive_decode(src: str, dst_dir: str) -> None:
+    """逐字节异或，作为对照"""
+    data = Path(src).read_bytes()
+    key = data[0] ^ 0xFF
+    out = bytes(b ^ key for b in data)
+    (Path(dst_dir) / (Path(src).stem + ".bin")).write_bytes(out)
+
+
+def bench(name: str, func, count: int, size: int) -> None:
+    start = time.perf_counter()
+    func()
+    cost = time.perf_counter() - start
+    mb = count * size / 1024 / 1024
+    print(f"{name:<20} {cost * 1000:>9.1f}ms  {mb / cost:>8.1f}MB/s")
+
+
+async def pool_decode(decoder: ImageDecoder, paths: list[str]) -> None:
+    await asyncio.gather(*(decoder.decode(path) for path in paths))
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    size = (int(sys.argv[2]) if len(sys.argv) > 2 else 256) * 1024
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        paths = make_dat_files(root, count, size)
+        for name in ("naive", "serial", "pool"):
+            (root / name).mkdir()
+        print(f"{count} 个文件，每个 {size // 1024}KB")
+        bench(
+            "naive (10 files)",
+            lambda: [naive_decode(path, str(root / "naive")) for path in paths[:10]],
+            10,
+            size,
+        )
+        bench(
+            "serial",
+            lambda: [decode_dat(path, str(root / "serial")) for path in paths],
+            count,
+            size,
+        )
+        decoder = ImageDecoder(Config(image_path=str(root / "pool"), image_timeout=600))
+        # 预热进程池，文件已存在时 `_wait_for_file` 只等待一次检查间隔
+        asyncio.run(pool_decode(decoder, paths[:1]))
+        bench(
+            f"pool x{decoder.workers}",
+            lambda: asyncio.run(pool_decode(decoder, paths[1:])),
+            count - 1,
+            size,
+        )
+        decoder.close()
+
+
+if __name__ == "__main__":
+    main()
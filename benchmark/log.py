@@ -0,0 +1,87 @@
+"""
+日志基准测试，对比每条消息在不同日志等级下旧版与新版记录路径的耗时
+
+运行: python -m benchmark.log [消息数]
+"""
+import sys
+import timeit
+
+from wechatferry_client.grpc.model import WxMsg
+from wechatferry_client.log import default_filter, logger, logger_id
+from wechatferry_client.model import HttpResponse, MessageEvent
+from wechatferry_client.utils import escape_tag, preview
+
+
+def make_event() -> MessageEvent:
+    msg = WxMsg(
+        is_self=False,
+        is_group=True,
+        type=1,
+        id="1234567890123456789",
+        xml="<msgsource><silence>1</silence></msgsource>",
+        sender="wxid_sender",
+        roomid="12345678@chatroom",
+        content="hello " * 20,
+    )
+    return MessageEvent(self_id="wxid_self", time=0, message=msg)
+
+
+def make_contacts(n: int) -> HttpResponse:
+    data = [
+        {"wxid": f"wxid_{i}", "code": f"code_{i}", "name": f"name_{i}", "gender": 1}
+        for i in range(n)
+    ]
+    return HttpResponse(status=200, msg="请求成功", data=data)
+
+
+def old_log_event(event: MessageEvent) -> None:
+    """旧版消息日志，总是序列化"""
+    logger.debug(
+        f"收到消息 - "
+        f"{escape_tag(event.message.json(skip_defaults=True,ensure_ascii=False))}"
+    )
+
+
+def new_log_event(event: MessageEvent) -> None:
+    """新版消息日志，等级不够时直接返回"""
+    if not default_filter.enabled("DEBUG"):
+        return
+    old_log_event(event)
+
+
+def old_log_response(res: HttpResponse) -> None:
+    """旧版返回日志，完整格式化"""
+    logger.info(f"<m>http_api</m> - <g>调用返回：</g>{escape_tag(str(res))}")
+
+
+def new_log_response(res: HttpResponse) -> None:
+    """新版返回日志，只记录预览"""
+    if default_filter.enabled("INFO"):
+        logger.info(
+            f"<m>http_api</m> - <g>调用返回：</g>status={res.status} "
+            f"msg={escape_tag(res.msg)} data={escape_tag(preview(res.data))}"
+        )
+
+
+def bench(name: str, func, number: int) -> None:
+    cost = min(timeit.repeat(func, number=number, repeat=3)) / number
+    print(f"{name:<28} {cost * 1e6:>10.2f}us")
+
+
+def main() -> None:
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    logger.remove(logger_id)
+    logger.add(lambda _: None, level=0, filter=default_filter, format="{message}")
+    event = make_event()
+    contacts = make_contacts(5000)
+    for level in ("DEBUG", "INFO", "WARNING"):
+        default_filter.level = level
+        print(f"--- {level} ---")
+        bench("message old", lambda: old_log_event(event), number)
+        bench("message new", lambda: new_log_event(event), number)
+        bench("contacts(5000) old", lambda: old_log_response(contacts), 20)
+        bench("contacts(5000) new", lambda: new_log_response(contacts), 20)
+
+
+if __name__ == "__main__":
+    main()
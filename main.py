@@ -1,7 +1,6 @@
 import wechatferry_client
 
-wechatferry_client.init()
-
-
+# 多个工作进程以spawn方式启动时会重新导入本模块，初始化只能在主进程中执行
 if __name__ == "__main__":
+    wechatferry_client.init()
     wechatferry_client.run()
@@ -0,0 +1,31 @@
+"""
+测试公用的fixture，后端由 `benchmark.fake_wcf` 模拟
+"""
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+from pynng import Pair1
+
+from benchmark.fake_wcf import FakeWcf
+from wechatferry_client.grpc.dispatcher import RequestDispatcher
+
+
+@pytest.fixture
+def fake_wcf(tmp_path: Path) -> Iterator[FakeWcf]:
+    """监听临时ipc地址的模拟后端"""
+    fake = FakeWcf(f"ipc://{tmp_path}/api", f"ipc://{tmp_path}/msg")
+    fake.start()
+    yield fake
+    fake.stop()
+
+
+@pytest.fixture
+def dispatcher(fake_wcf: FakeWcf) -> Iterator[RequestDispatcher]:
+    """已连接模拟后端的请求调度器，截止时间1s"""
+    socket = Pair1(send_timeout=2000, recv_timeout=2000)
+    socket.dial(fake_wcf.api_address)
+    dispatcher = RequestDispatcher(socket, timeout=1)
+    yield dispatcher
+    dispatcher.stop()
+    socket.close()
@@ -0,0 +1,62 @@
+import pytest
+
+from wechatferry_client.config import Config
+from wechatferry_client.model import BatchItem, BatchRequest
+from wechatferry_client.wechat.wechat import WeChatManager
+
+
+@pytest.fixture
+def wechat() -> WeChatManager:
+    wechat = WeChatManager()
+    wechat.config = Config(batch_max_size=3)
+    return wechat
+
+
+def batch(*items: dict) -> BatchRequest:
+    return BatchRequest(requests=[BatchItem(**item) for item in items])
+
+
+def text(receiver: str = "wxid_a", **params) -> dict:
+    return {"msg": "hello", "receiver": receiver, "aters": "", **params}
+
+
+def test_valid_batch(wechat: WeChatManager):
+    request = batch(
+        {"action": "send_text", "params": {"txt": text(), "lane": "bulk"}},
+        {"action": "get_contact", "params": {"wxid": "wxid_a"}},
+        {
+            "action": "send_file",
+            "params": {"file": {"url": "http://example.com/a.png", "receiver": "b"}},
+        },
+    )
+    assert wechat.check_batch(request) is None
+
+
+def test_too_many_requests(wechat: WeChatManager):
+    request = batch(*({"action": "get_contacts", "params": {}} for _ in range(4)))
+    response = wechat.check_batch(request)
+    assert response.status == 413
+
+
+def test_unknown_action(wechat: WeChatManager):
+    request = batch(
+        {"action": "get_contacts", "params": {}},
+        {"action": "no_such_action", "params": {}, "id": "x"},
+    )
+    response = wechat.check_batch(request)
+    assert response.status == 404
+    assert response.data == [{"index": 1, "id": "x", "action": "no_such_action"}]
+
+
+def test_invalid_params(wechat: WeChatManager):
+    request = batch(
+        {"action": "send_text", "params": {"txt": {"msg": "hello"}}, "id": "a"},
+        {"action": "send_text", "params": {"txt": text(), "lane": "nope"}},
+        {"action": "send_text", "params": {"txt": text()}},
+    )
+    response = wechat.check_batch(request)
+    assert response.status == 500
+    assert response.msg == "请求参数错误"
+    assert [item["index"] for item in response.data] == [0, 1]
+    assert response.data[0]["id"] == "a"
+    assert "优先级通道不存在" in response.data[1]["error"]
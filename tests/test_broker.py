@@ -0,0 +1,83 @@
+import asyncio
+import time
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+from pynng.exceptions import Closed, NNGException
+
+from benchmark.fake_wcf import FakeWcf
+from wechatferry_client.config import AccountConfig, Config
+from wechatferry_client.grpc import Broker, DispatcherTimeout, GrpcManager
+from wechatferry_client.grpc.broker import broker_account
+from wechatferry_client.grpc.model import Functions, Request
+
+
+@pytest.fixture
+def config(tmp_path: Path) -> Config:
+    return Config(api_timeout=0.2, broker_address=f"ipc://{tmp_path}/broker")
+
+
+@pytest.fixture
+def broker(fake_wcf: FakeWcf, config: Config) -> Iterator[Broker]:
+    backend = AccountConfig(
+        api_address=fake_wcf.api_address, msg_address=fake_wcf.msg_address
+    )
+    broker = Broker(config, backend, broker_account(config, 0))
+    broker.start()
+    yield broker
+    broker.stop()
+
+
+def test_broker_timeout_reaches_worker(
+    fake_wcf: FakeWcf, config: Config, broker: Broker
+):
+    async def main():
+        grpc = GrpcManager()
+        grpc.init(config.copy(update={"api_timeout": 3}), broker_account(config, 0))
+        grpc.api_socket.dial(grpc.api_address)
+        fake_wcf.latency = 0.5
+        start = time.monotonic()
+        try:
+            with pytest.raises(DispatcherTimeout, match="broker"):
+                await grpc.request(Request(func=Functions.FUNC_GET_SELF_WXID))
+        finally:
+            grpc.close()
+        # broker按自己的截止时间回复，工作进程不用等到自己的3s
+        assert time.monotonic() - start < 1
+
+    asyncio.run(main())
+
+
+class _FlakySocket:
+    """第一次接收出错，之后收到一条消息，然后关闭"""
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    async def arecv_msg(self):
+        self.calls += 1
+        if self.calls == 1:
+            raise NNGException("transient", 0)
+        if self.calls == 2:
+            return type("Msg", (), {"bytes": b"msg"})()
+        raise Closed("closed", 0)
+
+
+class _Pub:
+    def __init__(self) -> None:
+        self.sent: list[bytes] = []
+
+    async def asend(self, data: bytes) -> None:
+        self.sent.append(data)
+
+
+def test_forward_survives_errors(config: Config):
+    broker = Broker(config, AccountConfig(), broker_account(config, 0))
+    broker.grpc.msg_socket = _FlakySocket()
+    broker.pub_socket.close()
+    broker.pub_socket = _Pub()
+    asyncio.run(asyncio.wait_for(broker._forward(), 2))
+    assert broker.pub_socket.sent == [b"msg"]
+    broker.api_socket.close()
+    broker.grpc.api_socket.close()
@@ -0,0 +1,136 @@
+import asyncio
+import time
+
+import pytest
+
+from benchmark.fake_wcf import SELF_WXID, FakeWcf
+from wechatferry_client.grpc import (
+    DispatcherBusy,
+    DispatcherTimeout,
+    DispatcherUnavailable,
+)
+from wechatferry_client.grpc.dispatcher import RequestDispatcher, _nng
+from wechatferry_client.grpc.model import Functions, Request
+
+QUERY_FUNCS = (
+    Functions.FUNC_GET_SELF_WXID,
+    Functions.FUNC_GET_MSG_TYPES,
+    Functions.FUNC_GET_DB_NAMES,
+    Functions.FUNC_IS_LOGIN,
+)
+
+
+def test_concurrent_requests_get_their_own_reply(dispatcher: RequestDispatcher):
+    async def main():
+        requests = [Request(func=func) for func in QUERY_FUNCS * 5]
+        results = await asyncio.gather(
+            *(dispatcher.submit(request, raw=True) for request in requests)
+        )
+        assert [rsp.func for rsp in results] == [req.func for req in requests]
+
+    asyncio.run(main())
+
+
+def test_timeout_drops_late_reply(fake_wcf: FakeWcf, dispatcher: RequestDispatcher):
+    async def main():
+        fake_wcf.latency = 0.3
+        with pytest.raises(DispatcherTimeout):
+            await dispatcher.submit(
+                Request(func=Functions.FUNC_IS_LOGIN), timeout=0.1
+            )
+        # 调度任务的接收超时和调用方的截止时间几乎同时到，等它记入stale
+        await asyncio.sleep(0.05)
+        assert dispatcher.stale == 1
+        fake_wcf.latency = 0
+        # 迟到的FUNC_IS_LOGIN回复先被丢弃，不会被当作这次请求的结果
+        rsp = await dispatcher.submit(
+            Request(func=Functions.FUNC_GET_SELF_WXID), raw=True
+        )
+        assert rsp.str == SELF_WXID
+        assert dispatcher.stale == 0
+
+    asyncio.run(main())
+
+
+def test_stale_reply_with_same_func_is_dropped(
+    fake_wcf: FakeWcf, dispatcher: RequestDispatcher
+):
+    async def main():
+        fake_wcf.latency = 0.3
+        request = Request(func=Functions.FUNC_GET_SELF_WXID)
+        with pytest.raises(DispatcherTimeout):
+            await dispatcher.submit(request, timeout=0.1)
+        fake_wcf.latency = 0
+        start = time.monotonic()
+        await dispatcher.submit(request, raw=True)
+        # 先等到过期回复并丢弃，再收到这次请求的回复
+        assert time.monotonic() - start >= 0.15
+        assert dispatcher.stale == 0
+
+    asyncio.run(main())
+
+
+def test_queue_full(fake_wcf: FakeWcf, dispatcher: RequestDispatcher):
+    async def main():
+        fake_wcf.latency = 0.1
+        dispatcher.queue_size = 1
+        request = Request(func=Functions.FUNC_IS_LOGIN)
+        first = asyncio.create_task(dispatcher.submit(request))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(dispatcher.submit(request))
+        await asyncio.sleep(0)
+        with pytest.raises(DispatcherBusy):
+            await dispatcher.submit(request)
+        await asyncio.gather(first, second)
+
+    asyncio.run(main())
+
+
+def test_breaker_opens_after_timeouts(
+    fake_wcf: FakeWcf, dispatcher: RequestDispatcher
+):
+    async def main():
+        fake_wcf.latency = 0.2
+        dispatcher.breaker.threshold = 2
+        dispatcher.breaker.cooldown = 60
+        request = Request(func=Functions.FUNC_IS_LOGIN)
+        for _ in range(2):
+            with pytest.raises(DispatcherTimeout):
+                await dispatcher.submit(request, timeout=0.05)
+            # 等调度任务的接收超时计入熔断器
+            await asyncio.sleep(0.05)
+        with pytest.raises(DispatcherUnavailable):
+            await dispatcher.submit(request)
+
+    asyncio.run(main())
+
+
+def test_send_funcs_use_fixed_timeout(dispatcher: RequestDispatcher):
+    timeouts = dispatcher.timeouts
+    timeouts.min_samples = timeouts.refresh = 1
+    for func in (Functions.FUNC_SEND_TXT, Functions.FUNC_GET_CONTACTS):
+        timeouts.observe(func, 0.001)
+    assert timeouts.get(Functions.FUNC_SEND_TXT) == timeouts.maximum
+    assert timeouts.get(Functions.FUNC_GET_CONTACTS) == timeouts.minimum
+
+
+
+def test_cancel_is_not_swallowed_by_nng():
+    async def swallow(done: asyncio.Event):
+        # 与pynng一样：取消时操作已经完成，吞掉CancelledError后照常返回
+        try:
+            await done.wait()
+        except asyncio.CancelledError:
+            pass
+        return "late"
+
+    async def main():
+        done = asyncio.Event()
+        task = asyncio.create_task(_nng(swallow(done)))
+        await asyncio.sleep(0)
+        task.cancel()
+        done.set()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
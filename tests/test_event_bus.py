@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from wechatferry_client.event_bus import EventBus, Subscriber
+from wechatferry_client.metrics import registry
+from wechatferry_client.wechat.wechat import WeChatManager
+
+
+def test_drop_oldest():
+    subscriber: Subscriber[int] = Subscriber("test", 3, "drop_oldest")
+    for i in range(5):
+        subscriber.put(i)
+    assert subscriber.depth == 3
+    assert subscriber.dropped == 2
+    assert subscriber.max_depth == 3
+
+    async def main():
+        return [await subscriber.get() for _ in range(3)]
+
+    assert asyncio.run(main()) == [2, 3, 4]
+
+
+def test_drop_newest():
+    subscriber: Subscriber[int] = Subscriber("test", 3, "drop_newest")
+    for i in range(5):
+        subscriber.put(i)
+    assert subscriber.dropped == 2
+
+    async def main():
+        return [await subscriber.get() for _ in range(3)]
+
+    assert asyncio.run(main()) == [0, 1, 2]
+    stats = subscriber.stats()
+    assert stats["received"] == 5
+    assert stats["delivered"] == 3
+    assert stats["depth"] == 0
+
+
+def test_get_timeout():
+    async def main():
+        subscriber: Subscriber[int] = Subscriber("test", 1, "drop_oldest")
+        with pytest.raises(asyncio.TimeoutError):
+            await subscriber.get(0.01)
+
+    asyncio.run(main())
+
+
+def test_slow_subscriber_does_not_affect_others():
+    async def main():
+        bus: EventBus[int] = EventBus(maxsize=2)
+        received = []
+        bus.consume("fast", received.append, maxsize=10)
+        slow = bus.subscribe("slow")
+        bus.start()
+        for i in range(5):
+            bus.publish(i)
+        await asyncio.sleep(0.01)
+        bus.stop()
+        assert received == [0, 1, 2, 3, 4]
+        assert slow.depth == 2
+        assert slow.dropped == 3
+
+    asyncio.run(main())
+
+
+def test_handler_error_does_not_stop_consumer():
+    async def main():
+        bus: EventBus[int] = EventBus()
+        received = []
+
+        async def handler(event: int) -> None:
+            if event == 1:
+                raise ValueError("bad event")
+            received.append(event)
+
+        bus.consume("test", handler)
+        bus.start()
+        for i in range(3):
+            bus.publish(i)
+        await asyncio.sleep(0.01)
+        bus.stop()
+        assert received == [0, 2]
+
+    asyncio.run(main())
+
+
+def test_subscriber_metrics():
+    wechat = WeChatManager()
+    subscriber = wechat.event_bus.subscribe("metrics_test", 1, "drop_newest")
+    subscriber.put(1)
+    subscriber.put(2)
+    lines = registry.render().splitlines()
+    assert 'wcf_subscriber_depth{subscriber="metrics_test"} 1' in lines
+    assert 'wcf_subscriber_dropped_total{subscriber="metrics_test"} 1' in lines
+    assert "# TYPE wcf_subscriber_dropped_total counter" in lines
+    assert any(
+        line.startswith('wcf_subscriber_lag_seconds{subscriber="metrics_test"} ')
+        for line in lines
+    )
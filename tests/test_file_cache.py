@@ -0,0 +1,28 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from wechatferry_client.config import Config
+from wechatferry_client.file_cache import FileCache
+from wechatferry_client.wechat.wechat import WeChatManager
+
+
+@pytest.fixture
+def wechat(tmp_path: Path) -> WeChatManager:
+    wechat = WeChatManager()
+    wechat.file_cache = FileCache(Config(cache_path=str(tmp_path)))
+    return wechat
+
+
+def test_resolve_base64(wechat: WeChatManager):
+    params = {"file": {"base64": "base64://aGVsbG8=", "name": "a.txt"}}
+    assert asyncio.run(wechat._resolve_file(params)) is None
+    assert Path(params["file"]["path"]).read_bytes() == b"hello"
+
+
+@pytest.mark.parametrize("url", ["http://:abc/", "http://[::1", "not a url"])
+def test_resolve_bad_url(wechat: WeChatManager, url: str):
+    res = asyncio.run(wechat._resolve_file({"file": {"url": url}}))
+    assert res.status == 502
+    assert res.msg == "文件下载失败"
@@ -0,0 +1,62 @@
+import time
+
+from wechatferry_client.grpc.health import AdaptiveTimeout, CircuitBreaker
+
+
+def test_adaptive_timeout_uses_maximum_until_enough_samples():
+    timeouts = AdaptiveTimeout(
+        factor=3, minimum=0.1, maximum=2, min_samples=4, refresh=2
+    )
+    for _ in range(3):
+        timeouts.observe(1, 0.1)
+    assert timeouts.get(1) == 2
+    timeouts.observe(1, 0.1)
+    assert abs(timeouts.get(1) - 0.3) < 1e-9
+    # 其他请求类型不受影响
+    assert timeouts.get(2) == 2
+
+
+def test_adaptive_timeout_clamped():
+    timeouts = AdaptiveTimeout(
+        factor=3, minimum=0.5, maximum=2, min_samples=1, refresh=1
+    )
+    timeouts.observe(1, 0.01)
+    assert timeouts.get(1) == 0.5
+    timeouts.observe(2, 10)
+    assert timeouts.get(2) == 2
+
+
+def test_adaptive_timeout_disabled_or_fixed():
+    timeouts = AdaptiveTimeout(
+        factor=0, minimum=0.1, maximum=2, min_samples=1, refresh=1
+    )
+    timeouts.observe(1, 0.1)
+    assert timeouts.get(1) == 2
+    timeouts = AdaptiveTimeout(
+        minimum=0.1, maximum=2, min_samples=1, refresh=1, fixed=frozenset({1})
+    )
+    timeouts.observe(1, 0.1)
+    assert timeouts.get(1) == 2
+
+
+def test_breaker_opens_and_probes():
+    breaker = CircuitBreaker(threshold=3, cooldown=0.05)
+    assert not breaker.failure()
+    assert not breaker.failure()
+    assert breaker.failure()
+    assert breaker.is_open
+    assert not breaker.allow()
+    time.sleep(0.06)
+    # 每个冷却期只放行一个试探请求
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.success()
+    assert not breaker.is_open
+    assert breaker.allow()
+
+
+def test_breaker_disabled():
+    breaker = CircuitBreaker(threshold=0)
+    for _ in range(10):
+        assert not breaker.failure()
+    assert breaker.allow()
@@ -0,0 +1,34 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from wechatferry_client.image_decoder import decode_dat, detect_key
+
+JPEG = b"\xff\xd8\xff\xe0" + bytes(range(256)) * 4096
+
+
+def write_dat(path: Path, key: int = 0x5A) -> Path:
+    path.write_bytes(bytes(b ^ key for b in JPEG))
+    return path
+
+
+def test_detect_key():
+    assert detect_key(bytes(b ^ 0x5A for b in JPEG[:4])) == (0x5A, ".jpg")
+    assert detect_key(b"\x00\x00\x00\x00") is None
+
+
+def test_decode(tmp_path: Path):
+    src = write_dat(tmp_path / "a.dat")
+    dst = decode_dat(str(src), str(tmp_path))
+    assert dst == str(tmp_path / "a.jpg")
+    assert Path(dst).read_bytes() == JPEG
+
+
+def test_concurrent_decodes_of_same_file(tmp_path: Path):
+    src = write_dat(tmp_path / "a.dat")
+    out = tmp_path / "out"
+    out.mkdir()
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda _: decode_dat(str(src), str(out)), range(8)))
+    assert set(results) == {str(out / "a.jpg")}
+    assert (out / "a.jpg").read_bytes() == JPEG
+    assert list(out.glob("*.tmp")) == []
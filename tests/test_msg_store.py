@@ -0,0 +1,141 @@
+from pathlib import Path
+
+from wechatferry_client.config import Config
+from wechatferry_client.grpc.model import WxMsg
+from wechatferry_client.model import MessageEvent
+from wechatferry_client.msg_store import MsgStore
+
+
+def event(index: int) -> MessageEvent:
+    return MessageEvent(
+        self_id="wxid_self",
+        time=1000 + index,
+        message=WxMsg(
+            is_self=False,
+            is_group=False,
+            type=1,
+            id=f"msg{index}",
+            xml="",
+            sender="wxid_sender",
+            roomid="",
+            content=f"content {index}",
+        ),
+    )
+
+
+def open_store(path: Path, **update) -> MsgStore:
+    config = Config(
+        msg_store_segment_size=update.get("segment_size", 1 << 20),
+        msg_store_keep_segments=update.get("keep_segments", 8),
+        msg_store_index_interval=4,
+        msg_store_flush_records=update.get("flush_records", 256),
+    )
+    store = MsgStore(config, path)
+    store.open()
+    return store
+
+
+def test_append_and_replay(tmp_path: Path):
+    store = open_store(tmp_path)
+    seqs = [store.append(event(i)) for i in range(10)]
+    assert seqs == list(range(10))
+    records = store.replay(limit=100)
+    assert [msg.id for _, _, msg in records] == [f"msg{i}" for i in range(10)]
+    assert [seq for seq, _, _ in store.replay(after_seq=6)] == [7, 8, 9]
+    assert [time for _, time, _ in store.replay(since_time=1008)] == [1008, 1009]
+    assert len(store.replay(limit=3)) == 3
+    assert store.find_seq("msg5") == 5
+    assert store.find_seq("missing") is None
+    store.close()
+
+
+def test_reopen(tmp_path: Path):
+    store = open_store(tmp_path, segment_size=200)
+    for i in range(10):
+        store.append(event(i))
+    segments = len(store.segments)
+    store.close()
+    assert segments > 1
+    store = open_store(tmp_path, segment_size=200)
+    assert len(store.segments) == segments
+    assert store.next_seq == 10
+    assert store.append(event(10)) == 10
+    assert store.find_seq("msg3") == 3
+    assert [seq for seq, _, _ in store.replay(after_seq=7)] == [8, 9, 10]
+    store.close()
+
+
+def test_reopen_truncates_partial_record(tmp_path: Path):
+    store = open_store(tmp_path)
+    for i in range(3):
+        store.append(event(i))
+    path = store.segments[-1].path
+    store.close()
+    with open(path, "ab") as f:
+        f.write(b"\x00" * 5)
+    store = open_store(tmp_path)
+    assert store.next_seq == 3
+    assert store.append(event(3)) == 3
+    assert [msg.id for _, _, msg in store.replay()] == [f"msg{i}" for i in range(4)]
+    store.close()
+
+
+def test_rebuild_missing_indexes(tmp_path: Path):
+    store = open_store(tmp_path)
+    for i in range(6):
+        store.append(event(i))
+    segment = store.segments[-1]
+    store.close()
+    segment.ids_path.unlink()
+    segment.index_path.unlink()
+    store = open_store(tmp_path)
+    assert store.find_seq("msg4") == 4
+    assert [seq for seq, _, _ in store.replay(after_seq=3)] == [4, 5]
+    store.close()
+
+
+def test_trim_old_segments(tmp_path: Path):
+    store = open_store(tmp_path, segment_size=100, keep_segments=2)
+    for i in range(20):
+        store.append(event(i))
+    assert len(store.segments) == 2
+    assert len(list(tmp_path.glob("*.seg"))) == 2
+    assert len(list(tmp_path.glob("*.ids"))) == 2
+    first = store.segments[0].base
+    assert store.find_seq("msg0") is None
+    assert store.replay()[0][0] == first
+    store.close()
+
+
+def test_flush_in_batches(tmp_path: Path):
+    store = open_store(tmp_path, flush_records=3)
+    path = store.segments[-1].path
+    store.append(event(0))
+    store.append(event(1))
+    assert path.stat().st_size == 0
+    # 回放前先刷新，未刷新的记录也能读到
+    assert len(store.replay()) == 2
+    size = path.stat().st_size
+    assert size > 0
+    for i in range(2, 5):
+        store.append(event(i))
+    assert path.stat().st_size > size
+    store.close()
+    store = open_store(tmp_path)
+    assert store.next_seq == 5
+    store.close()
+
+
+def test_trim_waits_for_replay(tmp_path: Path):
+    store = open_store(tmp_path, segment_size=100, keep_segments=2)
+    store.append(event(0))
+    first = store.segments[0]
+    readers = store._acquire()
+    for i in range(1, 10):
+        store.append(event(i))
+    assert first not in store.segments
+    assert first.path.exists()
+    store._release(readers)
+    assert not first.path.exists()
+    assert not first.ids_path.exists()
+    store.close()
@@ -0,0 +1,33 @@
+import asyncio
+
+from wechatferry_client.wechat import get_wechat
+from wechatferry_client.wechat.scheduled_send import run_action
+from wechatferry_client.wechat.wechat import WeChatManager
+
+
+def test_skip_account_not_ready(monkeypatch):
+    wechat = get_wechat()
+    calls = []
+
+    async def run_job(action: str, params: dict) -> None:
+        calls.append(action)
+
+    monkeypatch.setattr(wechat, "run_job", run_job)
+    monkeypatch.setattr(wechat, "stage", "loading")
+    asyncio.run(run_action("send_text", {}))
+    assert calls == []
+    monkeypatch.setattr(wechat, "stage", "ready")
+    asyncio.run(run_action("send_text", {}))
+    assert calls == ["send_text"]
+    asyncio.run(run_action("send_text", {}, "wxid_unknown"))
+    assert calls == ["send_text"]
+
+
+def test_add_job_rejects_bad_params():
+    wechat = WeChatManager()
+    res = wechat._add_job(
+        {"action": "send_text", "delay": 10, "params": {"txt": {"msg": "hello"}}}
+    )
+    assert (res.status, res.msg) == (500, "请求参数错误")
+    res = wechat._add_job({"action": "send_text", "delay": 10, "params": ["x"]})
+    assert (res.status, res.msg) == (500, "请求参数错误")
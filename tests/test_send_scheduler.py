@@ -0,0 +1,114 @@
+import asyncio
+import time
+from collections.abc import Iterator
+
+import pytest
+
+from benchmark.fake_wcf import FakeWcf
+from wechatferry_client.grpc import DispatcherBusy, DispatcherTimeout, GrpcManager
+from wechatferry_client.grpc.model import Functions, Request, TextMsg
+from wechatferry_client.wechat.send_scheduler import SendScheduler, TokenBucket
+
+
+@pytest.fixture
+def scheduler(fake_wcf: FakeWcf) -> Iterator[SendScheduler]:
+    grpc = GrpcManager()
+    grpc.api_socket.dial(fake_wcf.api_address)
+    scheduler = SendScheduler(grpc)
+    yield scheduler
+    scheduler.stop()
+    grpc.close()
+
+
+def send(receiver: str) -> Request:
+    return Request(
+        func=Functions.FUNC_SEND_TXT,
+        txt=TextMsg(msg="hello", receiver=receiver, aters=""),
+    )
+
+
+def test_higher_lane_first(fake_wcf: FakeWcf, scheduler: SendScheduler):
+    async def main():
+        fake_wcf.latency = 0.02
+        order = []
+
+        async def submit(name: str, lane: str) -> None:
+            await scheduler.submit(Request(func=Functions.FUNC_IS_LOGIN), lane)
+            order.append(name)
+
+        await asyncio.gather(
+            submit("query", "query"),
+            submit("bulk", "bulk"),
+            submit("interactive", "interactive"),
+        )
+        assert order == ["interactive", "bulk", "query"]
+        lanes = scheduler.stats()["lanes"]
+        assert all(lanes[lane]["served"] == 1 for lane in lanes)
+
+    asyncio.run(main())
+
+
+def test_receiver_rate_limit(scheduler: SendScheduler):
+    async def main():
+        scheduler.receiver_rate = 10
+        scheduler.receiver_burst = 1
+        start = time.monotonic()
+        await asyncio.gather(
+            *(scheduler.submit(send("a"), "bulk", receiver="a") for _ in range(3))
+        )
+        limited = time.monotonic() - start
+        start = time.monotonic()
+        await asyncio.gather(
+            *(scheduler.submit(send(r), "bulk", receiver=r) for r in "bcd")
+        )
+        unlimited = time.monotonic() - start
+        assert limited >= 0.18
+        assert unlimited < 0.1
+
+    asyncio.run(main())
+
+
+def test_global_rate_limit(scheduler: SendScheduler):
+    async def main():
+        scheduler.global_bucket = TokenBucket(10, 1)
+        start = time.monotonic()
+        await asyncio.gather(
+            *(scheduler.submit(send(r), "bulk", receiver=r) for r in "abc")
+        )
+        assert time.monotonic() - start >= 0.18
+        # 不是发送请求，不受限速影响
+        start = time.monotonic()
+        await scheduler.submit(Request(func=Functions.FUNC_IS_LOGIN), "query")
+        assert time.monotonic() - start < 0.05
+
+    asyncio.run(main())
+
+
+def test_lane_full(scheduler: SendScheduler):
+    async def main():
+        scheduler.lane_size = 1
+        scheduler.receiver_rate = 1
+        first = asyncio.create_task(scheduler.submit(send("a"), "bulk", receiver="a"))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(
+            scheduler.submit(send("a"), "bulk", receiver="a")
+        )
+        await asyncio.sleep(0.01)
+        with pytest.raises(DispatcherBusy):
+            await scheduler.submit(send("a"), "bulk", receiver="a")
+        await first
+        second.cancel()
+
+    asyncio.run(main())
+
+
+def test_lane_timeout_removes_job(scheduler: SendScheduler):
+    async def main():
+        scheduler.timeout = 0.1
+        scheduler.receiver_rate = 1
+        await scheduler.submit(send("a"), "bulk", receiver="a")
+        with pytest.raises(DispatcherTimeout, match="排队超时"):
+            await scheduler.submit(send("a"), "bulk", receiver="a")
+        assert scheduler.stats()["lanes"]["bulk"]["depth"] == 0
+
+    asyncio.run(main())
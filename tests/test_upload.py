@@ -0,0 +1,64 @@
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from wechatferry_client.config import Config
+from wechatferry_client.file_cache import FileCache
+from wechatferry_client.http import router
+from wechatferry_client.wechat import get_wechat
+
+
+@pytest.fixture
+def client(tmp_path: Path, monkeypatch) -> Iterator[TestClient]:
+    config = Config(cache_path=str(tmp_path), cache_max_file_size=1)
+    monkeypatch.setattr(get_wechat(), "file_cache", FileCache(config))
+    app = FastAPI()
+    app.include_router(router)
+    with TestClient(app) as client:
+        yield client
+
+
+def test_multipart_upload(client: TestClient):
+    res = client.post("/upload", files={"file": ("a.txt", b"hello")}).json()
+    assert res["status"] == 200
+    path = Path(res["data"]["path"])
+    assert path.name == "a.txt"
+    assert path.read_bytes() == b"hello"
+
+
+def test_multipart_name_field(client: TestClient):
+    res = client.post(
+        "/upload", files={"file": ("a.txt", b"hello")}, data={"name": "b.txt"}
+    ).json()
+    assert Path(res["data"]["path"]).name == "b.txt"
+    res = client.post(
+        "/upload?name=c.txt", files={"file": ("a.txt", b"hello")}, data={"name": "b"}
+    ).json()
+    assert Path(res["data"]["path"]).name == "c.txt"
+
+
+def test_multipart_missing_file(client: TestClient):
+    res = client.post("/upload", files={"other": ("a.txt", b"hello")}).json()
+    assert res["status"] == 405
+
+
+def test_raw_upload(client: TestClient):
+    res = client.post("/upload?name=a.bin", content=b"\x00\x01").json()
+    assert res["status"] == 200
+    assert Path(res["data"]["path"]).read_bytes() == b"\x00\x01"
+
+
+def test_too_large(client: TestClient, tmp_path: Path):
+    data = b"x" * (1024 * 1024 + 1)
+    assert client.post("/upload", files={"file": ("a", data)}).json()["status"] == 413
+
+    def chunks():
+        for _ in range(17):
+            yield b"x" * 65536
+
+    res = client.post("/upload?name=a", content=chunks()).json()
+    assert res["status"] == 413
+    assert list((tmp_path / "tmp").iterdir()) == []
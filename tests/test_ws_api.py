@@ -0,0 +1,37 @@
+import asyncio
+
+from wechatferry_client.http import ws_api
+from wechatferry_client.wechat import get_wechat
+from wechatferry_client.wechat.wechat import WeChatManager
+
+
+def names(wechat: WeChatManager) -> list[str]:
+    return [subscriber.name for subscriber in wechat.event_bus.subscribers]
+
+
+def test_import_does_not_subscribe():
+    assert "ws_api" not in names(get_wechat())
+
+
+def test_subscribe_every_bus_once():
+    primary = WeChatManager()
+    secondary = WeChatManager(event_bus=primary.event_bus)
+    other = WeChatManager()
+    ws_api.subscribe([primary, secondary, other])
+    assert names(primary).count("ws_api") == 1
+    assert names(other).count("ws_api") == 1
+
+
+def test_broadcast_to_outboxes():
+    async def main():
+        outbox: asyncio.Queue = asyncio.Queue(maxsize=1)
+        ws_api._outboxes.add(outbox)
+        try:
+            event = type("Event", (), {"json": lambda self, **_: "{}"})()
+            ws_api._broadcast(event)
+            ws_api._broadcast(event)
+        finally:
+            ws_api._outboxes.discard(outbox)
+        assert outbox.qsize() == 1
+
+    asyncio.run(main())
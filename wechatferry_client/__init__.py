@@ -1,52 +1,217 @@
+import asyncio
+import signal
+from pathlib import Path
+from typing import Optional, Union
+
 from fastapi import FastAPI
+from pynng import Pair0
 
-from wechatferry_client.cmd import install
-from wechatferry_client.config import Config, Env
+from wechatferry_client.cmd import ainstall, install, uninstall
+from wechatferry_client.com import HttpPostReporter, WsReverseClient
+from wechatferry_client.config import AccountConfig, Config, Env
 from wechatferry_client.driver import Driver
-from wechatferry_client.http import router
+from wechatferry_client.grpc.broker import Broker, broker_account, claim_slot
+from wechatferry_client.http import (
+    health_router,
+    metrics_router,
+    router,
+    ws_router,
+    ws_subscribe,
+)
 from wechatferry_client.log import default_filter, log_init, logger
-from wechatferry_client.wechat import get_wechat
+from wechatferry_client.scheduler import scheduler_init, scheduler_shutdown
+from wechatferry_client.timing import profiler
+from wechatferry_client.wechat import init_wechats, start_wechats
 
 _Driver: Driver = None
 """全局后端驱动器"""
 
+_Brokers: list[Broker] = []
+"""主进程中各账号的socket代理，只在 `workers` 大于1时使用"""
+
+_Slot: Optional[Pair0] = None
+"""工作进程编号的占位socket"""
+
+
+def _load_config() -> tuple[Env, Config]:
+    """读取设置并应用日志等级和分析设置"""
+    env = Env()
+    config = Config(_common_config=env.dict())
+    default_filter.level = config.log_level
+    profiler.init(config)
+    return env, config
+
 
 def init() -> None:
     """
-    初始化client
+    初始化client，`workers` 大于1时主进程只注入微信和启动broker，http由工作进程提供。
+    单进程运行时注入和连接后端都在http开启后的后台任务中进行。
     """
     global _Driver
 
-    env = Env()
-    config = Config(_common_config=env.dict())
-    default_filter.level = config.log_level
-    log_init(config.log_days)
+    env, config = _load_config()
+    log_init(config.log_days, config.log_max_size, config.log_compression)
     logger.info(f"Current <y><b>Env: {env.environment}</b></y>")
     logger.debug(f"Loaded <y><b>Config</b></y>: {str(config.dict())}")
 
-    logger.info("<y>正在注入微信进程...</y>")
-    if not install(cmd_path="./wcf.exe", debug=True):
-        logger.error("<r>注入微信失败...</r>")
-        exit(-1)
-    logger.success("<g>微信注入成功...</g>")
+    _Driver = Driver(config)
+    if config.workers > 1:
+        # broker需要在uvicorn启动工作进程前连上后端，这里同步注入
+        if config.inject:
+            logger.info("<y>正在注入微信进程...</y>")
+            if not install(cmd_path="./wcf.exe", debug=True):
+                logger.error("<r>注入微信失败...</r>")
+                exit(-1)
+            logger.success("<g>微信注入成功...</g>")
+        _start_brokers(config)
+        return
+    _setup(config)
+
+
+def _start_brokers(config: Config) -> None:
+    """为默认账号和 `accounts` 中的每个账号启动broker"""
+    backends = [
+        AccountConfig(api_address=config.api_address, msg_address=config.msg_address),
+        *config.accounts,
+    ]
+    for index, backend in enumerate(backends):
+        broker = Broker(config, backend, broker_account(config, index))
+        broker.start()
+        _Brokers.append(broker)
+
+
+def worker_app() -> FastAPI:
+    """
+    说明:
+        工作进程的app工厂，`workers` 大于1时由uvicorn在每个工作进程中调用。
+        消息存储、图片解密、上报和定时发送只在0号工作进程中运行，
+        发送限速按工作进程数均分。
 
+    返回:
+        * `FastAPI`：本进程的app
+    """
+    global _Driver, _Slot
+
+    _, config = _load_config()
+    slot, _Slot = claim_slot(config)
+    log_init(
+        config.log_days,
+        config.log_max_size,
+        config.log_compression,
+        Path("./logs") / f"worker{slot}",
+    )
+    update = {
+        "send_rate": config.send_rate / config.workers,
+        "send_receiver_rate": config.send_receiver_rate / config.workers,
+    }
+    if slot != 0:
+        update.update(
+            msg_store=False, image_decode=False, http_post_url="", ws_address=""
+        )
+    config = config.copy(update=update)
+    logger.info(f"<y>工作进程 {slot} 正在连接broker...</y>")
     _Driver = Driver(config)
-    _WeChat = get_wechat()
-    _WeChat.init(config)
+    _setup(config, slot)
+    return _Driver.server_app
+
+
+def _setup(config: Config, slot: Optional[int] = None) -> None:
+    """
+    说明:
+        初始化各账号并注册路由和启动、关闭任务。
+        http开启后在后台注入微信、并发启动各账号，就绪前 `/ready` 返回503。
+
+    参数:
+        * `config`：应用设置
+        * `slot`：工作进程编号，单进程运行时为空
+    """
+    wechats = init_wechats(config, broker=slot is not None)
+    _WeChat = wechats[0]
 
     app = _Driver.server_app
+    app.include_router(health_router)
+    app.include_router(ws_router)
+    app.include_router(metrics_router)
     app.include_router(router)
-    logger.success("<g>http api已开启...</g>")
-    _Driver.on_startup(_WeChat.connect_msg_socket)
-    _Driver.on_shutdown(_WeChat.close)
+    # 订阅在启动前注册，就绪前收到的消息不会漏掉；上报需要self_id，就绪后再开启
+    subscriber = None
+    if config.http_post_url:
+        subscriber = _WeChat.event_bus.subscribe(
+            "http_post", config.post_queue_size, "drop_newest"
+        )
+    ws_client = None
+    if config.ws_address:
+        ws_client = WsReverseClient(config, _WeChat)
+        _WeChat.on_event(ws_client.put, name="ws_reverse")
+    services: list[Union[HttpPostReporter, WsReverseClient]] = []
+    boot: Optional[asyncio.Task] = None
+
+    async def _boot() -> None:
+        if slot is None and config.inject:
+            logger.info("<y>正在注入微信进程...</y>")
+            if not await ainstall(cmd_path="./wcf.exe", debug=True):
+                logger.error("<r>注入微信失败...</r>")
+                signal.raise_signal(signal.SIGINT)
+                return
+            logger.success("<g>微信注入成功...</g>")
+        # 定时器不依赖账号就绪，先开启，未就绪账号的定时任务到期时跳过
+        scheduler_init(config, None if slot is None else slot == 0)
+        await start_wechats()
+        if subscriber is not None:
+            services.append(HttpPostReporter(config, subscriber, _WeChat.self_id))
+        if ws_client is not None:
+            services.append(ws_client)
+        for service in services:
+            await service.start()
+        logger.success("<g>所有账号已就绪...</g>")
+
+    async def _run_boot() -> None:
+        # 后台任务中的异常没有人等待，记录后退出，避免账号一直停在加载中
+        try:
+            await _boot()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.opt(colors=True, exception=e).error(f"<r>启动失败：{e}</r>")
+            signal.raise_signal(signal.SIGINT)
+
+    async def _start() -> None:
+        nonlocal boot
+        ws_subscribe(wechats)
+        boot = asyncio.create_task(_run_boot())
+        logger.success("<g>http api已开启...</g>")
+
+    async def _stop() -> None:
+        if boot is not None and not boot.done():
+            boot.cancel()
+        for service in services:
+            await service.stop()
+
+    _Driver.on_startup(_start)
+    _Driver.on_shutdown(_stop)
+    _Driver.on_shutdown(scheduler_shutdown)
+    _Driver.on_shutdown(_WeChat.file_cache.close)
+    for wechat in wechats:
+        _Driver.on_shutdown(wechat.close)
 
 
 def run() -> None:
     """
-    启动
+    启动，`workers` 大于1时以多进程启动uvicorn，退出后关闭broker
     """
-
-    _Driver.run()
+    config = _Driver.config
+    if config.workers <= 1:
+        _Driver.run()
+        return
+    try:
+        _Driver.run(
+            app="wechatferry_client:worker_app", factory=True, workers=config.workers
+        )
+    finally:
+        for broker in _Brokers:
+            broker.stop()
+        if config.inject:
+            uninstall("./wcf.exe")
 
 
 def get_driver() -> Driver:
@@ -2,5 +2,6 @@
 管理wcf的安装和卸载
 """
 
+from .cmd import ainstall as ainstall
 from .cmd import install as install
 from .cmd import uninstall as uninstall
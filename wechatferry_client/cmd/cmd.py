@@ -1,6 +1,7 @@
 """
 子进程运行wcf.exe
 """
+import asyncio
 import subprocess
 
 from wechatferry_client.log import logger
@@ -25,6 +26,25 @@ def install(cmd_path: str, debug: bool) -> bool:
     return child.returncode == 0
 
 
+async def ainstall(cmd_path: str, debug: bool) -> bool:
+    """
+    说明:
+        安装dll注入微信进程，异步版，等待期间事件循环可以处理其他请求
+
+    参数:
+        * `cmd_path`: wcf.exe路径
+        * `debug`: 是否开启wcf的debug日志
+
+    返回:
+        * `bool`: 是否注入成功
+    """
+    cmd = [cmd_path, "start"]
+    if debug:
+        cmd.append("debug")
+    child = await asyncio.create_subprocess_exec(*cmd)
+    return await child.wait() == 0
+
+
 def uninstall(cmd_path: str) -> None:
     """
     说明:
@@ -1,3 +1,5 @@
 """
 与其他客户端通信
 """
+from .http_post import HttpPostReporter as HttpPostReporter
+from .ws_reverse import WsReverseClient as WsReverseClient
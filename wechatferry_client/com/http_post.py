@@ -0,0 +1,154 @@
+"""
+http post事件上报
+"""
+import asyncio
+import random
+import time
+from typing import Optional
+
+import httpx
+
+from wechatferry_client.config import Config
+from wechatferry_client.event_bus import Subscriber
+from wechatferry_client.log import logger
+from wechatferry_client.model import MessageEvent
+
+POST_CONCURRENCY = 4
+"""同时进行的上报请求数，与连接池大小一致"""
+
+
+class HttpPostReporter:
+    """
+    http post上报器
+
+    直接消费事件总线中的订阅队列，由后台任务通过长连接池上报，上报再慢也不会阻塞消息接收。
+    `post_batch_size` 大于1时，攒够条数或等待超过 `post_batch_interval` 后以数组形式一起上报。
+    最多 `POST_CONCURRENCY` 个上报同时进行，并发时事件到达上报地址的顺序不保证与收到的顺序一致。
+    """
+
+    config: Config
+    """应用设置"""
+    url: str
+    """上报地址"""
+    subscriber: Subscriber[MessageEvent]
+    """事件订阅队列"""
+    headers: dict[str, str]
+    """上报请求头"""
+
+    def __init__(
+        self,
+        config: Config,
+        subscriber: Subscriber[MessageEvent],
+        self_id: Optional[str] = None,
+    ) -> None:
+        self.config = config
+        self.subscriber = subscriber
+        self.url = config.http_post_url
+        self.headers = {"Content-Type": "application/json"}
+        if self_id:
+            self.headers["X-self-ID"] = self_id
+        if config.access_token:
+            self.headers["access_token"] = config.access_token
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+        self._posts: set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        """
+        启动上报任务
+        """
+        self._client = httpx.AsyncClient(
+            timeout=self.config.post_timeout,
+            limits=httpx.Limits(
+                max_keepalive_connections=POST_CONCURRENCY,
+                max_connections=POST_CONCURRENCY,
+            ),
+        )
+        self._task = asyncio.create_task(self._run())
+        logger.success(f"<m>http_post</m> - <g>事件上报已开启：</g>{self.url}")
+
+    async def stop(self) -> None:
+        """
+        停止上报任务
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in self._posts:
+            task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _run(self) -> None:
+        """上报循环，并发数已满时不再取出事件，积压留在订阅队列中按溢出策略处理"""
+        slots = asyncio.Semaphore(POST_CONCURRENCY)
+        while True:
+            await slots.acquire()
+            try:
+                batch = await self._collect()
+                if len(batch) == 1 and self.config.post_batch_size <= 1:
+                    content = batch[0]
+                else:
+                    content = "[" + ",".join(batch) + "]"
+                task = asyncio.create_task(
+                    self._post(content.encode("utf-8"), len(batch))
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                slots.release()
+                logger.opt(colors=True, exception=e).error(
+                    f"<m>http_post</m> - <r>上报出错：{e}</r>"
+                )
+                continue
+            self._posts.add(task)
+            task.add_done_callback(self._posts.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+    async def _collect(self) -> list[str]:
+        """取出一批事件，攒够条数或超过等待时间即返回"""
+        event = await self.subscriber.get()
+        batch = [event.json(ensure_ascii=False)]
+        size = self.config.post_batch_size
+        if size <= 1:
+            return batch
+        deadline = time.monotonic() + self.config.post_batch_interval / 1000
+        while len(batch) < size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                event = await self.subscriber.get(remaining)
+            except asyncio.TimeoutError:
+                break
+            batch.append(event.json(ensure_ascii=False))
+        return batch
+
+    async def _post(self, content: bytes, count: int) -> None:
+        """上报一次，失败时按指数退避加随机抖动重试"""
+        retries = self.config.post_retries
+        for attempt in range(retries + 1):
+            try:
+                response = await self._client.post(
+                    self.url, content=content, headers=self.headers
+                )
+                if response.status_code < 500:
+                    if response.status_code >= 400:
+                        logger.error(
+                            f"<m>http_post</m> - <r>上报被拒绝：{response.status_code}</r>"
+                        )
+                    return
+                error = f"状态码 {response.status_code}"
+            except httpx.HTTPError as e:
+                error = repr(e)
+            except Exception as e:
+                # 地址无效等无法通过重试恢复的错误
+                logger.opt(colors=True, exception=e).error(
+                    f"<m>http_post</m> - <r>上报出错，丢弃 {count} 条事件：{e}</r>"
+                )
+                return
+            if attempt < retries:
+                delay = min(0.2 * 2**attempt, 5)
+                await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+        logger.error(f"<m>http_post</m> - <r>上报失败，丢弃 {count} 条事件：{error}</r>")
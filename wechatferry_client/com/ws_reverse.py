@@ -0,0 +1,155 @@
+"""
+反向websocket连接
+"""
+import asyncio
+import random
+from collections import deque
+from typing import Optional
+
+from pydantic.error_wrappers import ValidationError
+from websockets.asyncio.client import ClientConnection, connect
+from websockets.exceptions import ConnectionClosed
+
+from wechatferry_client.config import Config
+from wechatferry_client.log import logger
+from wechatferry_client.model import MessageEvent, WsRequest, WsResponse
+from wechatferry_client.wechat import WeChatManager, get_wechat, unknown_account
+
+
+class WsReverseClient:
+    """
+    反向websocket客户端
+
+    与 `ws_address` 保持一条长连接，推送事件并处理服务端发来的api请求。
+    断线期间事件存入环形缓冲区，满时按 `ws_overflow` 丢弃最旧或最新的事件，
+    重连时按指数退避等待。
+    """
+
+    config: Config
+    """应用设置"""
+    wechat: WeChatManager
+    """微信管理器"""
+    dropped: int
+    """缓冲区已满而丢弃的事件数"""
+
+    def __init__(self, config: Config, wechat: WeChatManager) -> None:
+        self.config = config
+        self.wechat = wechat
+        self.dropped = 0
+        self._events: deque[str] = deque()
+        # api响应只对当前连接有效，与事件缓冲区同样有界，满时丢弃最旧的响应
+        self._replies: deque[str] = deque(maxlen=config.ws_buffer_size)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def put(self, event: MessageEvent) -> None:
+        """
+        说明:
+            事件存入缓冲区，等待发送
+
+        参数:
+            * `event`：消息事件
+        """
+        if len(self._events) >= self.config.ws_buffer_size:
+            self.dropped += 1
+            if self.config.ws_overflow == "drop_newest":
+                return
+            self._events.popleft()
+        self._events.append(event.json(ensure_ascii=False))
+        self._wakeup.set()
+
+    async def start(self) -> None:
+        """
+        启动连接任务
+        """
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        停止连接任务
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        """连接循环，断线后指数退避重连"""
+        headers = {"X-self-ID": self.wechat.self_id}
+        if self.config.access_token:
+            headers["Authorization"] = f"Bearer {self.config.access_token}"
+        delay = self.config.ws_reconnect_interval
+        while True:
+            try:
+                async with connect(
+                    self.config.ws_address, additional_headers=headers
+                ) as websocket:
+                    logger.success(
+                        f"<m>ws_reverse</m> - <g>已连接：</g>{self.config.ws_address}"
+                    )
+                    delay = self.config.ws_reconnect_interval
+                    await self._serve(websocket)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"<m>ws_reverse</m> - <y>连接断开：{e}</y>")
+            if self.dropped:
+                logger.warning(f"<m>ws_reverse</m> - <y>累计丢弃 {self.dropped} 条事件</y>")
+            logger.info(f"<m>ws_reverse</m> - {delay:.1f}s 后重连...")
+            await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+            delay = min(delay * 2, self.config.ws_reconnect_max_interval)
+
+    async def _serve(self, websocket: ClientConnection) -> None:
+        """收发直到连接断开，上一条连接未发出的api响应不会发给新连接"""
+        self._replies.clear()
+        sender = asyncio.create_task(self._sender(websocket))
+        tasks: set[asyncio.Task] = set()
+        try:
+            async for text in websocket:
+                task = asyncio.create_task(self._handle(text))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except ConnectionClosed:
+            pass
+        finally:
+            sender.cancel()
+            for task in tasks:
+                task.cancel()
+        if sender.done() and not sender.cancelled() and sender.exception():
+            raise sender.exception()
+
+    async def _sender(self, websocket: ClientConnection) -> None:
+        """唯一的发送任务，优先发送api响应；事件发送成功后才移出缓冲区"""
+        while True:
+            if not self._replies and not self._events:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            if self._replies:
+                await websocket.send(self._replies.popleft())
+                continue
+            event = self._events[0]
+            await websocket.send(event)
+            # 发送期间可能被put丢弃
+            if self._events and self._events[0] is event:
+                self._events.popleft()
+
+    async def _handle(self, text: str) -> None:
+        """处理服务端发来的api请求"""
+        try:
+            request = WsRequest.parse_raw(text)
+        except ValidationError:
+            logger.error("<m>ws_reverse</m> - <r>请求参数不正确!</r>")
+            response = WsResponse(status=405, msg="请求参数不正确！", data={}, echo="")
+        else:
+            response = await self._route(request)
+        self._replies.append(response.json(ensure_ascii=False))
+        self._wakeup.set()
+
+    async def _route(self, request: WsRequest) -> WsResponse:
+        """按请求中的 `self_id` 选择账号，为空则由本连接的账号处理"""
+        if not request.self_id or request.self_id == self.wechat.self_id:
+            return await self.wechat.handle_ws_api(request)
+        wechat_client = get_wechat(request.self_id)
+        if wechat_client is None:
+            status, msg = unknown_account()
+            return WsResponse(status=status, msg=msg, data={}, echo=request.echo)
+        return await wechat_client.handle_ws_api(request)
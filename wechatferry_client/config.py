@@ -3,9 +3,18 @@
 """
 import os
 from ipaddress import IPv4Address
-from typing import TYPE_CHECKING, Any, Mapping, Optional, Set, Tuple, Union
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Literal,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
-from pydantic import BaseSettings, Extra, IPvAnyAddress
+from pydantic import BaseModel, BaseSettings, Extra, IPvAnyAddress
 from pydantic.env_settings import (
     EnvSettingsSource,
     InitSettingsSource,
@@ -143,34 +152,95 @@ class Env(BaseConfig):
         env_file = ".env"
 
 
+class AccountConfig(BaseModel):
+    """单个微信后端的连接设置"""
+
+    api_address: str = "tcp://127.0.0.1:10086"
+    """api socket地址"""
+    msg_address: str = "tcp://127.0.0.1:10087"
+    """消息socket地址"""
+    inject: bool = False
+    """退出时是否通过wcf.exe卸载注入，只有默认账号由本程序注入"""
+    broker: bool = False
+    """是否经由主进程的broker连接，为真时消息socket改为订阅，由程序设置"""
+
+
 class Config(BaseConfig):
     """主要配置"""
 
     _env_file: str = ".env"
     smart: bool = True
     """是否注入当前wechat"""
+    inject: bool = True
+    """是否通过wcf.exe注入微信，关闭时直接连接已在运行的后端，如 `benchmark.fake_wcf`"""
+    api_address: str = "tcp://127.0.0.1:10086"
+    """默认账号的api socket地址"""
+    msg_address: str = "tcp://127.0.0.1:10087"
+    """默认账号的消息socket地址"""
+    accounts: list[AccountConfig] = []
+    """其他账号的后端，需要已在运行，api请求通过 `X-self-ID` 请求头或路径选择账号"""
     host: IPvAnyAddress = IPv4Address("127.0.0.1")
     """http服务地址"""
     port: int = 8000
     """http服务端口"""
+    workers: int = 1
+    """http工作进程数，大于1时由主进程独占后端socket，工作进程经由broker转发请求"""
+    broker_address: str = "ipc://wcf_broker"
+    """broker的ipc地址前缀，各账号和工作进程的地址在其后追加后缀"""
     http_post_url: str = ""
     """http post上报地址，如果不填则不上报"""
+    post_queue_size: int = 1024
+    """http post上报队列长度，超出时丢弃事件"""
+    post_batch_size: int = 1
+    """http post每次上报的最大事件数，大于1时以数组形式上报"""
+    post_batch_interval: int = 50
+    """http post攒批的最长等待时间(ms)"""
+    post_retries: int = 3
+    """http post上报失败的重试次数"""
+    post_timeout: float = 5
+    """http post上报超时时间(s)"""
     ws_address: str = ""
     """反向ws连接地址，如果不填则不会连接ws"""
+    ws_buffer_size: int = 1024
+    """反向ws断线期间缓存的事件数"""
+    ws_overflow: Literal["drop_oldest", "drop_newest"] = "drop_oldest"
+    """反向ws缓存已满时丢弃最旧还是最新的事件"""
+    ws_reconnect_interval: float = 1
+    """反向ws首次重连等待时间(s)，之后每次翻倍"""
+    ws_reconnect_max_interval: float = 60
+    """反向ws最长重连等待时间(s)"""
     access_token: str = ""
     """密钥"""
     log_level: Union[int, str] = "INFO"
     """默认日志等级"""
     log_days: int = 10
     """日志保存天数"""
-    msg_filter: Set[int] = {}
+    log_max_size: int = 0
+    """单个日志文件大小上限(MB)，为0则只按天轮转"""
+    log_compression: bool = False
+    """是否gzip压缩按大小轮转出的日志文件"""
+    msg_filter: Set[int] = set()
     """事件过滤列表"""
     report_self: bool = False
     """是否上报自身消息"""
+    room_allow: Set[str] = set()
+    """群白名单，不为空时只上报这些群的消息"""
+    room_deny: Set[str] = set()
+    """群黑名单，这些群的消息不会上报"""
+    sender_allow: Set[str] = set()
+    """发送者白名单，不为空时只上报这些人的消息"""
+    sender_deny: Set[str] = set()
+    """发送者黑名单，这些人的消息不会上报"""
     cache_path: str = "./file_cache"
     """文件缓存目录"""
     cache_days: int = 3
-    """文件缓存天数"""
+    """文件缓存天数，为0则不清理缓存"""
+    cache_max_file_size: int = 100
+    """缓存单个文件的大小上限(MB)"""
+    image_decode: bool = False
+    """是否解密图片消息，解密后的路径随事件上报"""
+    image_workers: int = 2
+    """解密图片的进程数"""
     image_path: str = "./image_decode"
     """聊天图片解密地址"""
     image_days: int = 0
@@ -179,6 +249,69 @@ class Config(BaseConfig):
     """下载pc图片超时时间(s)，超时的图片不会解密"""
     timeout_image_send: bool = False
     """超时的图片消息是否继续发送"""
+    api_queue_size: int = 256
+    """api请求最大排队数，超出时直接返回503"""
+    api_timeout: float = 2
+    """api请求截止时间(s)，包含排队时间"""
+    api_timeout_factor: float = 3
+    """按各请求最近p99耗时的倍数设定响应超时，上限为 `api_timeout`，为0则固定使用 `api_timeout`。
+
+    发送消息等有副作用的请求总是使用 `api_timeout`。
+    """
+    api_timeout_min: float = 0.2
+    """自适应响应超时的下限(s)"""
+    breaker_threshold: int = 5
+    """后端连续无响应多少次后熔断，熔断期间请求直接返回503，为0则不熔断"""
+    breaker_cooldown: float = 5
+    """熔断后每隔多久放行一个试探请求(s)"""
+    batch_max_size: int = 100
+    """批量请求最多包含的请求数"""
+    send_rate: float = 0
+    """全局发送速率(条/s)，为0则不限速"""
+    send_burst: int = 10
+    """全局允许连续发送的条数"""
+    send_receiver_rate: float = 0
+    """每个接收人的发送速率(条/s)，为0则不限速"""
+    send_receiver_burst: int = 3
+    """每个接收人允许连续发送的条数"""
+    send_lane_size: int = 256
+    """每个优先级通道的最大排队数，超出时直接返回503"""
+    send_inflight: int = 1
+    """同时交给api调度器的请求数，越小优先级越严格"""
+    job_store_path: str = "./jobs.sqlite"
+    """定时任务数据库路径"""
+    job_misfire_grace_time: int = 60
+    """定时任务错过执行时间后仍然执行的宽限时间(s)，超出则跳过"""
+    job_coalesce: bool = True
+    """定时任务多次错过执行时是否只补执行一次"""
+    event_queue_size: int = 1024
+    """事件总线中每个订阅者的默认队列长度"""
+    ws_queue_size: int = 1024
+    """每个websocket连接的待发送队列长度，事件超出时丢弃"""
+    contact_refresh_interval: int = 300
+    """联系人缓存刷新间隔(s)，为0则不自动刷新"""
+    msg_store: bool = False
+    """是否将收到的消息写入本地消息存储，用于断线后回放"""
+    msg_store_path: str = "./msg_store"
+    """消息存储目录"""
+    msg_store_segment_size: int = 64 * 1024 * 1024
+    """单个段文件大小上限(字节)，超出后切换新段"""
+    msg_store_keep_segments: int = 16
+    """保留的段文件数，超出时删除最旧的段"""
+    msg_store_index_interval: int = 64
+    """每多少条消息记录一个索引项"""
+    msg_store_replay_limit: int = 1000
+    """单次回放最多返回的消息数，请求中的 `limit` 超出时按该值截断"""
+    msg_store_flush_records: int = 256
+    """写入多少条消息后刷新到磁盘，未达到时按 `msg_store_flush_interval` 定时刷新"""
+    msg_store_flush_interval: float = 1
+    """定时刷新到磁盘的间隔(s)，进程崩溃时最多丢失这段时间内的消息"""
+    profile_rate: float = 0
+    """http api请求开启cProfile的抽样比例，为0则关闭"""
+    profile_threshold: float = 1
+    """耗时超过该值(s)的抽样请求会写入分析结果"""
+    profile_path: str = "./profile"
+    """分析结果保存目录"""
 
     class Config:
         extra = "allow"
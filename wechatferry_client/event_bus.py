@@ -0,0 +1,205 @@
+"""
+事件总线模块，消息接收循环只负责发布，每个订阅者拥有独立的有界队列
+"""
+import asyncio
+import inspect
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Generic, Literal, Optional, TypeVar, Union
+
+from .log import logger
+
+T = TypeVar("T")
+
+Overflow = Literal["drop_oldest", "drop_newest"]
+"""队列已满时的处理策略"""
+
+
+class Subscriber(Generic[T]):
+    """
+    订阅者，持有独立的有界队列和积压统计
+    """
+
+    name: str
+    """订阅者名称"""
+    maxsize: int
+    """队列长度"""
+    overflow: Overflow
+    """队列已满时丢弃最旧还是最新的事件"""
+    received: int
+    """收到的事件数"""
+    delivered: int
+    """已取出的事件数"""
+    dropped: int
+    """丢弃的事件数"""
+    max_depth: int
+    """历史最大积压"""
+
+    def __init__(self, name: str, maxsize: int, overflow: Overflow) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self._queue: deque[tuple[float, T]] = deque()
+        self._wakeup = asyncio.Event()
+
+    @property
+    def depth(self) -> int:
+        """当前积压"""
+        return len(self._queue)
+
+    @property
+    def lag(self) -> float:
+        """最早未处理事件的等待时间(s)"""
+        if not self._queue:
+            return 0.0
+        return time.monotonic() - self._queue[0][0]
+
+    def put(self, event: T) -> None:
+        """事件入队，不会阻塞"""
+        self.received += 1
+        if len(self._queue) >= self.maxsize:
+            self.dropped += 1
+            if self.overflow == "drop_newest":
+                return
+            self._queue.popleft()
+        self._queue.append((time.monotonic(), event))
+        if len(self._queue) > self.max_depth:
+            self.max_depth = len(self._queue)
+        self._wakeup.set()
+
+    async def get(self, timeout: Optional[float] = None) -> T:
+        """取出一个事件，队列为空时等待，超时抛出 `asyncio.TimeoutError`"""
+        while not self._queue:
+            self._wakeup.clear()
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        self.delivered += 1
+        return self._queue.popleft()[1]
+
+    def stats(self) -> dict[str, Any]:
+        """统计信息"""
+        return {
+            "name": self.name,
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "lag": round(self.lag, 6),
+            "received": self.received,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+
+class EventBus(Generic[T]):
+    """
+    事件总线
+
+    `publish` 只做入队，处理函数在各自的消费任务中执行，慢的订阅者只会积压或丢弃自己的事件。
+    """
+
+    maxsize: int
+    """默认队列长度"""
+    subscribers: list[Subscriber[T]]
+    """所有订阅者"""
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        self.maxsize = maxsize
+        self.subscribers = []
+        self._consumers: list[tuple[Subscriber[T], Callable]] = []
+        self._tasks: list[asyncio.Task] = []
+        self._running = False
+
+    def set_maxsize(self, maxsize: int) -> None:
+        """修改默认队列长度，使用默认值的订阅者一并修改"""
+        for subscriber in self.subscribers:
+            if subscriber.maxsize == self.maxsize:
+                subscriber.maxsize = maxsize
+        self.maxsize = maxsize
+
+    def subscribe(
+        self,
+        name: str,
+        maxsize: Optional[int] = None,
+        overflow: Overflow = "drop_oldest",
+    ) -> Subscriber[T]:
+        """
+        说明:
+            创建订阅者，需要自行调用 `get` 取出事件
+
+        参数:
+            * `name`：订阅者名称
+            * `maxsize`：队列长度，为空则使用默认值
+            * `overflow`：队列已满时的处理策略
+        """
+        subscriber = Subscriber(name, maxsize or self.maxsize, overflow)
+        self.subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber[T]) -> None:
+        """取消订阅"""
+        if subscriber in self.subscribers:
+            self.subscribers.remove(subscriber)
+
+    def consume(
+        self,
+        name: str,
+        handler: Callable[[T], Union[None, Awaitable[None]]],
+        maxsize: Optional[int] = None,
+        overflow: Overflow = "drop_oldest",
+    ) -> Subscriber[T]:
+        """
+        说明:
+            创建订阅者，并在独立的任务中逐个调用处理函数
+
+        参数:
+            * `name`：订阅者名称
+            * `handler`：处理函数，可以是同步或异步函数
+            * `maxsize`：队列长度，为空则使用默认值
+            * `overflow`：队列已满时的处理策略
+        """
+        subscriber = self.subscribe(name, maxsize, overflow)
+        self._consumers.append((subscriber, handler))
+        if self._running:
+            self._tasks.append(asyncio.create_task(self._consume(subscriber, handler)))
+        return subscriber
+
+    def publish(self, event: T) -> None:
+        """发布事件，不会阻塞"""
+        for subscriber in self.subscribers:
+            subscriber.put(event)
+
+    def start(self) -> None:
+        """
+        启动所有消费任务，需要在事件循环中调用
+        """
+        if self._running:
+            return
+        self._running = True
+        for subscriber, handler in self._consumers:
+            self._tasks.append(asyncio.create_task(self._consume(subscriber, handler)))
+
+    def stop(self) -> None:
+        """停止所有消费任务"""
+        self._running = False
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
+
+    def stats(self) -> list[dict[str, Any]]:
+        """所有订阅者的统计信息"""
+        return [subscriber.stats() for subscriber in self.subscribers]
+
+    async def _consume(self, subscriber: Subscriber[T], handler: Callable) -> None:
+        """消费循环，处理函数出错不会中断"""
+        is_async = inspect.iscoroutinefunction(handler)
+        while True:
+            event = await subscriber.get()
+            try:
+                if is_async:
+                    await handler(event)
+                else:
+                    handler(event)
+            except Exception as e:
+                logger.error(f"<m>event_bus</m> - <r>{subscriber.name} 处理事件出错：{e}</r>")
@@ -0,0 +1,223 @@
+"""
+文件缓存模块，将url、base64或上传的文件按内容哈希存放在 `cache_path` 下，供发送图片和文件使用
+
+目录结构为 `cache_path/哈希前两位/哈希/文件名`，相同内容相同文件名只保存一份。
+"""
+import asyncio
+import base64
+import hashlib
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Callable, Iterable, Optional, Union
+from urllib.parse import unquote, urlsplit
+
+import httpx
+
+from .config import Config
+from .log import logger
+
+CHUNK_SIZE = 64 * 1024
+"""读写块大小"""
+SHARDS_PER_RUN = 16
+"""每次清理处理的分片目录数，共256个分片"""
+
+
+class FileTooLarge(Exception):
+    """文件超过大小上限"""
+
+
+class FileCache:
+    """
+    文件缓存
+
+    写入时边写边计算sha256，完成后再移动到以哈希命名的目录，已存在则直接复用。
+    过期清理按分片目录轮转，每次只处理一部分，不会一次扫描整个缓存目录。
+    """
+
+    path: Path
+    """缓存目录，绝对路径"""
+    days: int
+    """缓存天数，为0则不清理"""
+    max_size: int
+    """单个文件大小上限(字节)"""
+
+    def __init__(self, config: Config) -> None:
+        self.path = Path(config.cache_path).resolve()
+        self.days = config.cache_days
+        self.max_size = config.cache_max_file_size * 1024 * 1024
+        self._client: Optional[httpx.AsyncClient] = None
+        self._urls: OrderedDict[str, Path] = OrderedDict()
+        self._next_shard = 0
+
+    async def close(self) -> None:
+        """关闭下载连接池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def save_url(self, url: str, name: Optional[str] = None) -> Path:
+        """
+        说明:
+            下载url到缓存，同一url已缓存且文件仍存在时不会重复下载
+
+        参数:
+            * `url`：文件地址
+            * `name`：文件名，为空则从url中获取
+
+        返回:
+            * `Path`：缓存文件路径
+        """
+        key = f"{url}\0{name or ''}"
+        path = self._urls.get(key)
+        if path is not None and path.exists():
+            self._urls.move_to_end(key)
+            self._touch(path)
+            return path
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=30, follow_redirects=True)
+        async with self._client.stream("GET", url) as response:
+            response.raise_for_status()
+            name = name or unquote(Path(urlsplit(url).path).name)
+            path = await self._save(response.aiter_bytes(CHUNK_SIZE), name)
+        self._urls[key] = path
+        if len(self._urls) > 1024:
+            self._urls.popitem(last=False)
+        return path
+
+    async def save_base64(self, data: str, name: Optional[str] = None) -> Path:
+        """
+        说明:
+            base64数据存入缓存，可带 `base64://` 前缀
+
+        参数:
+            * `data`：base64数据
+            * `name`：文件名
+        """
+        if data.startswith("base64://"):
+            data = data[len("base64://") :]
+        content = await asyncio.to_thread(base64.b64decode, data, validate=True)
+
+        async def chunks() -> AsyncIterator[bytes]:
+            yield content
+
+        return await self._save(chunks(), name)
+
+    async def save_stream(
+        self,
+        chunks: AsyncIterator[bytes],
+        name: Union[str, None, Callable[[], Optional[str]]] = None,
+    ) -> Path:
+        """
+        说明:
+            数据流存入缓存，用于上传的文件，超过大小上限时立即停止读取
+
+        参数:
+            * `chunks`：数据块
+            * `name`：文件名，数据流读完才能确定文件名时传入返回文件名的函数
+        """
+        return await self._save(chunks, name)
+
+    async def _save(
+        self,
+        chunks: AsyncIterator[bytes],
+        name: Union[str, None, Callable[[], Optional[str]]],
+    ) -> Path:
+        """边写临时文件边计算哈希，完成后移动到哈希目录，文件操作都在线程中进行"""
+        tmp_dir = self.path / "tmp"
+        await asyncio.to_thread(tmp_dir.mkdir, parents=True, exist_ok=True)
+        tmp = tmp_dir / uuid.uuid4().hex
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            f = await asyncio.to_thread(open, tmp, "wb")
+            try:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_size:
+                        raise FileTooLarge(f"文件超过大小上限：{self.max_size} 字节")
+                    await asyncio.to_thread(_write, f, digest, chunk)
+            finally:
+                await asyncio.to_thread(f.close)
+            if callable(name):
+                name = name()
+            return await asyncio.to_thread(self._commit, tmp, digest.hexdigest(), name)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+
+    def _commit(self, tmp: Path, content_hash: str, name: Optional[str]) -> Path:
+        """临时文件移动到哈希目录，已存在相同文件时删除临时文件并复用"""
+        target_dir = self.path / content_hash[:2] / content_hash
+        target = target_dir / _safe_name(name, content_hash)
+        if target.exists():
+            tmp.unlink()
+            self._touch(target)
+            logger.debug(f"<m>file_cache</m> - 命中缓存：{target}")
+            return target
+        target_dir.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp, target)
+        logger.debug(f"<m>file_cache</m> - 已缓存：{target}")
+        return target
+
+    def _touch(self, path: Path) -> None:
+        """复用时刷新修改时间，推迟过期"""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    async def cleanup(self) -> None:
+        """
+        说明:
+            清理一部分分片中过期的文件，由定时器周期调用
+        """
+        if self.days <= 0:
+            return
+        shards = [
+            f"{i:02x}"
+            for i in range(self._next_shard, self._next_shard + SHARDS_PER_RUN)
+        ]
+        self._next_shard = (self._next_shard + SHARDS_PER_RUN) % 256
+        removed = await asyncio.to_thread(self._cleanup_shards, shards)
+        if removed:
+            logger.info(f"<m>file_cache</m> - 已清理 {removed} 个过期文件")
+
+    def _cleanup_shards(self, shards: Iterable[str]) -> int:
+        """删除分片中过期的文件和空目录，同时清理残留的临时文件"""
+        expire = time.time() - self.days * 86400
+        removed = 0
+        dirs = [self.path / shard for shard in shards]
+        dirs.append(self.path / "tmp")
+        for shard in dirs:
+            if not shard.is_dir():
+                continue
+            for file in shard.rglob("*"):
+                try:
+                    if file.is_file() and file.stat().st_mtime < expire:
+                        file.unlink()
+                        removed += 1
+                except OSError:
+                    continue
+            for folder in sorted(shard.glob("*"), reverse=True):
+                try:
+                    folder.rmdir()
+                except OSError:
+                    pass
+        return removed
+
+
+def _write(f: BinaryIO, digest: "hashlib._Hash", chunk: bytes) -> None:
+    """写入一块数据并更新哈希"""
+    digest.update(chunk)
+    f.write(chunk)
+
+
+def _safe_name(name: Optional[str], content_hash: str) -> str:
+    """去掉路径和非法字符，为空时使用哈希"""
+    if name:
+        name = re.sub(r'[\\/:*?"<>|\x00-\x1f]', "_", Path(name).name).strip(" .")
+    return name or content_hash[:16]
@@ -1,6 +1,10 @@
 """
 使用gRPC与微信客户端通信
 """
+from .broker import Broker as Broker
+from .dispatcher import DispatcherBusy as DispatcherBusy
+from .dispatcher import DispatcherTimeout as DispatcherTimeout
+from .dispatcher import DispatcherUnavailable as DispatcherUnavailable
 from .grpc import GrpcManager as GrpcManager
 from .model import Request as Request
 from .model import Response as Response
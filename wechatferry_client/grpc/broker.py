@@ -0,0 +1,218 @@
+"""
+socket代理，http工作进程有多个时由主进程独占后端socket
+
+dll只接受一个客户端，所以主进程为每个账号启动一个broker，
+在后台线程的事件循环里持有api和消息socket。
+工作进程的api请求经由多对一的 `Pair1` 进入同一个调度器，回复按来源pipe送回，
+调度器出错时回复约定的状态码；
+消息原样转发到 `Pub0`，每个工作进程都订阅全部消息，自行过滤和解析。
+"""
+import asyncio
+import threading
+from typing import Optional
+
+from google.protobuf.message import Message
+from pynng import Message as NngMessage
+from pynng import Pair0, Pair1, Pub0
+from pynng.exceptions import AddressInUse, Closed, NNGException, Timeout
+
+from wechatferry_client.config import AccountConfig, Config
+from wechatferry_client.log import logger
+from wechatferry_client.metrics import nng_errors
+
+from . import wcf_pb2
+from .dispatcher import error_status
+from .grpc import RECONNECT_MAX, RECONNECT_MIN, GrpcManager
+from .model import Functions
+
+
+def broker_account(config: Config, index: int) -> AccountConfig:
+    """
+    说明:
+        工作进程连接第 `index` 个账号的broker时使用的设置
+
+    参数:
+        * `config`：应用设置
+        * `index`：账号序号，0为默认账号，其余为 `accounts` 中的顺序加1
+    """
+    prefix = f"{config.broker_address}_{index}"
+    return AccountConfig(
+        api_address=f"{prefix}_api", msg_address=f"{prefix}_msg", broker=True
+    )
+
+
+def claim_slot(config: Config) -> tuple[int, Pair0]:
+    """
+    说明:
+        工作进程占用一个编号，编号0的进程负责只能运行一份的任务。
+        编号通过监听ipc地址互斥，进程退出后地址释放，重启的工作进程可以接替。
+
+    返回:
+        * `int`：编号
+        * `Pair0`：占位socket，进程退出前需要保持打开
+
+    异常:
+        * `RuntimeError`：编号已全部被占用
+    """
+    for slot in range(config.workers):
+        socket = Pair0()
+        try:
+            socket.listen(f"{config.broker_address}_worker_{slot}")
+        except AddressInUse:
+            socket.close()
+            continue
+        return slot, socket
+    raise RuntimeError("没有空闲的工作进程编号")
+
+
+class _RawRequest:
+    """工作进程发来的已序列化请求，由调度器原样发送"""
+
+    __slots__ = ("func", "data")
+
+    def __init__(self, func: Functions, data: bytes) -> None:
+        self.func = func
+        self.data = data
+
+    def get_request_data(self) -> bytes:
+        return self.data
+
+
+class Broker:
+    """
+    单个账号的socket代理
+
+    开启接收消息只在第一个工作进程请求时转发给后端，之后由broker直接应答，
+    后端重连后由 `GrpcManager` 重新开启；关闭接收消息的请求不会转发，
+    避免一个工作进程退出时影响其他进程。
+    """
+
+    config: Config
+    """应用设置"""
+    backend: AccountConfig
+    """后端的连接设置"""
+    frontend: AccountConfig
+    """工作进程连接broker的设置"""
+    grpc: GrpcManager
+    """持有后端socket的grpc管理"""
+
+    def __init__(
+        self, config: Config, backend: AccountConfig, frontend: AccountConfig
+    ) -> None:
+        self.config = config
+        self.backend = backend
+        self.frontend = frontend
+        self.grpc = GrpcManager()
+        self.api_socket = Pair1(polyamorous=True, send_timeout=2000)
+        self.pub_socket = Pub0()
+        self._receiving = False
+        self._lock: Optional[asyncio.Lock] = None
+        self._tasks: set[asyncio.Task] = set()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """
+        在后台线程中连接后端并开始转发，需要在uvicorn.run之前执行
+        """
+        self.grpc.init(self.config, self.backend)
+        self.api_socket.listen(self.frontend.api_address)
+        self.pub_socket.listen(self.frontend.msg_address)
+        self._thread = threading.Thread(
+            target=asyncio.run,
+            args=(self._run(),),
+            name=f"broker_{self.frontend.api_address}",
+            daemon=True,
+        )
+        self._thread.start()
+        logger.success(f"<g>broker已开启：{self.frontend.api_address}</g>")
+
+    def stop(self) -> None:
+        """
+        关闭前端socket，后台线程关闭其余socket后退出
+        """
+        self.api_socket.close()
+        if self._thread is not None:
+            self._thread.join(5)
+            self._thread = None
+
+    async def _run(self) -> None:
+        """后台线程的主任务，前端socket关闭时返回"""
+        self._lock = asyncio.Lock()
+        try:
+            await self.grpc.connect()
+            while True:
+                try:
+                    msg = await self.api_socket.arecv_msg()
+                except Closed:
+                    return
+                except NNGException as e:
+                    nng_errors.inc("broker", "error")
+                    logger.error(f"<r>broker接收请求出错:{e}</r>")
+                    continue
+                task = asyncio.create_task(self._reply(msg))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        finally:
+            self.pub_socket.close()
+            self.grpc.close()
+
+    async def _reply(self, msg: NngMessage) -> None:
+        """转发一个请求，调度器出错时回复对应的状态码，由工作进程还原为异常"""
+        req: Message = wcf_pb2.Request()
+        try:
+            req.ParseFromString(msg.bytes)
+            func = Functions(req.func)
+        except Exception as e:
+            logger.warning(f"<m>broker</m> - <y>无法解析的请求：{e}</y>")
+            return
+        try:
+            if func == Functions.FUNC_ENABLE_RECV_TXT:
+                rsp = await self._enable_receiving()
+            elif func == Functions.FUNC_DISABLE_RECV_TXT:
+                rsp = wcf_pb2.Response(func=func, status=0)
+            else:
+                rsp = await self.grpc.dispatcher.submit(
+                    _RawRequest(func, msg.bytes), raw=True
+                )
+        except Closed:
+            return
+        except Exception as e:
+            logger.warning(f"<m>broker</m> - <y>请求未完成：{e}</y>")
+            rsp = wcf_pb2.Response(func=func, status=error_status(e))
+        try:
+            await msg.pipe.asend(rsp.SerializeToString())
+        except NNGException:
+            logger.debug("<y>工作进程已断开，丢弃回复...</y>")
+
+    async def _enable_receiving(self) -> Message:
+        """第一次请求时开启接收消息并连接消息socket，之后直接应答"""
+        async with self._lock:
+            if not self._receiving:
+                if not await self.grpc.enable_receiving_msg():
+                    return wcf_pb2.Response(
+                        func=Functions.FUNC_ENABLE_RECV_TXT, status=-1
+                    )
+                self.grpc.msg_socket.dial(self.backend.msg_address, block=False)
+                self._receiving = True
+                task = asyncio.create_task(self._forward())
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        return wcf_pb2.Response(func=Functions.FUNC_ENABLE_RECV_TXT, status=0)
+
+    async def _forward(self) -> None:
+        """把后端推送的消息原样发布给所有工作进程，连接出错时按退避间隔等待后继续"""
+        delay = RECONNECT_MIN
+        while True:
+            try:
+                msg = await self.grpc.msg_socket.arecv_msg()
+                await self.pub_socket.asend(msg.bytes)
+                delay = RECONNECT_MIN
+            except Timeout:
+                continue
+            except Closed:
+                return
+            except NNGException as e:
+                nng_errors.inc("msg", "error")
+                logger.error(f"<r>broker转发消息出错:{e}，{delay}s后重试...</r>")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX)
@@ -0,0 +1,171 @@
+"""
+protobuf与模型之间的直接转换，按属性读写，只处理实际设置的oneof字段
+
+dll返回的数据类型已经由protobuf保证，这里使用 `construct` 跳过pydantic校验。
+"""
+import base64
+import json
+from typing import Callable, Iterator
+
+from google.protobuf.message import Message
+from pydantic import BaseModel
+
+from . import wcf_pb2
+from .model import (
+    DbField,
+    DbNames,
+    DbRow,
+    DbRows,
+    DbTable,
+    DbTables,
+    Functions,
+    MsgTypes,
+    Request,
+    Response,
+    RpcContact,
+    RpcContacts,
+    WxMsg,
+)
+
+REQUEST_ONEOF = ("empty", "str", "txt", "file", "query", "v", "m", "xml")
+"""Request中msg的所有字段"""
+
+
+def encode_request(request: Request) -> bytes:
+    """
+    说明:
+        将请求模型编码为protobuf数据
+
+    参数:
+        * `request`：请求模型
+
+    返回:
+        * `bytes`：序列化后的 `wcf_pb2.Request`
+    """
+    pb: Message = wcf_pb2.Request(func=request.func)
+    for name in REQUEST_ONEOF:
+        value = getattr(request, name)
+        if value is None:
+            continue
+        if isinstance(value, BaseModel):
+            sub = getattr(pb, name)
+            sub.SetInParent()
+            for key, item in value:
+                setattr(sub, key, item)
+        else:
+            setattr(pb, name, value)
+        break
+    return pb.SerializeToString()
+
+
+def decode_wxmsg(v: Message) -> WxMsg:
+    """解析 `wcf_pb2.WxMsg`"""
+    return WxMsg.construct(
+        is_self=v.is_self,
+        is_group=v.is_group,
+        type=v.type,
+        id=v.id,
+        xml=v.xml,
+        sender=v.sender,
+        roomid=v.roomid,
+        content=v.content,
+    )
+
+
+def decode_contact(v: Message) -> RpcContact:
+    """解析 `wcf_pb2.RpcContact`"""
+    return RpcContact.construct(
+        wxid=v.wxid,
+        code=v.code,
+        name=v.name,
+        country=v.country,
+        province=v.province,
+        city=v.city,
+        gender=v.gender,
+    )
+
+
+def decode_field(v: Message) -> DbField:
+    """解析 `wcf_pb2.DbField`，content保持base64编码，与json序列化结果一致"""
+    return DbField.construct(
+        type=v.type,
+        column=v.column,
+        content=base64.b64encode(v.content),
+    )
+
+
+def decode_row(v: Message) -> DbRow:
+    """解析 `wcf_pb2.DbRow`"""
+    return DbRow.construct(fields=[decode_field(f) for f in v.fields])
+
+
+_DECODERS: dict[str, tuple[str, Callable[[Message], object]]] = {
+    "status": ("status", int),
+    "str": ("string", str),
+    "wxmsg": ("wxmsg", decode_wxmsg),
+    "types": ("types", lambda v: MsgTypes.construct(MsgTypes=dict(v.types))),
+    "contacts": (
+        "contacts",
+        lambda v: RpcContacts.construct(
+            contacts=[decode_contact(c) for c in v.contacts]
+        ),
+    ),
+    "dbs": ("dbs", lambda v: DbNames.construct(names=list(v.names))),
+    "tables": (
+        "tables",
+        lambda v: DbTables.construct(
+            tables=[DbTable.construct(name=t.name, sql=t.sql) for t in v.tables]
+        ),
+    ),
+    "rows": ("rows", lambda v: DbRows.construct(rows=[decode_row(r) for r in v.rows])),
+}
+"""oneof字段名 -> (模型字段名, 解析函数)"""
+
+
+def decode_response(v: Message) -> Response:
+    """
+    说明:
+        将 `wcf_pb2.Response` 解析为响应模型
+
+    参数:
+        * `v`：已解析的protobuf消息
+
+    返回:
+        * `Response`：响应模型
+    """
+    values = {"func": Functions(v.func)}
+    which = v.WhichOneof("msg")
+    if which is not None:
+        name, decoder = _DECODERS[which]
+        values[name] = decoder(getattr(v, which))
+    return Response.construct(**values)
+
+
+def iter_rows_ndjson(rows: Message, chunk_size: int = 100) -> Iterator[bytes]:
+    """
+    说明:
+        逐行将 `wcf_pb2.DbRows` 编码为NDJSON，每次产出 `chunk_size` 行
+
+    参数:
+        * `rows`：protobuf中的查询结果
+        * `chunk_size`：每块包含的行数
+
+    返回:
+        * `Iterator[bytes]`：NDJSON数据块，每行格式与 `DbRow` 相同
+    """
+    lines = []
+    for row in rows.rows:
+        fields = [
+            {
+                "type": f.type,
+                "column": f.column,
+                "content": base64.b64encode(f.content).decode(),
+            }
+            for f in row.fields
+        ]
+        lines.append(json.dumps({"fields": fields}, ensure_ascii=False))
+        if len(lines) >= chunk_size:
+            yield ("\n".join(lines) + "\n").encode()
+            lines.clear()
+    if lines:
+        yield ("\n".join(lines) + "\n").encode()
@@ -0,0 +1,194 @@
+"""
+数据库查询结果的列式编码
+
+`DbField.type` 为sqlite的存储类型，dll通过 `sqlite3_column_blob` 取值，
+所以整数和浮点数的content都是十进制文本。
+
+二进制格式(小端):
+    * 头部：`b"WCFC"`、版本(u8)、列数(u32)、行数(u32)
+    * 每列：列名长度(u16)、列名(utf-8)、类型(u8)、空值位图(ceil(行数/8)字节)、数据
+    * 数据：INTEGER为int64数组，FLOAT为float64数组，
+      TEXT/BLOB为(行数+1)个u32偏移量加拼接后的内容，全为空值的NULL列没有数据
+"""
+import base64
+import struct
+import sys
+from array import array
+from enum import IntEnum
+from typing import Any
+
+from google.protobuf.message import Message
+
+MAGIC = b"WCFC"
+"""二进制格式标识"""
+VERSION = 1
+"""二进制格式版本"""
+
+
+class SqliteType(IntEnum):
+    """sqlite存储类型"""
+
+    INTEGER = 1
+    FLOAT = 2
+    TEXT = 3
+    BLOB = 4
+    NULL = 5
+
+
+class Column:
+    """
+    单列数据
+    """
+
+    __slots__ = ("name", "type", "values")
+
+    name: str
+    """列名"""
+    type: SqliteType
+    """列类型，整数与浮点混合的列为FLOAT，其他混合类型的列为BLOB"""
+    values: list[Any]
+    """值列表，空值为None"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.type = SqliteType.NULL
+        self.values = []
+
+
+def _convert(type: int, content: bytes) -> Any:
+    """按存储类型解析content"""
+    if type == SqliteType.INTEGER:
+        return int(content)
+    if type == SqliteType.FLOAT:
+        return float(content)
+    if type == SqliteType.TEXT:
+        return content.decode("utf-8", errors="replace")
+    if type == SqliteType.BLOB:
+        return content
+    return None
+
+
+def rows_to_columns(rows: Message) -> list[Column]:
+    """
+    说明:
+        将 `wcf_pb2.DbRows` 转换为列
+
+    参数:
+        * `rows`：protobuf中的查询结果
+
+    返回:
+        * `list[Column]`：按查询顺序排列的列
+    """
+    columns: list[Column] = []
+    raw: list[list[bytes]] = []
+    for i, row in enumerate(rows.rows):
+        if i == 0:
+            columns = [Column(f.column) for f in row.fields]
+            raw = [[] for _ in columns]
+        for column, cells, f in zip(columns, raw, row.fields):
+            cells.append(f.content)
+            if f.type == SqliteType.NULL:
+                column.values.append(None)
+                continue
+            if column.type == SqliteType.NULL:
+                column.type = SqliteType(f.type)
+            elif {column.type, f.type} == {SqliteType.INTEGER, SqliteType.FLOAT}:
+                column.type = SqliteType.FLOAT
+            elif column.type != f.type:
+                column.type = SqliteType.BLOB
+            column.values.append(_convert(f.type, f.content))
+    # 混合类型的列退回原始内容
+    for column, cells in zip(columns, raw):
+        if column.type == SqliteType.BLOB:
+            column.values = [
+                None if v is None else c for v, c in zip(column.values, cells)
+            ]
+    return columns
+
+
+def encode_columnar_json(rows: Message) -> dict[str, Any]:
+    """
+    说明:
+        编码为json友好的列式结构，BLOB列为base64字符串
+
+    参数:
+        * `rows`：protobuf中的查询结果
+
+    返回:
+        * `dict`：`{"columns", "types", "data", "count"}`
+    """
+    columns = rows_to_columns(rows)
+    data = []
+    for column in columns:
+        if column.type == SqliteType.BLOB:
+            data.append(
+                [
+                    None if v is None else base64.b64encode(v).decode()
+                    for v in column.values
+                ]
+            )
+        else:
+            data.append(column.values)
+    return {
+        "columns": [column.name for column in columns],
+        "types": [column.type.name for column in columns],
+        "data": data,
+        "count": len(rows.rows),
+    }
+
+
+def _fixed(typecode: str, values: list[Any]) -> bytes:
+    """定长数组，空值填0"""
+    arr = array(typecode, (0 if v is None else v for v in values))
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _variable(values: list[Any]) -> bytes:
+    """变长数组：偏移量 + 拼接内容"""
+    chunks = [
+        b"" if v is None else (v if isinstance(v, bytes) else v.encode("utf-8"))
+        for v in values
+    ]
+    offsets = array("I", [0])
+    total = 0
+    for chunk in chunks:
+        total += len(chunk)
+        offsets.append(total)
+    if sys.byteorder == "big":
+        offsets.byteswap()
+    return offsets.tobytes() + b"".join(chunks)
+
+
+def encode_columnar_binary(rows: Message) -> bytes:
+    """
+    说明:
+        编码为紧凑的二进制列式格式，格式见模块说明
+
+    参数:
+        * `rows`：protobuf中的查询结果
+
+    返回:
+        * `bytes`：编码结果
+    """
+    columns = rows_to_columns(rows)
+    count = len(rows.rows)
+    parts = [MAGIC, struct.pack("<BII", VERSION, len(columns), count)]
+    for column in columns:
+        name = column.name.encode("utf-8")
+        parts.append(struct.pack("<H", len(name)))
+        parts.append(name)
+        parts.append(struct.pack("<B", column.type))
+        bitmap = bytearray((count + 7) // 8)
+        for i, v in enumerate(column.values):
+            if v is None:
+                bitmap[i >> 3] |= 1 << (i & 7)
+        parts.append(bytes(bitmap))
+        if column.type == SqliteType.INTEGER:
+            parts.append(_fixed("q", column.values))
+        elif column.type == SqliteType.FLOAT:
+            parts.append(_fixed("d", column.values))
+        elif column.type in (SqliteType.TEXT, SqliteType.BLOB):
+            parts.append(_variable(column.values))
+    return b"".join(parts)
@@ -0,0 +1,328 @@
+"""
+api请求调度器，独占api_socket，串行收发并把结果交还给调用方
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Optional, TypeVar, Union
+
+from google.protobuf.message import Message
+from pynng import Pair1
+from pynng.exceptions import Closed, NNGException, Timeout
+
+from wechatferry_client.log import logger
+from wechatferry_client.metrics import breaker_trips, grpc_seconds, nng_errors
+from wechatferry_client.timing import Phases, current, record
+
+from . import wcf_pb2
+from .health import AdaptiveTimeout, CircuitBreaker
+from .model import Functions, Request, Response
+
+FIXED_TIMEOUT_FUNCS = frozenset(
+    {
+        Functions.FUNC_SEND_TXT,
+        Functions.FUNC_SEND_IMG,
+        Functions.FUNC_SEND_FILE,
+        Functions.FUNC_SEND_XML,
+        Functions.FUNC_ACCEPT_FRIEND,
+        Functions.FUNC_ADD_ROOM_MEMBERS,
+    }
+)
+"""有副作用的请求，超时后dll仍会执行，响应超时固定为 `timeout`"""
+
+
+class DispatcherBusy(Exception):
+    """请求队列已满"""
+
+
+class DispatcherTimeout(Exception):
+    """请求超过截止时间"""
+
+
+class DispatcherUnavailable(Exception):
+    """后端连续无响应，熔断中"""
+
+
+STATUS_BUSY = -10001
+"""broker回复的状态码：broker的请求队列已满"""
+STATUS_UNAVAILABLE = -10002
+"""broker回复的状态码：后端熔断中或连接出错"""
+STATUS_TIMEOUT = -10003
+"""broker回复的状态码：后端响应超时"""
+
+
+def error_status(e: Exception) -> int:
+    """
+    说明:
+        broker把调度器异常转换为回复的状态码，工作进程再还原为同类异常
+
+    参数:
+        * `e`：调度器抛出的异常
+    """
+    if isinstance(e, DispatcherBusy):
+        return STATUS_BUSY
+    if isinstance(e, DispatcherTimeout):
+        return STATUS_TIMEOUT
+    return STATUS_UNAVAILABLE
+
+
+_T = TypeVar("_T")
+
+
+async def _nng(aw: Awaitable[_T]) -> _T:
+    """
+    说明:
+        等待pynng的异步收发，保证取消不会丢失
+
+        取消时pynng的操作如果恰好完成(比如同时超时)，会吞掉 `CancelledError`，
+        调度任务就会停在下一次 `queue.get()` 上，事件循环无法退出
+
+    参数:
+        * `aw`：`asend` / `arecv_msg` 等pynng协程
+    """
+    task = asyncio.ensure_future(aw)
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        task.cancel()
+        task.add_done_callback(_discard)
+        raise
+
+
+def _discard(task: "asyncio.Future[Any]") -> None:
+    """取走被放弃的pynng操作的异常，避免未获取异常的警告"""
+    if not task.cancelled():
+        task.exception()
+
+
+_STATUS_ERRORS: dict[int, tuple[type[Exception], str]] = {
+    STATUS_BUSY: (DispatcherBusy, "broker请求队列已满"),
+    STATUS_UNAVAILABLE: (DispatcherUnavailable, "broker后端不可用"),
+    STATUS_TIMEOUT: (DispatcherTimeout, "broker后端响应超时"),
+}
+
+
+class _Job:
+    """队列中的一次请求"""
+
+    __slots__ = ("request", "future", "deadline", "enqueued", "timing")
+
+    def __init__(
+        self, request: Request, future: asyncio.Future, deadline: float
+    ) -> None:
+        self.request = request
+        self.future = future
+        self.deadline = deadline
+        self.enqueued = time.perf_counter()
+        self.timing = current()
+
+
+class RequestDispatcher:
+    """
+    请求调度器
+
+    `Pair1` 协议没有请求id，dll按顺序逐个应答，所以由唯一的调度任务持有socket，
+    调用方只把请求放进有界队列并等待future，避免多个协程交错读到对方的回复。
+    等待超时的请求仍会被dll应答，记入 `stale`，之后按数量丢弃最先收到的回复。
+    每次等待回复的超时由 `timeouts` 按请求类型计算，响应超时或连接出错计入 `breaker`。
+    """
+
+    socket: Pair1
+    """调用api的socket"""
+    queue_size: int
+    """最大排队请求数"""
+    timeout: float
+    """默认请求截止时间(s)"""
+    timeouts: AdaptiveTimeout
+    """按请求类型自适应的响应超时，上限为 `timeout`"""
+    breaker: CircuitBreaker
+    """熔断器"""
+    stale: int
+    """已超时但回复尚未收到的请求数"""
+    relayed: bool
+    """是否经由broker连接，为真时把broker回复的错误状态码还原为异常"""
+
+    def __init__(
+        self, socket: Pair1, queue_size: int = 256, timeout: float = 2
+    ) -> None:
+        self.socket = socket
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.timeouts = AdaptiveTimeout(maximum=timeout, fixed=FIXED_TIMEOUT_FUNCS)
+        self.breaker = CircuitBreaker()
+        self.stale = 0
+        self.relayed = False
+        self._queue: Optional[asyncio.Queue[_Job]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def depth(self) -> int:
+        """当前排队请求数"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self) -> None:
+        """
+        启动调度任务，需要在事件循环中调用
+        """
+        if self._task is not None and not self._task.done():
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        """
+        停止调度任务，未完成的请求全部取消
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._queue is not None:
+            while not self._queue.empty():
+                job = self._queue.get_nowait()
+                if not job.future.done():
+                    job.future.cancel()
+
+    def reset(self) -> None:
+        """
+        连接断开后调用，超时请求的回复不会再收到
+        """
+        self.stale = 0
+
+    async def submit(
+        self, request: Request, timeout: Optional[float] = None, raw: bool = False
+    ) -> Union[Response, Message]:
+        """
+        说明:
+            提交请求并等待结果
+
+        参数:
+            * `request`：grpc请求
+            * `timeout`：截止时间(s)，为空则使用默认值
+            * `raw`：是否直接返回protobuf消息，不解析为模型
+
+        返回:
+            * `Response | wcf_pb2.Response`：grpc响应
+
+        异常:
+            * `DispatcherBusy`：队列已满
+            * `DispatcherTimeout`：超过截止时间
+            * `DispatcherUnavailable`：熔断中
+        """
+        if not self.breaker.allow():
+            raise DispatcherUnavailable(f"{request.func.name} 后端无响应，已熔断")
+        self.start()
+        timeout = self.timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        job = _Job(request, loop.create_future(), time.monotonic() + timeout)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise DispatcherBusy(f"请求队列已满({self.queue_size})") from None
+        try:
+            rsp = await asyncio.wait_for(asyncio.shield(job.future), timeout)
+        except asyncio.TimeoutError:
+            job.future.cancel()
+            raise DispatcherTimeout(f"{request.func.name} 请求超时") from None
+        if raw:
+            return rsp
+        start = time.perf_counter()
+        result = Response.parse_protobuf(rsp)
+        elapsed = time.perf_counter() - start
+        grpc_seconds.observe(elapsed, request.func.name, "decode")
+        record(job.timing, "decode", elapsed)
+        return result
+
+    async def _run(self) -> None:
+        """调度循环"""
+        while True:
+            job = await self._queue.get()
+            waited = time.perf_counter() - job.enqueued
+            grpc_seconds.observe(waited, job.request.func.name, "queue")
+            record(job.timing, "queue", waited)
+            if job.future.done():
+                continue
+            if time.monotonic() >= job.deadline:
+                job.future.set_exception(
+                    DispatcherTimeout(f"{job.request.func.name} 排队超时")
+                )
+                continue
+            try:
+                result = await self._exchange(job.request, job.deadline, job.timing)
+            except Closed as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+                logger.debug("<g>api socket已关闭，调度器退出...</g>")
+                return
+            except Exception as e:
+                if isinstance(e, (DispatcherTimeout, NNGException)):
+                    self._failure()
+                if not job.future.done():
+                    job.future.set_exception(e)
+                continue
+            self.breaker.success()
+            if not job.future.done():
+                job.future.set_result(result)
+
+    def _failure(self) -> None:
+        """记录一次后端失败，熔断打开时记录日志"""
+        if self.breaker.failure():
+            breaker_trips.inc()
+            logger.warning(
+                f"<y>后端连续 {self.breaker.threshold} 次无响应，"
+                f"熔断 {self.breaker.cooldown}s...</y>"
+            )
+
+    async def _exchange(
+        self, request: Request, deadline: float, timing: Optional[Phases]
+    ) -> Message:
+        """
+        发送一次请求并读取对应回复，先丢弃之前超时请求迟到的回复
+        """
+        name = request.func.name
+        start = time.perf_counter()
+        data = request.get_request_data()
+        sent = time.perf_counter()
+        grpc_seconds.observe(sent - start, name, "encode")
+        record(timing, "encode", sent - start)
+        # 还有过期回复未收到时，需要先等它们到达，不使用自适应超时，也不记录样本
+        resync = self.stale > 0
+        limit = self.timeouts.maximum if resync else self.timeouts.get(request.func)
+        wait = min(limit, deadline - time.monotonic())
+        self.socket.recv_timeout = max(1, int(wait * 1000))
+        await _nng(self.socket.asend(data))
+        while True:
+            try:
+                res = await _nng(self.socket.arecv_msg())
+            except Timeout:
+                nng_errors.inc("api", "timeout")
+                if not resync:
+                    self.timeouts.observe(request.func, wait)
+                self.stale += 1
+                raise DispatcherTimeout(f"{name} 响应超时") from None
+            except Closed:
+                raise
+            except NNGException:
+                nng_errors.inc("api", "error")
+                raise
+            received = time.perf_counter()
+            rsp: Message = wcf_pb2.Response()
+            rsp.ParseFromString(res.bytes)
+            if self.stale > 0:
+                # 函数相同的回复也可能是过期的，按超时请求的数量丢弃
+                self.stale -= 1
+                logger.debug(f"<y>丢弃过期回复：{rsp.func}</y>")
+                continue
+            if rsp.func != request.func:
+                logger.debug(f"<y>丢弃无法对应的回复：{rsp.func}</y>")
+                continue
+            if self.relayed and rsp.WhichOneof("msg") == "status":
+                error = _STATUS_ERRORS.get(rsp.status)
+                if error is not None:
+                    raise error[0](f"{name} {error[1]}")
+            parsed = time.perf_counter()
+            if not resync:
+                self.timeouts.observe(request.func, received - sent)
+            grpc_seconds.observe(received - sent, name, "roundtrip")
+            grpc_seconds.observe(parsed - received, name, "parse")
+            record(timing, "roundtrip", received - sent)
+            record(timing, "parse", parsed - received)
+            return rsp
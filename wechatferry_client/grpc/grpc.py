@@ -1,121 +1,248 @@
 import asyncio
+from typing import Callable, Optional, Union
 
 from google.protobuf.message import Message
-from pynng import Pair1
+from pynng import Pair1, Sub0
 from pynng.exceptions import Closed, NNGException, Timeout
 
+from wechatferry_client.config import AccountConfig, Config
 from wechatferry_client.log import logger
-from wechatferry_client.utils import escape_tag
+from wechatferry_client.metrics import messages, nng_errors
 
 from . import wcf_pb2
+from .dispatcher import RequestDispatcher
 from .model import Functions, Request, Response
+from .msg_filter import MsgFilter
 
-
-def handle_msg(message: Response) -> None:
-    logger.debug(
-        f"收到消息 - {escape_tag(message.json(skip_defaults=True,ensure_ascii=False))}"
-    )
+RECONNECT_MIN = 0.1
+"""断线后首次重连和重试的等待时间(s)，之后每次翻倍"""
+RECONNECT_MAX = 5
+"""最长重连和重试等待时间(s)"""
 
 
 class GrpcManager:
     """
     grpc管理
+
+    两个socket由nng在断线后按退避间隔自动重连；api连接恢复后重新开启接收消息，
+    接收循环出错时等待后继续，不会静默停止。
     """
 
     api_socket: Pair1
     """调用api的socket"""
-    msg_socket: Pair1
-    """接收消息的socket"""
+    msg_socket: Union[Pair1, Sub0]
+    """接收消息的socket，经由broker连接时为订阅socket"""
+    dispatcher: RequestDispatcher
+    """api请求调度器"""
+    msg_filter: MsgFilter
+    """消息预过滤器"""
+    msg_handlers: list[Callable[[Response], None]]
+    """消息发布函数，在接收循环中同步调用，不能阻塞"""
+    api_address: str
+    """api socket地址"""
+    msg_address: str
+    """消息socket地址"""
 
     def __init__(self) -> None:
-        self.api_socket = Pair1(send_timeout=2000, recv_timeout=2000)
-        self.msg_socket = Pair1(send_timeout=2000, recv_timeout=2000)
-
-    def init(self) -> bool:
+        self.api_socket = Pair1(
+            send_timeout=2000,
+            recv_timeout=2000,
+            reconnect_time_min=int(RECONNECT_MIN * 1000),
+            reconnect_time_max=int(RECONNECT_MAX * 1000),
+        )
+        # 没有消息时一直等待，不设接收超时
+        self.msg_socket = Pair1(
+            send_timeout=2000,
+            reconnect_time_min=int(RECONNECT_MIN * 1000),
+            reconnect_time_max=int(RECONNECT_MAX * 1000),
+        )
+        self.dispatcher = RequestDispatcher(self.api_socket)
+        self.msg_handlers = []
+        self.api_address = ""
+        self.msg_address = ""
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._connected: Optional[asyncio.Event] = None
+        self._disconnected = False
+        self._receiving = False
+        self._closing = False
+        self._tasks: set[asyncio.Task] = set()
+
+    def init(self, config: Config, account: AccountConfig) -> None:
         """
-        初始化grpc连接
+        初始化grpc设置，连接在 `connect` 中建立
         """
-        logger.info("<y>正在连接到grpc...</y>")
-        self.api_socket.dial("tcp://127.0.0.1:10086", block=True)
-        logger.debug("<g>grpc连接成功...</g>")
+        self.api_address = account.api_address
+        self.msg_address = account.msg_address
+        if account.broker:
+            self.msg_socket.close()
+            self.msg_socket = Sub0(
+                reconnect_time_min=int(RECONNECT_MIN * 1000),
+                reconnect_time_max=int(RECONNECT_MAX * 1000),
+            )
+            self.msg_socket.subscribe(b"")
+        self.dispatcher.relayed = account.broker
+        self.dispatcher.queue_size = config.api_queue_size
+        self.dispatcher.timeout = config.api_timeout
+        self.dispatcher.timeouts.factor = config.api_timeout_factor
+        self.dispatcher.timeouts.minimum = config.api_timeout_min
+        self.dispatcher.timeouts.maximum = config.api_timeout
+        self.dispatcher.breaker.threshold = config.breaker_threshold
+        self.dispatcher.breaker.cooldown = config.breaker_cooldown
+        self.msg_filter = MsgFilter(config)
 
     def close(self) -> None:
         """
         关闭grpc连接
         """
         logger.info("<y>正在关闭grpc...</y>")
+        self._closing = True
+        self.dispatcher.stop()
         self.api_socket.close()
         self.msg_socket.close()
         logger.success("<g>grpc关闭成功...</g>")
 
     async def recv_msg(self) -> None:
         """
-        接收数据，上报事件
+        接收数据，上报事件，连接出错时按退避间隔等待后继续
         """
+        delay = RECONNECT_MIN
         while True:
             try:
                 data = await self.msg_socket.arecv_msg()
+                delay = RECONNECT_MIN
                 rsp: Message = wcf_pb2.Response()
                 rsp.ParseFromString(data.bytes)
+                if not self.msg_filter(rsp.wxmsg):
+                    messages.inc(str(rsp.wxmsg.type), "filtered")
+                    continue
+                messages.inc(str(rsp.wxmsg.type), "accepted")
                 msg = Response.parse_protobuf(rsp)
-                handle_msg(msg)
+                for handler in self.msg_handlers:
+                    handler(msg)
             except Timeout:
+                nng_errors.inc("msg", "timeout")
                 continue
             except Closed:
                 logger.debug("<g>grpc连接已关闭...</g>")
                 return
             except NNGException as e:
-                logger.error(f"<r>连接出错:{e}</r>")
-                return
+                nng_errors.inc("msg", "error")
+                logger.error(f"<r>连接出错:{e}，{delay}s后重试...</r>")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX)
+                continue
             except Exception as e:
                 logger.error(f"<r>消息出错:{e}</r>")
                 continue
 
     async def request(self, request: Request) -> Response:
         """
-        发送请求
+        发送请求，经由调度器排队
         """
-        await self.api_socket.asend(request.get_request_data())
-        res = await self.api_socket.arecv_msg()
-        rsp: Message = wcf_pb2.Response()
-        rsp.ParseFromString(res.bytes)
-        msg = Response.parse_protobuf(rsp)
-        return msg
+        return await self.dispatcher.submit(request)
 
-    def request_sync(self, request: Request) -> Response:
+    async def request_raw(self, request: Request) -> Message:
         """
-        发送请求，同步版
+        发送请求，直接返回 `wcf_pb2.Response`，用于需要自行处理大结果的场景
         """
-        self.api_socket.send(request.get_request_data())
-        res = self.api_socket.recv_msg()
-        rsp: Message = wcf_pb2.Response()
-        rsp.ParseFromString(res.bytes)
-        msg = Response.parse_protobuf(rsp)
-        return msg
+        return await self.dispatcher.submit(request, raw=True)
 
-    def connect_msg_socket(self) -> bool:
+    async def connect_msg_socket(self) -> None:
         """
-        连接到接收消息soket
+        说明:
+            开启接收消息并连接消息socket，开启失败时按退避间隔重试直到成功，
+            消息socket在后台由nng连接，不等待建立
         """
         logger.debug("<y>发送接收消息请求...</y>")
-        if not self.enable_receiving_msg():
-            logger.error("<r>请求通信出错...</r>")
-            return False
+        if not await self._recover():
+            return
         logger.debug("<g>请求接收消息成功...</g>")
         logger.debug("<y>正在连接消息推送grpc...</y>")
-        self.msg_socket.dial("tcp://127.0.0.1:10087", block=True)
-        logger.success("<g>连接grpc成功...</g>")
-        asyncio.create_task(self.recv_msg())
-        return True
+        self.msg_socket.dial(self.msg_address, block=False)
+
+    def start_receiving(self) -> None:
+        """
+        开始接收消息，需要在 `connect_msg_socket` 之后调用
+        """
+        self._spawn(self.recv_msg())
+        logger.success("<g>开始接收消息...</g>")
+
+    async def connect(self) -> None:
+        """
+        说明:
+            连接api socket并开启调度器，等待连接建立，期间nng按退避间隔自动重试。
+            之后断线重连时重新开启接收消息，需要在事件循环中调用。
+        """
+        self._loop = asyncio.get_running_loop()
+        self._connected = asyncio.Event()
+        self.api_socket.add_post_pipe_remove_cb(self._on_disconnect)
+        self.api_socket.add_post_pipe_connect_cb(self._on_connect)
+        logger.info(f"<y>正在连接到grpc：{self.api_address}...</y>")
+        self.api_socket.dial(self.api_address, block=False)
+        self.dispatcher.start()
+        await self._connected.wait()
+        logger.debug("<g>grpc连接成功...</g>")
+
+    def _on_disconnect(self, _) -> None:
+        """api连接断开，在nng线程中调用"""
+        if self._closing:
+            return
+        self._disconnected = True
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self.dispatcher.reset)
+        nng_errors.inc("api", "disconnect")
+        logger.warning("<y>grpc连接已断开，正在重连...</y>")
+
+    def _on_connect(self, _) -> None:
+        """api连接建立，在nng线程中调用，断线重连时重新开启接收消息"""
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._connected.set)
+        if not self._disconnected:
+            return
+        self._disconnected = False
+        if self._receiving:
+            self._loop.call_soon_threadsafe(self._spawn, self._reenable())
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _recover(self) -> bool:
+        """
+        说明:
+            开启接收消息，失败时按退避间隔重试，启动时和断线重连后调用
+
+        返回:
+            * `bool`：是否成功，关闭时为假
+        """
+        delay = RECONNECT_MIN
+        while not self._closing:
+            try:
+                if await self.enable_receiving_msg():
+                    return True
+                logger.warning(f"<y>开启接收消息失败，{delay}s后重试...</y>")
+            except Exception as e:
+                logger.warning(f"<y>开启接收消息失败：{e}，{delay}s后重试...</y>")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX)
+        return False
+
+    async def _reenable(self) -> None:
+        """重连后重新开启接收消息"""
+        if await self._recover():
+            logger.success("<g>grpc已重连，重新开启接收消息...</g>")
 
-    def enable_receiving_msg(self) -> bool:
+    async def enable_receiving_msg(self) -> bool:
         """
         说明:
-            允许接收信息
-        """
-        request = Request(func=Functions.FUNC_ENABLE_RECV_TXT)
-        self.api_socket.send(request.get_request_data())
-        rsp = self.api_socket.recv_msg(block=True)
-        reponse: Message = wcf_pb2.Response()
-        reponse.ParseFromString(rsp.bytes)
-        return reponse.status == 0
+            允许接收信息，成功后断线重连时会自动重新开启
+        """
+        rsp = await self.dispatcher.submit(
+            Request(func=Functions.FUNC_ENABLE_RECV_TXT), raw=True
+        )
+        if rsp.status != 0:
+            return False
+        self._receiving = True
+        return True
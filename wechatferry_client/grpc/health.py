@@ -0,0 +1,142 @@
+"""
+后端健康状态，按请求类型自适应的响应超时，以及连续失败后快速失败的熔断器
+"""
+import time
+from collections import deque
+from typing import Optional
+
+
+class AdaptiveTimeout:
+    """
+    按各 `Functions` 最近的往返耗时计算响应超时
+
+    每种请求保留最近 `window` 次耗时，样本足够后取p99乘以 `factor`，
+    限制在 `minimum` 和 `maximum` 之间；样本不足或 `factor` 为0时使用 `maximum`。
+    超时的请求按超时时间记为一个样本，后端整体变慢时超时会逐渐放宽。
+    分位数每 `refresh` 个样本重新计算一次。
+    `fixed` 中的请求总是使用 `maximum`：发送消息等请求超时后dll仍会执行，
+    过早超时会让调用方重试而重复执行。
+    """
+
+    factor: float
+    """p99耗时的倍数，为0则固定使用 `maximum`"""
+    minimum: float
+    """超时下限(s)"""
+    maximum: float
+    """超时上限(s)"""
+    window: int
+    """每种请求保留的样本数"""
+    min_samples: int
+    """开始自适应所需的样本数"""
+    refresh: int
+    """每多少个样本重新计算一次"""
+    fixed: frozenset[int]
+    """不做自适应、固定使用 `maximum` 的请求类型"""
+
+    def __init__(
+        self,
+        factor: float = 3,
+        minimum: float = 0.2,
+        maximum: float = 2,
+        window: int = 256,
+        min_samples: int = 20,
+        refresh: int = 16,
+        fixed: frozenset[int] = frozenset(),
+    ) -> None:
+        self.factor = factor
+        self.minimum = minimum
+        self.maximum = maximum
+        self.window = window
+        self.min_samples = min_samples
+        self.refresh = refresh
+        self.fixed = fixed
+        self._samples: dict[int, deque[float]] = {}
+        self._pending: dict[int, int] = {}
+        self._timeouts: dict[int, float] = {}
+
+    def get(self, func: int) -> float:
+        """请求的当前响应超时(s)"""
+        if self.factor <= 0 or func in self.fixed:
+            return self.maximum
+        return min(self._timeouts.get(func, self.maximum), self.maximum)
+
+    def observe(self, func: int, seconds: float) -> None:
+        """
+        说明:
+            记录一次往返耗时
+
+        参数:
+            * `func`：请求类型
+            * `seconds`：耗时(s)，超时的请求传入超时时间
+        """
+        samples = self._samples.get(func)
+        if samples is None:
+            samples = self._samples[func] = deque(maxlen=self.window)
+        samples.append(seconds)
+        pending = self._pending.get(func, 0) + 1
+        if pending < self.refresh or len(samples) < self.min_samples:
+            self._pending[func] = pending
+            return
+        self._pending[func] = 0
+        ordered = sorted(samples)
+        p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+        self._timeouts[func] = max(self.minimum, p99 * self.factor)
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    连续 `threshold` 次失败后打开，之后的请求直接失败；每过 `cooldown` 秒放行一个试探请求，
+    任何请求成功都会关闭熔断。试探请求被取消时下一个冷却期会再放行一个。
+    """
+
+    threshold: int
+    """连续失败多少次后打开，为0则不熔断"""
+    cooldown: float
+    """打开后放行试探请求的间隔(s)"""
+
+    def __init__(self, threshold: int = 5, cooldown: float = 5) -> None:
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened: Optional[float] = None
+
+    @property
+    def is_open(self) -> bool:
+        """是否处于熔断中"""
+        return self._opened is not None
+
+    def allow(self) -> bool:
+        """请求是否可以放行"""
+        if self._opened is None:
+            return True
+        now = time.monotonic()
+        if now - self._opened < self.cooldown:
+            return False
+        # 每个冷却期只放行一个试探请求
+        self._opened = now
+        return True
+
+    def success(self) -> None:
+        """记录一次成功，关闭熔断"""
+        self._failures = 0
+        self._opened = None
+
+    def failure(self) -> bool:
+        """
+        说明:
+            记录一次失败
+
+        返回:
+            * `bool`：本次失败是否使熔断打开
+        """
+        self._failures += 1
+        if (
+            self._opened is None
+            and self.threshold > 0
+            and self._failures >= self.threshold
+        ):
+            self._opened = time.monotonic()
+            return True
+        return False
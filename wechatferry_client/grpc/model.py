@@ -1,12 +1,9 @@
 from enum import IntEnum
 from typing import Optional
 
-from google.protobuf import json_format
 from google.protobuf.message import Message
 from pydantic import BaseModel, Field
 
-from . import wcf_pb2
-
 
 class Functions(IntEnum):
     """functions"""
@@ -143,12 +140,9 @@ class Request(BaseModel):
         """
         获取Request请求数据
         """
-        request: Message = json_format.ParseDict(
-            self.dict(exclude_defaults=True),
-            wcf_pb2.Request(),
-            ignore_unknown_fields=True,
-        )
-        return request.SerializeToString()
+        from .codec import encode_request
+
+        return encode_request(self)
 
 
 class WxMsg(BaseModel):
@@ -290,10 +284,6 @@ class Response(BaseModel):
         """
         从protobuf中获取实例
         """
-        data = json_format.MessageToDict(
-            message=v,
-            including_default_value_fields=True,
-            use_integers_for_enums=True,
-            preserving_proto_field_name=True,
-        )
-        return cls.parse_obj(data)
+        from .codec import decode_response
+
+        return decode_response(v)
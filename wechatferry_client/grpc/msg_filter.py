@@ -0,0 +1,61 @@
+"""
+消息预过滤，在构造 `WxMsg` 模型之前直接检查protobuf字段
+"""
+from google.protobuf.message import Message
+
+from wechatferry_client.config import Config
+
+
+class MsgFilter:
+    """
+    消息过滤器，返回 `True` 表示消息需要继续处理
+    """
+
+    types: frozenset[int]
+    """过滤的消息类型"""
+    report_self: bool
+    """是否上报自身消息"""
+    room_allow: frozenset[str]
+    """群白名单，为空则不限制"""
+    room_deny: frozenset[str]
+    """群黑名单"""
+    sender_allow: frozenset[str]
+    """发送者白名单，为空则不限制"""
+    sender_deny: frozenset[str]
+    """发送者黑名单"""
+
+    def __init__(self, config: Config) -> None:
+        self.types = frozenset(config.msg_filter)
+        self.report_self = config.report_self
+        self.room_allow = frozenset(config.room_allow)
+        self.room_deny = frozenset(config.room_deny)
+        self.sender_allow = frozenset(config.sender_allow)
+        self.sender_deny = frozenset(config.sender_deny)
+
+    def __call__(self, wxmsg: Message) -> bool:
+        """
+        说明:
+            检查 `wcf_pb2.WxMsg` 是否需要上报
+
+        参数:
+            * `wxmsg`：protobuf中的消息
+
+        返回:
+            * `bool`：是否保留
+        """
+        if wxmsg.type in self.types:
+            return False
+        if wxmsg.is_self and not self.report_self:
+            return False
+        if wxmsg.is_group:
+            roomid = wxmsg.roomid
+            if roomid in self.room_deny:
+                return False
+            if self.room_allow and roomid not in self.room_allow:
+                return False
+        sender = wxmsg.sender
+        if sender in self.sender_deny:
+            return False
+        if self.sender_allow and sender not in self.sender_allow:
+            return False
+        return True
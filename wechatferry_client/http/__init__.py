@@ -1 +1,5 @@
+from .health_api import router as health_router
 from .http_api import router as router
+from .metrics_api import router as metrics_router
+from .ws_api import router as ws_router
+from .ws_api import subscribe as ws_subscribe
@@ -0,0 +1,22 @@
+"""就绪检查接口
+"""
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from wechatferry_client.wechat import get_wechats
+
+router = APIRouter()
+
+
+@router.get("/ready")
+async def _():
+    """所有账号都已登录并加载完数据时返回200，否则返回503和各账号的启动阶段"""
+    accounts = [
+        {"self_id": wechat.self_id, "stage": wechat.stage} for wechat in get_wechats()
+    ]
+    ready = bool(accounts) and all(
+        account["stage"] == "ready" for account in accounts
+    )
+    return JSONResponse(
+        {"ready": ready, "accounts": accounts}, status_code=200 if ready else 503
+    )
@@ -1,34 +1,238 @@
 """http_api调用
 """
-from fastapi import APIRouter, Body, Response
+import time
+from typing import Iterator, Optional
+
+from fastapi import APIRouter, Body, Header, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic.error_wrappers import ValidationError
 
-from wechatferry_client.log import logger
-from wechatferry_client.model import HttpRequest, HttpResponse
-from wechatferry_client.utils import escape_tag
-from wechatferry_client.wechat import get_wechat
+from wechatferry_client import timing
+from wechatferry_client.file_cache import FileTooLarge
+from wechatferry_client.http.upload import (
+    FORM_OVERHEAD,
+    MultipartUpload,
+    UploadFormError,
+)
+from wechatferry_client.log import default_filter, logger
+from wechatferry_client.model import BatchRequest, HttpRequest, HttpResponse
+from wechatferry_client.timing import profiler
+from wechatferry_client.utils import escape_tag, preview
+from wechatferry_client.wechat import WeChatManager, get_wechat, unknown_account
+from wechatferry_client.wechat.api_manager import Action
 
 router = APIRouter()
 
 
-@router.post("/{action}", response_model=HttpResponse)
-async def _(action: str, response: Response, params=Body(None)) -> None:
-    """处理api调用"""
-    # 构造请求体
+def _unknown_account() -> HttpResponse:
+    """`self_id` 没有对应账号时的返回"""
+    status, msg = unknown_account()
+    return HttpResponse(status=status, msg=msg, data={})
+
+
+def _headers(wechat_client: WeChatManager) -> dict[str, str]:
+    """响应头，带上处理请求的账号"""
+    return {
+        "X-self-ID": wechat_client.self_id,
+        "access_token": wechat_client.config.access_token,
+    }
+
+
+def _log_request(kind: str, action: str, params) -> None:
+    """记录收到的请求，参数只记录预览"""
+    if default_filter.enabled("INFO"):
+        logger.info(
+            f"<m>http_api</m> - <g>收到{kind}：</g>"
+            f"action：{action}，params：{escape_tag(preview(params))}"
+        )
+
+
+def _log_response(res: HttpResponse) -> None:
+    """记录调用返回，数据只记录预览"""
+    if default_filter.enabled("INFO"):
+        logger.info(
+            f"<m>http_api</m> - <g>调用返回：</g>status={res.status} "
+            f"msg={escape_tag(res.msg)} data={escape_tag(preview(res.data))}"
+        )
+
+
+@router.post("/batch", response_model=HttpResponse)
+async def _(
+    response: Response,
+    body=Body(None),
+    self_id: Optional[str] = Header(None, alias="X-self-ID"),
+):
+    """批量处理api调用，请求头 `X-self-ID` 选择账号"""
+    try:
+        batch = BatchRequest.parse_obj(body)
+    except ValidationError:
+        logger.error("<m>http_api</m> - <r>批量请求参数不正确!</r>")
+        return HttpResponse(status=405, msg="请求参数不正确！", data={})
+    logger.info(
+        f"<m>http_api</m> - <g>收到http批量请求：</g>共 {len(batch.requests)} 个，"
+        f"actions：{','.join(item.action for item in batch.requests)}"
+    )
+    wechat_client = get_wechat(self_id)
+    if wechat_client is None:
+        return _unknown_account()
+    error = wechat_client.check_batch(batch)
+    if error is not None:
+        logger.error(f"<m>http_api</m> - <r>{error.msg}</r>")
+        return HttpResponse(status=error.status, msg=error.msg, data=error.data)
+    headers = _headers(wechat_client)
+    if batch.stream:
+
+        async def lines():
+            async for result in wechat_client.iter_batch(batch):
+                yield result.json(ensure_ascii=False) + "\n"
+
+        return StreamingResponse(
+            lines(), media_type="application/x-ndjson", headers=headers
+        )
+    results = await wechat_client.handle_batch(batch)
+    response.headers.update(headers)
+    failed = sum(result.status != 200 for result in results)
     logger.info(
-        f"<m>http_api</m> - <g>收到http api请求：</g>action：{action}，params：{params}"
+        f"<m>http_api</m> - <g>批量调用返回：</g>成功 {len(results) - failed} 个，"
+        f"失败 {failed} 个"
     )
+    return HttpResponse(status=200, msg="请求成功", data=results)
+
+
+@router.post("/upload", response_model=HttpResponse)
+async def _(request: Request, name: Optional[str] = None):
+    """
+    上传文件到各账号共用的文件缓存，返回的路径可用于send_image和send_file。
+    `multipart/form-data` 请求取 `file` 字段，文件名依次取查询参数 `name`、
+    表单字段 `name` 和文件字段的文件名；其他请求的请求体即文件内容，文件名取查询参数 `name`。
+    请求体边接收边写入，不会先整体缓存
+    """
+    logger.info(f"<m>http_api</m> - <g>收到文件上传：</g>{name}")
+    file_cache = get_wechat().file_cache
+    content_type = request.headers.get("content-type", "")
+    is_form = content_type.startswith("multipart/form-data")
+    limit = file_cache.max_size + (FORM_OVERHEAD if is_form else 0)
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > limit:
+        logger.error(f"<m>http_api</m> - <r>上传文件过大：{length} 字节</r>")
+        return HttpResponse(status=413, msg="文件过大", data={})
+    try:
+        if is_form:
+            form = MultipartUpload(request.stream(), content_type)
+            path = await file_cache.save_stream(
+                form.chunks(), lambda: name or form.fields.get("name") or form.filename
+            )
+        else:
+            path = await file_cache.save_stream(request.stream(), name)
+    except FileTooLarge as e:
+        logger.error(f"<m>http_api</m> - <r>{e}</r>")
+        return HttpResponse(status=413, msg="文件过大", data={})
+    except UploadFormError as e:
+        logger.error(f"<m>http_api</m> - <r>{e}</r>")
+        return HttpResponse(status=405, msg="请求参数不正确！", data={})
+    return HttpResponse(status=200, msg="请求成功", data={"path": str(path)})
+
+
+@router.post("/{action}", response_model=HttpResponse)
+async def _(
+    action: str,
+    params=Body(None),
+    self_id: Optional[str] = Header(None, alias="X-self-ID"),
+):
+    """处理api调用，请求头 `X-self-ID` 选择账号"""
+    return await _handle_action(action, params, self_id)
+
+
+async def _handle_action(action: str, params, self_id: Optional[str]):
+    """处理api调用，响应头 `Server-Timing` 中带有各阶段耗时"""
+    wechat_client = get_wechat(self_id)
+    if wechat_client is None:
+        return _unknown_account()
+    phases = timing.start()
+    profile = profiler.start()
+    start = time.perf_counter()
+    # 分析器是全局开启的，出错时也要关闭
+    try:
+        return await _call_action(wechat_client, action, params, phases, start)
+    finally:
+        await profiler.finish(profile, time.perf_counter() - start, action)
+
+
+async def _call_action(
+    wechat_client: WeChatManager,
+    action: str,
+    params,
+    phases: timing.Phases,
+    start: float,
+):
+    """构造请求并调用"""
+    # 构造请求体
+    _log_request("http api请求", action, params)
     try:
         http_request = HttpRequest(action=action, params=params)
         if http_request.params is None:
             http_request.params = {}
     except ValidationError:
         logger.error("<m>http_api</m> - <r>请求参数不正确!</r>")
-        return HttpResponse(status=405, msg="请求参数不正确！", data={})
-    wechat_client = get_wechat()
+        res = HttpResponse(status=405, msg="请求参数不正确！", data={})
+        timing.record(phases, "total", time.perf_counter() - start)
+        headers = {"Server-Timing": timing.server_timing(phases)}
+        return Response(
+            res.json(ensure_ascii=False), media_type="application/json", headers=headers
+        )
+    timing.record(phases, "request", time.perf_counter() - start)
+    if (
+        action == Action.FUNC_EXEC_DB_QUERY.value
+        and http_request.params.get("format") == "columnar_binary"
+    ):
+        return await _columnar_binary(wechat_client, http_request.params)
     res = await wechat_client.handle_http_api(http_request)
-    response.headers["X-self-ID"] = wechat_client.self_id
-    response.headers["access_token"] = wechat_client.config.access_token
-    logger.info(f"<m>http_api</m> - <g>调用返回：</g>{escape_tag(str(res))}")
+    _log_response(res)
+    serialize_start = time.perf_counter()
+    body = res.json(ensure_ascii=False)
+    end = time.perf_counter()
+    timing.record(phases, "serialize", end - serialize_start)
+    timing.record(phases, "total", end - start)
+    headers = _headers(wechat_client)
+    headers["Server-Timing"] = timing.server_timing(phases)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+@router.post("/stream/{action}", response_model=HttpResponse)
+async def _(
+    action: str,
+    params=Body(None),
+    self_id: Optional[str] = Header(None, alias="X-self-ID"),
+):
+    """流式返回数据库查询结果，格式为NDJSON"""
+    _log_request("http流式请求", action, params)
+    if action != Action.FUNC_EXEC_DB_QUERY.value:
+        return HttpResponse(status=404, msg=f"{action} :不支持流式返回", data={})
+    wechat_client = get_wechat(self_id)
+    if wechat_client is None:
+        return _unknown_account()
+    res = await wechat_client.handle_stream_query(params or {})
+    if not isinstance(res, Iterator):
+        _log_response(res)
+        return HttpResponse(status=res.status, msg=res.msg, data=res.data)
+    return StreamingResponse(
+        res, media_type="application/x-ndjson", headers=_headers(wechat_client)
+    )
 
-    return res
+
+@router.post("/{self_id}/{action}", response_model=HttpResponse)
+async def _(self_id: str, action: str, params=Body(None)):
+    """处理指定账号的api调用，路径中的self_id优先于请求头"""
+    return await _handle_action(action, params, self_id)
+
+
+async def _columnar_binary(wechat_client: WeChatManager, params: dict):
+    """以二进制列式格式返回数据库查询结果"""
+    res = await wechat_client.handle_columnar_query(params)
+    if not isinstance(res, bytes):
+        _log_response(res)
+        return HttpResponse(status=res.status, msg=res.msg, data=res.data)
+    logger.info(f"<m>http_api</m> - <g>调用返回：</g>列式数据 {len(res)} 字节")
+    return Response(
+        res, media_type="application/octet-stream", headers=_headers(wechat_client)
+    )
@@ -0,0 +1,16 @@
+"""指标接口
+"""
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from wechatferry_client.metrics import registry
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def _():
+    """以Prometheus文本格式输出指标"""
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -0,0 +1,140 @@
+"""
+multipart上传的流式解析，边接收边交给文件缓存，不会像starlette那样先把整个请求体存入临时文件
+"""
+from typing import AsyncIterator, Optional
+
+try:
+    from python_multipart.exceptions import MultipartParseError
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:  # pragma: no cover
+    from multipart.exceptions import MultipartParseError
+    from multipart.multipart import MultipartParser, parse_options_header
+
+FIELD_MAX_SIZE = 4096
+"""普通字段的最大长度(字节)"""
+FORM_OVERHEAD = 64 * 1024
+"""检查 `Content-Length` 时为分隔符和普通字段留出的长度(字节)"""
+
+
+class UploadFormError(ValueError):
+    """multipart请求体格式不正确"""
+
+
+class MultipartUpload:
+    """
+    流式解析 `multipart/form-data` 请求体
+
+    文件字段的数据按接收顺序从 `chunks` 取出，不在内存中整体缓存；
+    其他字段存入 `fields`，排在文件之后的字段要等 `chunks` 读完才能取到。
+    """
+
+    field: str
+    """文件字段名，同名字段只取第一个"""
+    filename: Optional[str]
+    """文件字段中的文件名"""
+    fields: dict[str, str]
+    """普通字段"""
+
+    def __init__(
+        self, stream: AsyncIterator[bytes], content_type: str, field: str = "file"
+    ) -> None:
+        """
+        异常:
+            * `UploadFormError`：不是multipart请求体
+        """
+        ctype, options = parse_options_header(content_type)
+        boundary = options.get(b"boundary")
+        if ctype != b"multipart/form-data" or not boundary:
+            raise UploadFormError("请求体不是multipart/form-data")
+        self.field = field
+        self.filename = None
+        self.fields = {}
+        self._stream = stream
+        self._found = False
+        self._ended = False
+        self._data: list[bytes] = []
+        self._headers: dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._name = ""
+        self._is_file = False
+        self._value = bytearray()
+        self._parser = MultipartParser(
+            boundary,
+            {
+                "on_part_begin": self._on_part_begin,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+                "on_headers_finished": self._on_headers_finished,
+                "on_part_data": self._on_part_data,
+                "on_part_end": self._on_part_end,
+                "on_end": self._on_end,
+            },
+        )
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        """
+        说明:
+            读取请求体，按顺序产出文件字段的数据
+
+        异常:
+            * `UploadFormError`：格式不正确、请求体不完整或缺少文件字段
+        """
+        async for data in self._stream:
+            try:
+                self._parser.write(data)
+            except MultipartParseError as e:
+                raise UploadFormError(f"multipart请求体格式不正确：{e}") from None
+            chunks, self._data = self._data, []
+            for chunk in chunks:
+                yield chunk
+        self._parser.finalize()
+        if not self._ended:
+            raise UploadFormError("multipart请求体不完整")
+        if not self._found:
+            raise UploadFormError(f"缺少文件字段：{self.field}")
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+        self._name = ""
+        self._is_file = False
+        self._value = bytearray()
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        disposition = self._headers.get(b"content-disposition", b"")
+        _, options = parse_options_header(disposition)
+        self._name = options.get(b"name", b"").decode("utf-8", "replace")
+        if self._name == self.field and not self._found:
+            self._found = True
+            self._is_file = True
+            filename = options.get(b"filename")
+            if filename:
+                self.filename = filename.decode("utf-8", "replace")
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._is_file:
+            if end > start:
+                self._data.append(bytes(data[start:end]))
+            return
+        self._value += data[start:end]
+        if len(self._value) > FIELD_MAX_SIZE:
+            raise UploadFormError(f"字段 {self._name} 超过长度上限：{FIELD_MAX_SIZE} 字节")
+
+    def _on_part_end(self) -> None:
+        if not self._is_file and self._name:
+            self.fields[self._name] = self._value.decode("utf-8", "replace")
+
+    def _on_end(self) -> None:
+        self._ended = True
@@ -0,0 +1,94 @@
+"""正向websocket api
+"""
+import asyncio
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from pydantic.error_wrappers import ValidationError
+
+from wechatferry_client.log import logger
+from wechatferry_client.model import MessageEvent, WsRequest, WsResponse
+from wechatferry_client.wechat import WeChatManager, get_wechat, unknown_account
+
+router = APIRouter()
+
+_outboxes: set[asyncio.Queue] = set()
+"""所有连接的待发送队列"""
+
+
+def _broadcast(event: MessageEvent) -> None:
+    """事件只序列化一次，推送到所有连接，队列已满的连接丢弃该事件"""
+    if not _outboxes:
+        return
+    data = event.json(ensure_ascii=False)
+    for outbox in _outboxes:
+        try:
+            outbox.put_nowait(data)
+        except asyncio.QueueFull:
+            logger.warning("<m>ws_api</m> - <y>发送队列已满，丢弃事件</y>")
+
+
+def subscribe(wechats: list[WeChatManager]) -> None:
+    """
+    说明:
+        订阅所有账号的事件推送给正向websocket连接，在app启动时调用。
+        多个账号共用同一个事件总线时只订阅一次，事件不会重复推送
+
+    参数:
+        * `wechats`：所有账号的管理器
+    """
+    buses: set[int] = set()
+    for wechat in wechats:
+        if id(wechat.event_bus) in buses:
+            continue
+        buses.add(id(wechat.event_bus))
+        wechat.on_event(_broadcast, name="ws_api")
+
+
+async def _sender(websocket: WebSocket, outbox: asyncio.Queue) -> None:
+    """唯一的发送任务，避免多个协程同时写socket"""
+    while True:
+        data = await outbox.get()
+        await websocket.send_text(data)
+
+
+async def _handle(request: WsRequest, outbox: asyncio.Queue) -> None:
+    """处理单个请求，按请求中的 `self_id` 选择账号，响应不会被丢弃"""
+    wechat_client = get_wechat(request.self_id)
+    if wechat_client is None:
+        status, msg = unknown_account()
+        response = WsResponse(status=status, msg=msg, data={}, echo=request.echo)
+    else:
+        response = await wechat_client.handle_ws_api(request)
+    await outbox.put(response.json(ensure_ascii=False))
+
+
+@router.websocket("/ws")
+async def _(websocket: WebSocket) -> None:
+    """websocket api，请求并发处理，响应通过echo对应，同时推送所有账号的消息事件"""
+    await websocket.accept()
+    wechat_client = get_wechat()
+    outbox: asyncio.Queue = asyncio.Queue(maxsize=wechat_client.config.ws_queue_size)
+    sender = asyncio.create_task(_sender(websocket, outbox))
+    tasks: set[asyncio.Task] = set()
+    _outboxes.add(outbox)
+    logger.info(f"<m>ws_api</m> - <g>websocket已连接：</g>{websocket.client}")
+    try:
+        while True:
+            text = await websocket.receive_text()
+            try:
+                request = WsRequest.parse_raw(text)
+            except ValidationError:
+                logger.error("<m>ws_api</m> - <r>请求参数不正确!</r>")
+                response = WsResponse(status=405, msg="请求参数不正确！", data={}, echo="")
+                await outbox.put(response.json(ensure_ascii=False))
+                continue
+            task = asyncio.create_task(_handle(request, outbox))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    except WebSocketDisconnect:
+        logger.info(f"<m>ws_api</m> - <y>websocket已断开：</y>{websocket.client}")
+    finally:
+        _outboxes.discard(outbox)
+        sender.cancel()
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,192 @@
+"""
+图片解密模块，微信保存的 `.dat` 图片是原图逐字节异或同一个key，
+用文件头与JPEG/PNG/GIF的魔数比对即可得到key和格式
+"""
+import asyncio
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from .config import Config
+from .grpc.model import WxMsg
+from .log import logger
+
+MAGICS: tuple[tuple[bytes, str], ...] = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG", ".png"),
+    (b"GIF8", ".gif"),
+)
+"""图片魔数与扩展名"""
+CHUNK_SIZE = 256 * 1024
+"""流式读写块大小"""
+DAT_PATTERN = re.compile(r"(?:[A-Za-z]:)?[\\/][^<>\"'\r\n|?*]*?\.dat\b")
+"""消息中的 `.dat` 路径"""
+
+
+def detect_key(head: bytes) -> Optional[tuple[int, str]]:
+    """
+    说明:
+        通过文件头检测异或key
+
+    参数:
+        * `head`：文件开头至少4个字节
+
+    返回:
+        * `(key, 扩展名)`：无法识别时为空
+    """
+    for magic, ext in MAGICS:
+        if len(head) < len(magic):
+            continue
+        key = head[0] ^ magic[0]
+        if all(head[i] ^ key == magic[i] for i in range(1, len(magic))):
+            return key, ext
+    return None
+
+
+def decode_dat(src: str, dst_dir: str) -> Optional[str]:
+    """
+    说明:
+        解密单个 `.dat` 文件，在进程池中执行，已解密过的直接返回
+
+    参数:
+        * `src`：`.dat` 文件路径
+        * `dst_dir`：输出目录
+
+    返回:
+        * `str`：解密后的图片路径，无法识别格式时为空
+    """
+    with open(src, "rb") as f:
+        head = f.read(CHUNK_SIZE)
+        detected = detect_key(head)
+        if detected is None:
+            return None
+        key, ext = detected
+        dst = Path(dst_dir) / (Path(src).stem + ext)
+        if dst.exists():
+            return str(dst)
+        table = bytes(i ^ key for i in range(256))
+        # 同一文件可能同时被多次解密，各自写入独立的临时文件
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", prefix=dst.name, dir=dst.parent)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                chunk = head
+                while chunk:
+                    out.write(chunk.translate(table))
+                    chunk = f.read(CHUNK_SIZE)
+            os.replace(tmp, dst)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+    return str(dst)
+
+
+def find_dat_path(msg: WxMsg) -> Optional[str]:
+    """
+    说明:
+        从图片消息的 `xml` 或 `content` 中找出 `.dat` 路径
+
+    返回:
+        * `str`：路径，消息中不含路径时为空
+    """
+    for text in (msg.xml, msg.content):
+        match = DAT_PATTERN.search(text or "")
+        if match is not None:
+            return match.group(0)
+    return None
+
+
+class ImageDecoder:
+    """
+    图片解密器
+
+    等待微信把图片下载到本地后，在进程池中流式解密，总耗时不超过 `image_timeout`。
+    """
+
+    path: Path
+    """解密图片保存目录"""
+    timeout: float
+    """等待下载加解密的超时时间(s)"""
+    days: int
+    """解密图片保存天数，为0则不清理"""
+    workers: int
+    """解密进程数"""
+
+    def __init__(self, config: Config) -> None:
+        self.path = Path(config.image_path).resolve()
+        self.timeout = config.image_timeout
+        self.days = config.image_days
+        self.workers = config.image_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def close(self) -> None:
+        """关闭进程池"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def decode(self, src: str) -> Optional[Path]:
+        """
+        说明:
+            等待 `.dat` 文件下载完成并解密
+
+        参数:
+            * `src`：`.dat` 文件路径
+
+        返回:
+            * `Path`：解密后的图片路径，无法识别格式时为空
+
+        异常:
+            * `asyncio.TimeoutError`：超过 `image_timeout`
+        """
+        return await asyncio.wait_for(self._decode(src), self.timeout)
+
+    async def _decode(self, src: str) -> Optional[Path]:
+        await self._wait_for_file(src)
+        if self._pool is None:
+            self.path.mkdir(parents=True, exist_ok=True)
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self._pool, decode_dat, src, str(self.path))
+        return Path(result) if result else None
+
+    async def _wait_for_file(self, src: str) -> None:
+        """等待文件出现且大小不再变化"""
+        last_size = -1
+        while True:
+            try:
+                size = os.path.getsize(src)
+            except OSError:
+                size = -1
+            if size > 0 and size == last_size:
+                return
+            last_size = size
+            await asyncio.sleep(0.05)
+
+    async def cleanup(self) -> None:
+        """
+        说明:
+            删除超过 `image_days` 的解密图片，由定时器每天调用
+        """
+        if self.days <= 0:
+            return
+        removed = await asyncio.to_thread(self._cleanup)
+        if removed:
+            logger.info(f"<m>image_decoder</m> - 已清理 {removed} 张过期图片")
+
+    def _cleanup(self) -> int:
+        expire = time.time() - self.days * 86400
+        removed = 0
+        if not self.path.is_dir():
+            return removed
+        for entry in os.scandir(self.path):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < expire:
+                    os.unlink(entry.path)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
@@ -0,0 +1,158 @@
+"""
+定时任务存储，使用标准库sqlite3实现apscheduler的jobstore，不依赖SQLAlchemy
+"""
+import pickle
+import sqlite3
+from pathlib import Path
+from typing import Optional
+
+from apscheduler.job import Job
+from apscheduler.jobstores.base import BaseJobStore, ConflictingIdError, JobLookupError
+from apscheduler.util import datetime_to_utc_timestamp, utc_timestamp_to_datetime
+
+
+class SqliteJobStore(BaseJobStore):
+    """
+    sqlite任务存储
+
+    任务状态pickle后存入表中，只按 `next_run_time` 索引查询，
+    调度器每次只取出到期的任务，待执行的任务不会常驻内存。
+    """
+
+    path: Path
+    """数据库文件路径"""
+    run_jobs: bool
+    """是否由本进程执行任务，多个进程共用数据库时只有一个进程执行"""
+
+    def __init__(
+        self,
+        path: str,
+        tablename: str = "apscheduler_jobs",
+        pickle_protocol: int = pickle.HIGHEST_PROTOCOL,
+        run_jobs: bool = True,
+    ) -> None:
+        super().__init__()
+        self.path = Path(path)
+        self.run_jobs = run_jobs
+        self.tablename = tablename
+        self.pickle_protocol = pickle_protocol
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def start(self, scheduler, alias) -> None:
+        super().start(scheduler, alias)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(
+            self.path, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.tablename} ("
+            "id TEXT PRIMARY KEY, next_run_time REAL, job_state BLOB NOT NULL)"
+        )
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS ix_{self.tablename}_next_run_time "
+            f"ON {self.tablename} (next_run_time)"
+        )
+
+    def lookup_job(self, job_id: str) -> Optional[Job]:
+        row = self._conn.execute(
+            f"SELECT job_state FROM {self.tablename} WHERE id = ?", (job_id,)
+        ).fetchone()
+        return self._reconstitute_job(row[0]) if row else None
+
+    def get_due_jobs(self, now) -> list[Job]:
+        if not self.run_jobs:
+            return []
+        timestamp = datetime_to_utc_timestamp(now)
+        return self._get_jobs("next_run_time <= ?", (timestamp,))
+
+    def get_next_run_time(self):
+        if not self.run_jobs:
+            return None
+        row = self._conn.execute(
+            f"SELECT next_run_time FROM {self.tablename} "
+            "WHERE next_run_time IS NOT NULL ORDER BY next_run_time LIMIT 1"
+        ).fetchone()
+        return utc_timestamp_to_datetime(row[0]) if row else None
+
+    def get_all_jobs(self) -> list[Job]:
+        jobs = self._get_jobs()
+        self._fix_paused_jobs_sorting(jobs)
+        return jobs
+
+    def add_job(self, job: Job) -> None:
+        try:
+            self._conn.execute(
+                f"INSERT INTO {self.tablename} (id, next_run_time, job_state) "
+                "VALUES (?, ?, ?)",
+                (
+                    job.id,
+                    datetime_to_utc_timestamp(job.next_run_time),
+                    pickle.dumps(job.__getstate__(), self.pickle_protocol),
+                ),
+            )
+        except sqlite3.IntegrityError:
+            raise ConflictingIdError(job.id) from None
+
+    def update_job(self, job: Job) -> None:
+        cursor = self._conn.execute(
+            f"UPDATE {self.tablename} SET next_run_time = ?, job_state = ? "
+            "WHERE id = ?",
+            (
+                datetime_to_utc_timestamp(job.next_run_time),
+                pickle.dumps(job.__getstate__(), self.pickle_protocol),
+                job.id,
+            ),
+        )
+        if cursor.rowcount == 0:
+            raise JobLookupError(job.id)
+
+    def remove_job(self, job_id: str) -> None:
+        cursor = self._conn.execute(
+            f"DELETE FROM {self.tablename} WHERE id = ?", (job_id,)
+        )
+        if cursor.rowcount == 0:
+            raise JobLookupError(job_id)
+
+    def remove_all_jobs(self) -> None:
+        self._conn.execute(f"DELETE FROM {self.tablename}")
+
+    def shutdown(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _reconstitute_job(self, job_state: bytes) -> Job:
+        job_state = pickle.loads(job_state)
+        job_state["jobstore"] = self
+        job = Job.__new__(Job)
+        job.__setstate__(job_state)
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+
+    def _get_jobs(self, where: str = "", args: tuple = ()) -> list[Job]:
+        """读取任务，无法恢复的任务直接删除"""
+        sql = f"SELECT id, job_state FROM {self.tablename}"
+        if where:
+            sql += f" WHERE {where}"
+        sql += " ORDER BY next_run_time IS NULL, next_run_time"
+        jobs = []
+        failed_job_ids = []
+        for job_id, job_state in self._conn.execute(sql, args).fetchall():
+            try:
+                jobs.append(self._reconstitute_job(job_state))
+            except BaseException:
+                self._logger.exception(
+                    f'Unable to restore job "{job_id}" -- removing it'
+                )
+                failed_job_ids.append(job_id)
+        if failed_job_ids:
+            self._conn.executemany(
+                f"DELETE FROM {self.tablename} WHERE id = ?",
+                [(job_id,) for job_id in failed_job_ids],
+            )
+        return jobs
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} (path={self.path})>"
@@ -1,10 +1,18 @@
 """
 日志模块
 """
+import atexit
+import gzip
 import logging
+import os
+import queue
+import shutil
 import sys
+import threading
+import time
+from datetime import date
 from pathlib import Path
-from typing import Union
+from typing import Optional, TextIO, Union
 
 from loguru._logger import Core, Logger
 
@@ -27,15 +35,40 @@ class Filter:
     """过滤器类"""
 
     def __init__(self) -> None:
-        self.level: Union[int, str] = "INFO"
+        self._levels: dict[str, int] = {}
+        self.level = "INFO"
+
+    @property
+    def level(self) -> Union[int, str]:
+        """日志等级，设置时解析为等级数值"""
+        return self._level
+
+    @level.setter
+    def level(self, level: Union[int, str]) -> None:
+        self._level = level
+        self.levelno = self._levelno(level)
+
+    def _levelno(self, level: Union[int, str]) -> int:
+        if not isinstance(level, str):
+            return level
+        no = self._levels.get(level)
+        if no is None:
+            no = self._levels[level] = logger.level(level).no
+        return no
+
+    def enabled(self, level: Union[int, str]) -> bool:
+        """
+        说明:
+            该等级的日志是否会被输出，用于在拼接开销大的日志前提前判断
+
+        参数:
+            * `level`：日志等级
+        """
+        return self._levelno(level) >= self.levelno
 
     def __call__(self, record):
-        module_name: str = record["name"]
-        record["name"] = module_name.split(".")[0]
-        levelno = (
-            logger.level(self.level).no if isinstance(self.level, str) else self.level
-        )
-        return record["level"].no >= levelno
+        record["name"] = record["name"].partition(".")[0]
+        return record["level"].no >= self.levelno
 
 
 default_format: str = (
@@ -65,70 +98,270 @@ class LoguruHandler(logging.Handler):  # pragma: no cover
         )
 
 
+class LogFile:
+    """
+    按天命名的日志文件，写满 `max_size` 后轮转，超过 `days` 天的文件会被删除
+    """
+
+    path: Path
+    """日志目录"""
+    days: int
+    """保存天数"""
+    max_size: int
+    """单个文件大小上限(字节)，为0则只按天轮转"""
+    compression: bool
+    """是否gzip压缩轮转出的文件"""
+
+    def __init__(
+        self, path: Path, days: int, max_size: int, compression: bool
+    ) -> None:
+        self.path = path
+        self.days = days
+        self.max_size = max_size
+        self.compression = compression
+        self._file: Optional[TextIO] = None
+        self._day: Optional[date] = None
+        self._size = 0
+
+    def write(self, day: date, text: str) -> None:
+        """写入一行，由写日志线程调用"""
+        if day != self._day or self._file is None:
+            self._open(day)
+        elif self.max_size and self._size >= self.max_size:
+            self._rotate()
+        self._file.write(text)
+        # 按字符数近似文件大小，省去编码
+        self._size += len(text)
+
+    def flush(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _current(self) -> Path:
+        return self.path / f"{self._day:%Y-%m-%d}.log"
+
+    def _open(self, day: date) -> None:
+        self.close()
+        self._day = day
+        current = self._current()
+        self._file = open(current, "a", encoding="utf-8", buffering=1 << 16)
+        self._size = current.stat().st_size
+        self._cleanup()
+
+    def _rotate(self) -> None:
+        """把当前文件改名为 `日期.序号.log`，按需压缩后重新打开"""
+        self.close()
+        current = self._current()
+        index = 1
+        while True:
+            target = self.path / f"{self._day:%Y-%m-%d}.{index}.log"
+            if not target.exists() and not target.with_suffix(".log.gz").exists():
+                break
+            index += 1
+        os.replace(current, target)
+        if self.compression:
+            with open(target, "rb") as src, gzip.open(f"{target}.gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            target.unlink()
+        self._file = open(current, "a", encoding="utf-8", buffering=1 << 16)
+        self._size = 0
+
+    def _cleanup(self) -> None:
+        if self.days <= 0:
+            return
+        expire = time.time() - self.days * 86400
+        for entry in os.scandir(self.path):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < expire:
+                    os.unlink(entry.path)
+            except OSError:
+                continue
+
+
+class LogWriter:
+    """
+    写日志线程
+
+    loguru的处理器只负责把记录放进队列，格式化和写文件都在后台线程完成。
+    每条记录只格式化一次，再按等级分发到各个文件，每批写完统一flush。
+    """
+
+    batch_size: int = 512
+    """每批最多处理的记录数"""
+
+    def __init__(self) -> None:
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._console: TextIO = _console_stream()
+        self._files: list[tuple[int, bool, LogFile]] = []
+
+    @property
+    def depth(self) -> int:
+        """队列中待写的日志数"""
+        return self._queue.qsize()
+
+    def add_file(self, levelno: int, detail: bool, file: LogFile) -> None:
+        """
+        说明:
+            添加日志文件
+
+        参数:
+            * `levelno`：写入该文件的最低等级
+            * `detail`：是否记录函数名和行号
+            * `file`：日志文件
+        """
+        self._files.append((levelno, detail, file))
+
+    def console(self, message) -> None:
+        """控制台sink，message已由loguru格式化"""
+        self._put((None, str(message)))
+
+    def file(self, message) -> None:
+        """文件sink，只传递记录，在写日志线程中格式化"""
+        self._put((message.record, str(message)))
+
+    def close(self) -> None:
+        """写完队列中剩余的日志后退出线程"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join()
+
+    def _put(self, item) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name="log_writer", daemon=True
+                    )
+                    self._thread.start()
+        self._queue.put(item)
+
+    def _run(self) -> None:
+        running = True
+        while running:
+            items = [self._queue.get()]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for item in items:
+                if item is None:
+                    running = False
+                    continue
+                try:
+                    self._write(*item)
+                except Exception as e:
+                    self._write_console(f"写日志出错：{e}\n")
+            self._write_console("")
+            for _, _, file in self._files:
+                file.flush()
+        for _, _, file in self._files:
+            file.close()
+
+    def _write_console(self, text: str) -> None:
+        """写入控制台并刷新，控制台已关闭时忽略，不影响日志文件"""
+        try:
+            if text:
+                self._console.write(text)
+            self._console.flush()
+        except (OSError, ValueError):
+            pass
+
+    def _write(self, record: Optional[dict], text: str) -> None:
+        if record is None:
+            self._console.write(text)
+            return
+        levelno = record["level"].no
+        head = None
+        detail = None
+        day = record["time"].date()
+        for min_levelno, with_detail, file in self._files:
+            if levelno < min_levelno:
+                continue
+            if with_detail:
+                if detail is None:
+                    detail = (
+                        f"{record['time']:%m-%d %H:%M:%S} [{record['level'].name}] "
+                        f"[{record['name']}] | {record['function']}:{record['line']}| "
+                        f"{text}"
+                    )
+                file.write(day, detail)
+            else:
+                if head is None:
+                    head = (
+                        f"{record['time']:%m-%d %H:%M:%S} [{record['level'].name}] "
+                        f"{record['name']} | {text}"
+                    )
+                file.write(day, head)
+
+
+def _console_stream() -> TextIO:
+    """控制台输出流，windows下用colorama转换颜色"""
+    if sys.platform == "win32":
+        try:
+            from colorama import AnsiToWin32
+
+            return AnsiToWin32(sys.stdout).stream
+        except ImportError:
+            pass
+    return sys.stdout
+
+
 default_filter = Filter()
+log_writer = LogWriter()
+"""写日志线程"""
 logger_id = logger.add(
-    sys.stdout,
+    log_writer.console,
     level=0,
+    colorize=sys.stdout.isatty(),
     diagnose=False,
     filter=default_filter,
     format=default_format,
 )
+atexit.register(log_writer.close)
 
 
-def log_init(log_days: int) -> None:
-    """日志初始化"""
-    Path("./logs/info").mkdir(parents=True, exist_ok=True)
-    Path("./logs/debug").mkdir(parents=True, exist_ok=True)
-    Path("./logs/error").mkdir(parents=True, exist_ok=True)
-    # 日志文件记录格式
-    file_format = (
-        "<g>{time:MM-DD HH:mm:ss}</g> "
-        "[<lvl>{level}</lvl>] "
-        "<c><u>{name}</u></c> | "
-        "{message}"
-    )
-
-    # 错误日志文件记录格式
-    error_format = (
-        "<g>{time:MM-DD HH:mm:ss}</g> "
-        "[<lvl>{level}</lvl>] "
-        "[<c><u>{name}</u></c>] | "
-        "<c>{function}:{line}</c>| "
-        "{message}"
-    )
-
-    # info文件
-    info_path = "./logs/info/"
-    logger.add(
-        info_path + "{time:YYYY-MM-DD}.log",
-        rotation="00:00",
-        retention=f"{log_days} days",
-        level="INFO",
-        format=file_format,
-        filter=default_filter,
-        encoding="utf-8",
-    )
+def log_init(
+    log_days: int,
+    max_size: int = 0,
+    compression: bool = False,
+    root: Path = Path("./logs"),
+) -> None:
+    """
+    说明:
+        日志初始化，info、debug、error三个目录共用一个处理器
 
-    # debug文件
-    debug_path = "./logs/debug/"
+    参数:
+        * `log_days`：日志保存天数
+        * `max_size`：单个日志文件大小上限(MB)，为0则只按天轮转
+        * `compression`：是否压缩轮转出的日志文件
+        * `root`：日志根目录，多个进程不能共用
+    """
+    for name, levelno, detail in (
+        ("info", logger.level("INFO").no, False),
+        ("debug", logger.level("DEBUG").no, False),
+        ("error", logger.level("ERROR").no, True),
+    ):
+        path = root / name
+        path.mkdir(parents=True, exist_ok=True)
+        log_writer.add_file(
+            levelno,
+            detail,
+            LogFile(path, log_days, max_size * 1024 * 1024, compression),
+        )
     logger.add(
-        debug_path + "{time:YYYY-MM-DD}.log",
-        rotation="00:00",
-        retention=f"{log_days} days",
+        log_writer.file,
         level="DEBUG",
-        format=file_format,
-        filter=default_filter,
-        encoding="utf-8",
-    )
-
-    # error文件
-    error_path = "./logs/error/"
-    logger.add(
-        error_path + "{time:YYYY-MM-DD}.log",
-        rotation="00:00",
-        retention=f"{log_days} days",
-        level="ERROR",
-        format=error_format,
         filter=default_filter,
-        encoding="utf-8",
+        format="{message}",
     )
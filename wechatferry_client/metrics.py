@@ -0,0 +1,266 @@
+"""
+指标模块，以Prometheus文本格式输出计数器、直方图和采集时计算的仪表
+
+记录一次只有一次字典查找和几次加法，可以在生产环境常开。
+"""
+from bisect import bisect_left
+from typing import Callable, Iterable, Optional
+
+LabelValues = tuple[str, ...]
+"""标签值，顺序与 `labels` 一致"""
+
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+"""默认直方图分桶上限(s)"""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+    """计数器"""
+
+    name: str
+    """指标名"""
+    help: str
+    """说明"""
+    labels: tuple[str, ...]
+    """标签名"""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, *values: str, amount: float = 1) -> None:
+        """按标签值累加"""
+        self._values[values] = self._values.get(values, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for values, value in list(self._values.items()):
+            yield f"{self.name}{_labels(self.labels, values)} {_number(value)}"
+
+
+class _Buckets:
+    """一组标签值下的直方图数据"""
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int) -> None:
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """直方图，分桶计数在记录时不累积，输出时再求前缀和"""
+
+    name: str
+    """指标名"""
+    help: str
+    """说明"""
+    labels: tuple[str, ...]
+    """标签名"""
+    buckets: tuple[float, ...]
+    """分桶上限，不含+Inf"""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self._values: dict[LabelValues, _Buckets] = {}
+
+    def observe(self, value: float, *values: str) -> None:
+        """按标签值记录一次"""
+        data = self._values.get(values)
+        if data is None:
+            data = self._values[values] = _Buckets(len(self.buckets) + 1)
+        data.counts[bisect_left(self.buckets, value)] += 1
+        data.sum += value
+        data.count += 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for values, data in list(self._values.items()):
+            total = 0
+            for bound, count in zip(self.buckets + (float("inf"),), data.counts):
+                total += count
+                le = _labels(self.labels, values, f'le="{_number(bound)}"')
+                yield f"{self.name}_bucket{le} {total}"
+            labels = _labels(self.labels, values)
+            yield f"{self.name}_sum{labels} {_number(data.sum)}"
+            yield f"{self.name}_count{labels} {data.count}"
+
+
+class Gauge:
+    """仪表，值在采集时由回调函数计算"""
+
+    kind = "gauge"
+    """输出的指标类型"""
+
+    name: str
+    """指标名"""
+    help: str
+    """说明"""
+    labels: tuple[str, ...]
+    """标签名"""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._collectors: list[Callable[[], Iterable[tuple[LabelValues, float]]]] = []
+
+    def collect(
+        self, func: Callable[[], Iterable[tuple[LabelValues, float]]]
+    ) -> None:
+        """
+        说明:
+            添加采集函数
+
+        参数:
+            * `func`：返回 `(标签值, 值)` 序列的函数
+        """
+        self._collectors.append(func)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for func in self._collectors:
+            for values, value in func():
+                yield f"{self.name}{_labels(self.labels, values)} {_number(value)}"
+
+
+class CollectedCounter(Gauge):
+    """计数器，值在采集时由回调函数读取，用于已在别处累计的计数"""
+
+    kind = "counter"
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, object] = {}
+
+    def counter(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: Optional[tuple[float, ...]] = None,
+    ) -> Histogram:
+        return self._register(
+            Histogram(name, help, labels, buckets or DEFAULT_BUCKETS)
+        )
+
+    def gauge(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labels))
+
+    def collected_counter(
+        self, name: str, help: str, labels: tuple[str, ...] = ()
+    ) -> CollectedCounter:
+        return self._register(CollectedCounter(name, help, labels))
+
+    def render(self) -> str:
+        """输出Prometheus文本格式"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        lines.append("")
+        return "\n".join(lines)
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"指标已存在：{metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+
+registry = Registry()
+"""全局指标注册表"""
+
+api_requests = registry.counter(
+    "wcf_api_requests_total", "api调用次数", ("action", "status")
+)
+"""api调用次数，按action和响应状态"""
+api_seconds = registry.histogram(
+    "wcf_api_seconds", "api调用各阶段耗时(s)，stage为validate或total", ("action", "stage")
+)
+"""api调用耗时，按action和阶段"""
+grpc_seconds = registry.histogram(
+    "wcf_grpc_seconds",
+    "grpc请求各阶段耗时(s)，stage为queue、encode、roundtrip、parse或decode",
+    ("func", "stage"),
+)
+"""grpc请求耗时，按Functions名称和阶段"""
+messages = registry.counter(
+    "wcf_messages_total", "收到的消息数，result为accepted或filtered", ("type", "result")
+)
+"""收到的消息数，按WxMsg.type和是否被预过滤"""
+nng_errors = registry.counter(
+    "wcf_nng_errors_total", "nng错误次数，kind为timeout或error", ("socket", "kind")
+)
+"""nng错误次数，按socket和类型"""
+breaker_trips = registry.counter("wcf_breaker_trips_total", "后端熔断次数")
+"""后端熔断次数"""
+queue_depth = registry.gauge(
+    "wcf_queue_depth", "各队列当前积压，多个账号共用的队列self_id为空", ("self_id", "queue")
+)
+"""各队列当前积压，按账号，采集时计算"""
+subscriber_depth = registry.gauge(
+    "wcf_subscriber_depth", "事件订阅者当前积压", ("subscriber",)
+)
+"""事件订阅者当前积压，按订阅者名称，采集时计算"""
+subscriber_lag = registry.gauge(
+    "wcf_subscriber_lag_seconds", "事件订阅者最早未处理事件的等待时间(s)", ("subscriber",)
+)
+"""事件订阅者的滞后时间，按订阅者名称，采集时计算"""
+subscriber_dropped = registry.collected_counter(
+    "wcf_subscriber_dropped_total", "事件订阅者队列已满丢弃的事件数", ("subscriber",)
+)
+"""事件订阅者丢弃的事件数，按订阅者名称，采集时读取"""
@@ -2,6 +2,8 @@ from typing import Any, Optional
 
 from pydantic import BaseModel
 
+from wechatferry_client.grpc.model import WxMsg
+
 
 class Request(BaseModel):
     """api 请求基类"""
@@ -10,6 +12,8 @@ class Request(BaseModel):
     """请求方法"""
     params: Optional[dict]
     """请求参数"""
+    self_id: Optional[str] = None
+    """处理请求的账号，为空则使用默认账号"""
 
 
 class HttpRequest(Request):
@@ -18,6 +22,24 @@ class HttpRequest(Request):
     ...
 
 
+class BatchItem(Request):
+    """批量请求中的单个请求"""
+
+    id: Optional[str] = None
+    """请求标识，原样返回"""
+
+
+class BatchRequest(BaseModel):
+    """批量请求体"""
+
+    requests: list[BatchItem]
+    """请求列表"""
+    stop_on_failure: bool = False
+    """是否在第一个失败后停止，开启后按顺序逐个执行"""
+    stream: bool = False
+    """是否按完成顺序以NDJSON流式返回"""
+
+
 class WsRequest(Request):
     """websocket api 请求"""
 
@@ -47,3 +69,23 @@ class WsResponse(Response):
 
     echo: str
     """echo值"""
+
+
+class BatchResult(Response):
+    """批量请求中单个请求的结果"""
+
+    id: Optional[str] = None
+    """请求标识"""
+
+
+class MessageEvent(BaseModel):
+    """消息事件"""
+
+    self_id: str
+    """收到消息的微信id"""
+    time: int
+    """收到消息的时间戳"""
+    message: WxMsg
+    """消息内容"""
+    image: Optional[str] = None
+    """解密后的图片路径，只有开启 `image_decode` 的图片消息才有"""
@@ -0,0 +1,411 @@
+"""
+消息存储模块，按段追加写入收到的消息，支持按消息id、时间或序号回放
+
+记录格式(小端)：长度(u32，不含头部)、时间(i64)、id长度(u16)、id(utf-8)、`wcf_pb2.WxMsg` 数据。
+每个段文件名为首条记录的序号，同名的 `.idx` 文件为稀疏索引，
+每 `msg_store_index_interval` 条记录一项：序号(u64)、时间(i64)、文件偏移(u64)。
+同名的 `.ids` 文件为消息id索引，每条记录一项：序号(u64)、id长度(u16)、id(utf-8)。
+"""
+import mmap
+import struct
+import threading
+from pathlib import Path
+from typing import Iterator, Optional
+
+from .config import Config
+from .grpc import wcf_pb2
+from .grpc.codec import decode_wxmsg
+from .log import logger
+from .model import MessageEvent
+
+HEADER = struct.Struct("<IqH")
+"""记录头部"""
+INDEX = struct.Struct("<QqQ")
+"""索引项"""
+ID_INDEX = struct.Struct("<QH")
+"""消息id索引项头部"""
+
+
+class Segment:
+    """
+    单个段文件
+    """
+
+    base: int
+    """首条记录序号"""
+    path: Path
+    """段文件路径"""
+    index: list[tuple[int, int, int]]
+    """稀疏索引：(序号, 时间, 偏移)"""
+    ids: dict[bytes, int]
+    """消息id索引：id -> 序号，id重复时为最新的序号"""
+    count: int
+    """记录数"""
+    size: int
+    """文件大小"""
+    readers: int
+    """正在读取该段的回放数"""
+    removed: bool
+    """已超出保留数，等回放读完后删除"""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.base = int(path.stem)
+        self.index = []
+        self.ids = {}
+        self.count = 0
+        self.size = 0
+        self.readers = 0
+        self.removed = False
+
+    @property
+    def index_path(self) -> Path:
+        return self.path.with_suffix(".idx")
+
+    @property
+    def ids_path(self) -> Path:
+        return self.path.with_suffix(".ids")
+
+    def unlink(self) -> None:
+        """删除段文件和两个索引"""
+        self.path.unlink(missing_ok=True)
+        self.index_path.unlink(missing_ok=True)
+        self.ids_path.unlink(missing_ok=True)
+        logger.debug(f"<m>msg_store</m> - 删除旧段 {self.path.name}")
+
+    def load(self, interval: int) -> None:
+        """读取两个索引，并从最后一个稀疏索引项扫描出记录数，补全缺失的索引项"""
+        if self.index_path.exists():
+            data = self.index_path.read_bytes()
+            usable = len(data) - len(data) % INDEX.size
+            self.index = [item for item in INDEX.iter_unpack(data[:usable])]
+        indexed = self._load_ids()
+        start_seq, offset = self.base, 0
+        # id索引落后于稀疏索引时(如旧版本的数据)从头扫描
+        if self.index and indexed >= self.index[-1][0]:
+            start_seq, _, offset = self.index[-1]
+        self.count = start_seq - self.base
+        self.size = offset
+        for seq, time, msg_id, end, _ in self.scan(offset):
+            if (seq - self.base) % interval == 0 and (
+                not self.index or self.index[-1][0] < seq
+            ):
+                self.index.append((seq, time, self.size))
+            if seq >= indexed:
+                self.ids[msg_id] = seq
+            self.count += 1
+            self.size = end
+        # 索引项可能超出截断后的记录，只保留有效的部分
+        last_seq = self.base + self.count
+        self.ids = {msg_id: seq for msg_id, seq in self.ids.items() if seq < last_seq}
+        self.index_path.write_bytes(b"".join(INDEX.pack(*i) for i in self.index))
+        self.ids_path.write_bytes(
+            b"".join(pack_id(seq, msg_id) for msg_id, seq in self.ids.items())
+        )
+
+    def _load_ids(self) -> int:
+        """
+        读取消息id索引，末尾未写完整的项丢弃
+
+        返回:
+            * `int`：已索引的下一条序号，之后的记录需要扫描补全
+        """
+        if not self.ids_path.exists():
+            return self.base
+        data = self.ids_path.read_bytes()
+        offset, indexed = 0, self.base
+        while offset + ID_INDEX.size <= len(data):
+            seq, id_len = ID_INDEX.unpack_from(data, offset)
+            start = offset + ID_INDEX.size
+            if start + id_len > len(data):
+                break
+            self.ids[data[start : start + id_len]] = seq
+            indexed = max(indexed, seq + 1)
+            offset = start + id_len
+        return indexed
+
+    def scan(
+        self, offset: int = 0, with_data: bool = False
+    ) -> Iterator[tuple[int, int, bytes, int, Optional[bytes]]]:
+        """
+        从指定偏移开始通过mmap逐条读取，只有 `with_data` 时才复制消息数据
+
+        返回:
+            * `(序号, 时间, id, 下一条偏移, 数据)`
+        """
+        if not self.path.exists() or self.path.stat().st_size <= offset:
+            return
+        with open(self.path, "rb") as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+        ) as mm:
+            seq = self._seq_at(offset)
+            end = len(mm)
+            while offset + HEADER.size <= end:
+                length, time, id_len = HEADER.unpack_from(mm, offset)
+                start = offset + HEADER.size
+                if start + id_len + length > end:
+                    # 未写完整的记录
+                    break
+                msg_id = mm[start : start + id_len]
+                data_start = start + id_len
+                offset = data_start + length
+                data = mm[data_start:offset] if with_data else None
+                yield seq, time, msg_id, offset, data
+                seq += 1
+
+    def _seq_at(self, offset: int) -> int:
+        """偏移对应的序号，偏移必须是索引项或0"""
+        for seq, _, item_offset in reversed(self.index):
+            if item_offset == offset:
+                return seq
+        return self.base
+
+
+class MsgStore:
+    """
+    消息存储
+
+    只追加写入，超过段大小后切换新段，超过保留数后删除最旧的段，正在回放的段读完后再删除。
+    写入每 `flush_records` 条刷新一次，其余由 `flush` 定时刷新，回放前也会先刷新。
+    回放时从稀疏索引定位偏移，再通过mmap顺序读取；按消息id回放时先从id索引查出序号。
+    """
+
+    path: Path
+    """存储目录"""
+    segment_size: int
+    """段大小上限(字节)"""
+    keep_segments: int
+    """保留的段数"""
+    index_interval: int
+    """稀疏索引间隔"""
+    flush_records: int
+    """写入多少条后刷新到磁盘"""
+    segments: list[Segment]
+    """所有段，按序号排列"""
+
+    def __init__(self, config: Config, path: Optional[Path] = None) -> None:
+        self.path = path or Path(config.msg_store_path)
+        self.segment_size = config.msg_store_segment_size
+        self.keep_segments = config.msg_store_keep_segments
+        self.index_interval = config.msg_store_index_interval
+        self.flush_records = max(config.msg_store_flush_records, 1)
+        self.segments = []
+        self._unflushed = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._index_file = None
+        self._ids_file = None
+
+    @property
+    def next_seq(self) -> int:
+        """下一条记录的序号"""
+        if not self.segments:
+            return 0
+        last = self.segments[-1]
+        return last.base + last.count
+
+    def open(self) -> None:
+        """
+        打开存储目录，恢复已有的段
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.segments = sorted(
+            (Segment(p) for p in self.path.glob("*.seg")), key=lambda s: s.base
+        )
+        for segment in self.segments:
+            segment.load(self.index_interval)
+        if not self.segments:
+            self._new_segment()
+        else:
+            self._open_last()
+            self._trim()
+        logger.success(
+            f"<m>msg_store</m> - <g>消息存储已开启，共 {len(self.segments)} 段，"
+            f"下一序号 {self.next_seq}</g>"
+        )
+
+    def close(self) -> None:
+        """关闭文件"""
+        if self._file is not None:
+            self._file.close()
+            self._index_file.close()
+            self._ids_file.close()
+            self._file = None
+            self._index_file = None
+            self._ids_file = None
+
+    def append(self, event: MessageEvent) -> int:
+        """
+        说明:
+            追加一条消息
+
+        参数:
+            * `event`：消息事件
+
+        返回:
+            * `int`：记录序号
+        """
+        message = event.message
+        data = wcf_pb2.WxMsg(**message.dict()).SerializeToString()
+        msg_id = message.id.encode("utf-8")
+        segment = self.segments[-1]
+        if segment.size >= self.segment_size:
+            self._new_segment()
+            segment = self.segments[-1]
+        seq = segment.base + segment.count
+        if segment.count % self.index_interval == 0:
+            item = (seq, event.time, segment.size)
+            segment.index.append(item)
+            self._index_file.write(INDEX.pack(*item))
+        record = HEADER.pack(len(data), event.time, len(msg_id)) + msg_id + data
+        self._file.write(record)
+        self._ids_file.write(pack_id(seq, msg_id))
+        segment.ids[msg_id] = seq
+        segment.count += 1
+        segment.size += len(record)
+        self._unflushed += 1
+        if self._unflushed >= self.flush_records:
+            self.flush()
+        return seq
+
+    def flush(self) -> None:
+        """
+        说明:
+            把缓冲中的记录和索引刷新到磁盘，先刷新记录，索引不会指向未写入的记录。
+            可以在其他线程中定时调用，文件已关闭时忽略
+        """
+        files = (self._file, self._index_file, self._ids_file)
+        self._unflushed = 0
+        try:
+            for file in files:
+                if file is not None:
+                    file.flush()
+        except ValueError:
+            # 切换段时文件已关闭，关闭时已经刷新
+            pass
+
+    def find_seq(self, msg_id: str) -> Optional[int]:
+        """
+        说明:
+            通过消息id查找序号，从最新的段向前查找消息id索引
+
+        参数:
+            * `msg_id`：消息id
+        """
+        target = msg_id.encode("utf-8")
+        for segment in reversed(list(self.segments)):
+            seq = segment.ids.get(target)
+            if seq is not None:
+                return seq
+        return None
+
+    def replay(
+        self,
+        after_seq: Optional[int] = None,
+        since_time: Optional[int] = None,
+        limit: int = 100,
+    ) -> list[tuple[int, int, wcf_pb2.WxMsg]]:
+        """
+        说明:
+            回放消息，先刷新缓冲中的记录，需要读取文件，在事件循环中应通过 `asyncio.to_thread` 调用
+
+        参数:
+            * `after_seq`：从该序号之后开始
+            * `since_time`：从该时间(含)开始
+            * `limit`：最多返回条数
+
+        返回:
+            * `list[(序号, 时间, wcf_pb2.WxMsg)]`
+        """
+        self.flush()
+        results: list[tuple[int, int, wcf_pb2.WxMsg]] = []
+        segments = self._acquire()
+        try:
+            for segment in segments:
+                if not segment.count:
+                    continue
+                last_seq = segment.base + segment.count - 1
+                if after_seq is not None and last_seq <= after_seq:
+                    continue
+                offset = self._seek(segment, after_seq, since_time)
+                for seq, time, _, _, data in segment.scan(offset, with_data=True):
+                    if after_seq is not None and seq <= after_seq:
+                        continue
+                    if since_time is not None and time < since_time:
+                        continue
+                    msg = wcf_pb2.WxMsg()
+                    msg.ParseFromString(data)
+                    results.append((seq, time, msg))
+                    if len(results) >= limit:
+                        return results
+            return results
+        finally:
+            self._release(segments)
+
+    def _acquire(self) -> list[Segment]:
+        """回放开始时占用当前所有段，期间被淘汰的段不会删除"""
+        with self._lock:
+            segments = list(self.segments)
+            for segment in segments:
+                segment.readers += 1
+        return segments
+
+    def _release(self, segments: list[Segment]) -> None:
+        """回放结束，删除已淘汰且没有其他回放的段"""
+        with self._lock:
+            for segment in segments:
+                segment.readers -= 1
+                if segment.removed and segment.readers == 0:
+                    segment.unlink()
+
+    def _seek(
+        self, segment: Segment, after_seq: Optional[int], since_time: Optional[int]
+    ) -> int:
+        """通过稀疏索引找到起始偏移"""
+        offset = 0
+        if after_seq is None and since_time is None:
+            return offset
+        for seq, time, item_offset in segment.index:
+            if after_seq is not None and seq > after_seq:
+                break
+            if since_time is not None and time >= since_time:
+                break
+            offset = item_offset
+        return offset
+
+    def _new_segment(self) -> None:
+        """切换到新段"""
+        segment = Segment(self.path / f"{self.next_seq:020d}.seg")
+        self.segments.append(segment)
+        self._open_last()
+        self._trim()
+
+    def _trim(self) -> None:
+        """淘汰超出保留数的旧段，没有回放在读取时立即删除"""
+        with self._lock:
+            while len(self.segments) > self.keep_segments:
+                old = self.segments.pop(0)
+                # Windows上无法删除正在mmap的文件，由最后一个回放删除
+                old.removed = True
+                if old.readers == 0:
+                    old.unlink()
+
+    def _open_last(self) -> None:
+        """以追加方式打开最后一段"""
+        self.close()
+        segment = self.segments[-1]
+        self._file = open(segment.path, "ab")
+        # 截掉未写完整的记录
+        self._file.truncate(segment.size)
+        self._index_file = open(segment.index_path, "ab")
+        self._ids_file = open(segment.ids_path, "ab")
+
+
+def pack_id(seq: int, msg_id: bytes) -> bytes:
+    """打包一个消息id索引项"""
+    return ID_INDEX.pack(seq, len(msg_id)) + msg_id
+
+
+def wxmsg_to_dict(msg: wcf_pb2.WxMsg) -> dict:
+    """回放结果转为dict"""
+    return decode_wxmsg(msg).dict()
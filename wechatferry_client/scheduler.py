@@ -1,18 +1,85 @@
 """
 定时器模块
 """
+import asyncio
+from typing import Optional, Union
+
+from apscheduler.events import EVENT_JOB_ADDED, EVENT_JOB_MODIFIED, JobEvent
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from pynng import Pull0, Push0
+from pynng.exceptions import Closed, NNGException
 
 from .config import Config
+from .job_store import SqliteJobStore
 from .log import logger
 
 scheduler = AsyncIOScheduler(timezone="Asia/Shanghai")
 
+SEND_JOBSTORE = "sends"
+"""定时发送任务使用的持久化存储"""
+
+
+_Notify: Optional[Union[Pull0, Push0]] = None
+"""多个工作进程共用定时任务数据库时，通知执行进程有任务变化的socket"""
+_NotifyTask: Optional[asyncio.Task] = None
+
+
+def _notify_leader(event: JobEvent) -> None:
+    """其他进程添加或修改定时发送任务后通知执行进程，执行进程不在时忽略"""
+    if event.jobstore != SEND_JOBSTORE or _Notify is None:
+        return
+    try:
+        _Notify.send(b"", block=False)
+    except NNGException:
+        logger.debug("<m>scheduler</m> - <y>执行定时发送的进程未连接...</y>")
+
+
+async def _wait_notify(socket: Pull0) -> None:
+    """执行进程收到通知后唤醒定时器，重新检查到期时间"""
+    while True:
+        try:
+            await socket.arecv()
+        except Closed:
+            return
+        except NNGException as e:
+            logger.error(f"<m>scheduler</m> - <r>接收任务通知出错：{e}</r>")
+            await asyncio.sleep(1)
+            continue
+        scheduler.wakeup()
+
+
+def _init_notify(config: Config, leader: bool) -> None:
+    """连接任务通知socket，执行进程监听，其他进程按需重连"""
+    global _Notify, _NotifyTask
+    address = f"{config.broker_address}_jobs"
+    if leader:
+        socket = Pull0()
+        socket.listen(address)
+        _NotifyTask = asyncio.create_task(_wait_notify(socket))
+    else:
+        socket = Push0()
+        socket.dial(address, block=False)
+        scheduler.add_listener(_notify_leader, EVENT_JOB_ADDED | EVENT_JOB_MODIFIED)
+    _Notify = socket
+
+
+def scheduler_init(config: Config, leader: Optional[bool] = None) -> None:
+    """
+    说明:
+        定时器初始化
 
-def scheduler_init(config: Config) -> None:
-    """定时器初始化"""
+    参数:
+        * `leader`：多个工作进程共用定时任务数据库时，本进程是否执行定时发送，为空则不共用
+    """
     global scheduler
     if not scheduler.running:
+        scheduler.add_jobstore(
+            SqliteJobStore(config.job_store_path, run_jobs=leader is not False),
+            SEND_JOBSTORE,
+        )
+        if leader is not None:
+            # 其他进程添加的任务不会唤醒执行进程的定时器，需要显式通知
+            _init_notify(config, leader)
         scheduler.start()
         # scheduler.add_job(
         #     partial(scheduler_job, config), trigger="cron", hour=0, minute=0
@@ -25,7 +92,14 @@ def scheduler_init(config: Config) -> None:
 
 def scheduler_shutdown() -> None:
     """定时器关闭"""
+    global _Notify, _NotifyTask
     logger.info("<m>scheduler</m> - 正在关闭定时器...")
+    if _Notify is not None:
+        _Notify.close()
+        _Notify = None
+    if _NotifyTask is not None:
+        _NotifyTask.cancel()
+        _NotifyTask = None
     if scheduler.running:
         scheduler.shutdown(wait=False)
     logger.success("<m>scheduler</m> - <g>定时器关闭成功...</g>")
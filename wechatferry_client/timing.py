@@ -0,0 +1,142 @@
+"""
+单次请求计时模块，记录各阶段耗时用于 `Server-Timing` 响应头，并对慢请求采样分析
+
+阶段耗时保存在上下文变量里；跨任务执行的发送调度器和请求调度器在入队时取出当前的记录，
+在自己的任务中继续写入。
+"""
+import asyncio
+import cProfile
+import random
+import re
+import time
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+
+from .config import Config
+from .log import logger
+
+Phases = dict[str, float]
+"""阶段名到耗时(s)"""
+
+_current: ContextVar[Optional[Phases]] = ContextVar("request_timing", default=None)
+
+
+def start() -> Phases:
+    """开始记录当前请求，返回阶段耗时字典"""
+    phases: Phases = {}
+    _current.set(phases)
+    return phases
+
+
+def current() -> Optional[Phases]:
+    """当前请求的阶段耗时，不在请求中时为空"""
+    return _current.get()
+
+
+def bind(phases: Optional[Phases]) -> None:
+    """在其他任务中继续写入入队时的记录"""
+    _current.set(phases)
+
+
+def record(phases: Optional[Phases], name: str, seconds: float) -> None:
+    """
+    说明:
+        累加一个阶段的耗时，`phases` 为空时什么都不做
+
+    参数:
+        * `phases`：阶段耗时字典
+        * `name`：阶段名
+        * `seconds`：耗时(s)
+    """
+    if phases is not None:
+        phases[name] = phases.get(name, 0.0) + seconds
+
+
+def server_timing(phases: Phases) -> str:
+    """生成 `Server-Timing` 响应头，耗时单位为ms"""
+    return ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in phases.items())
+
+
+class Profiler:
+    """
+    慢请求采样分析
+
+    按 `profile_rate` 抽样开启cProfile，请求耗时超过 `profile_threshold` 时把结果写入
+    `profile_path`，可用 `pstats` 或 `snakeviz` 离线查看。cProfile作用于整个事件循环线程，
+    结果中会包含同时段其他协程的调用，同一时间只分析一个请求。
+    """
+
+    rate: float
+    """抽样比例，为0则关闭"""
+    threshold: float
+    """写入结果的耗时下限(s)"""
+    path: Path
+    """结果保存目录"""
+
+    def __init__(self) -> None:
+        self.rate = 0
+        self.threshold = 1
+        self.path = Path("./profile")
+        self._active = False
+
+    def init(self, config: Config) -> None:
+        """读取设置"""
+        self.rate = config.profile_rate
+        self.threshold = config.profile_threshold
+        self.path = Path(config.profile_path)
+
+    def start(self) -> Optional[cProfile.Profile]:
+        """
+        说明:
+            抽中时开始分析
+
+        返回:
+            * `cProfile.Profile`：分析器，未抽中或已有请求在分析时为空
+        """
+        if self.rate <= 0 or self._active or random.random() >= self.rate:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            return None
+        self._active = True
+        return profile
+
+    async def finish(
+        self, profile: Optional[cProfile.Profile], elapsed: float, name: str
+    ) -> None:
+        """
+        说明:
+            结束分析，耗时超过阈值时在线程中写入结果
+
+        参数:
+            * `profile`：`start` 返回的分析器
+            * `elapsed`：请求耗时(s)
+            * `name`：请求名称，用于文件名
+        """
+        if profile is None:
+            return
+        profile.disable()
+        self._active = False
+        if elapsed < self.threshold:
+            return
+        name = re.sub(r"[^\w.-]", "_", name)[:64]
+        path = self.path / (
+            f"{time.strftime('%Y%m%d-%H%M%S')}_{name}_{int(elapsed * 1000)}ms.prof"
+        )
+        try:
+            await asyncio.to_thread(self._dump, profile, path)
+        except OSError as e:
+            logger.error(f"<r>写入分析结果出错：{e}</r>")
+            return
+        logger.info(f"<m>profiler</m> - 慢请求 {name} 耗时 {elapsed:.3f}s，分析结果：{path}")
+
+    def _dump(self, profile: cProfile.Profile, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        profile.dump_stats(path)
+
+
+profiler = Profiler()
+"""全局慢请求分析器"""
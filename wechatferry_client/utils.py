@@ -2,6 +2,17 @@
 工具模块
 """
 import re
+import reprlib
+from typing import Any
+
+_TAG_PATTERN = re.compile(r"</?((?:[fb]g\s)?[^<>\s]*)>")
+
+_preview_repr = reprlib.Repr()
+_preview_repr.maxlevel = 3
+_preview_repr.maxdict = 8
+_preview_repr.maxlist = 8
+_preview_repr.maxstring = 200
+_preview_repr.maxother = 200
 
 
 def escape_tag(s: str) -> str:
@@ -12,4 +23,15 @@ def escape_tag(s: str) -> str:
     参数:
         s: 需要转义的字符串
     """
-    return re.sub(r"</?((?:[fb]g\s)?[^<>\s]*)>", r"\\\g<0>", s)
+    return _TAG_PATTERN.sub(r"\\\g<0>", s)
+
+
+def preview(obj: Any) -> str:
+    """生成限制长度的对象预览，用于记录日志
+
+    容器只展开前几项，长字符串会被截断，不会先生成完整的字符串
+
+    参数:
+        obj: 需要预览的对象
+    """
+    return _preview_repr.repr(obj)
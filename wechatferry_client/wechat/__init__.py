@@ -1,16 +1,103 @@
 """
 微信客户端抽象，整合各种请求需求
 """
+import asyncio
+from typing import Optional
+
+from wechatferry_client.config import Config
+from wechatferry_client.grpc.broker import broker_account
+from wechatferry_client.log import logger
+
 from .wechat import WeChatManager as WeChatManager
 
 _WeChat = WeChatManager()
-"""微信管理器"""
+"""微信管理器，默认账号"""
+
+_wechats: list[WeChatManager] = []
+"""所有账号的管理器，默认账号在最前"""
+
+_accounts: dict[str, WeChatManager] = {}
+"""已就绪账号的管理器，按self_id索引"""
+
+
+def init_wechats(config: Config, broker: bool = False) -> list[WeChatManager]:
+    """
+    说明:
+        初始化默认账号和 `accounts` 中的其他账号，不连接后端，需要在uvicorn.run之前执行
+
+    参数:
+        * `config`：应用设置
+        * `broker`：是否经由主进程的broker连接各账号，工作进程中为真
+
+    返回:
+        * `list[WeChatManager]`：所有账号的管理器，默认账号在最前
+    """
+    _WeChat.init(config, broker_account(config, 0) if broker else None)
+    _wechats.append(_WeChat)
+    for index, account in enumerate(config.accounts, 1):
+        if broker:
+            account = broker_account(config, index)
+        wechat = WeChatManager(event_bus=_WeChat.event_bus)
+        wechat.init(config, account, primary=_WeChat)
+        _wechats.append(wechat)
+    return get_wechats()
+
+
+async def start_wechats() -> None:
+    """
+    说明:
+        并发启动所有账号，每个账号就绪后即可按self_id访问
+
+    异常:
+        * `ValueError`：两个账号登录的是同一个微信
+    """
+
+    async def start(wechat: WeChatManager) -> None:
+        await wechat.start()
+        if wechat.self_id in _accounts:
+            raise ValueError(f"账号重复：{wechat.self_id}")
+        _accounts[wechat.self_id] = wechat
+        logger.success(f"<g>账号已就绪：{wechat.self_id}</g>")
+
+    await asyncio.gather(*(start(wechat) for wechat in _wechats))
 
 
-def get_wechat() -> WeChatManager:
+def get_wechat(self_id: Optional[str] = None) -> Optional[WeChatManager]:
     """
-    获取wechat管理器
+    说明:
+        获取wechat管理器
+
+    参数:
+        * `self_id`：账号的微信id，为空则返回默认账号
+
+    返回:
+        * `WeChatManager`：管理器，账号不存在或尚未取得self_id时为空
     """
     if _WeChat is None:
         raise ValueError("wechat管理端尚未初始化...")
-    return _WeChat
+    if not self_id:
+        return _WeChat
+    wechat = _accounts.get(self_id)
+    if wechat is None:
+        # 已取得self_id但还在加载的账号
+        wechat = next((w for w in _wechats if w.self_id == self_id), None)
+    return wechat
+
+
+def unknown_account() -> tuple[int, str]:
+    """
+    说明:
+        `self_id` 找不到账号时的状态码和说明。
+        还有账号未就绪时，该self_id可能属于它，返回503让调用方稍后重试
+
+    返回:
+        * `(状态码, 说明)`
+    """
+    if all(wechat.ready for wechat in _wechats):
+        return 404, "账号不存在"
+    return 503, "微信尚未就绪，请稍后再试"
+
+
+def get_wechats() -> list[WeChatManager]:
+    """获取所有账号的管理器，包括尚未就绪的"""
+    return list(_wechats)
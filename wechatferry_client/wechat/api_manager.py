@@ -1,10 +1,22 @@
+import asyncio
 from enum import Enum
+from typing import Union
+
+from google.protobuf.message import Message
 
 from wechatferry_client.cmd import uninstall
+from wechatferry_client.config import AccountConfig, Config
 from wechatferry_client.grpc import GrpcManager
-from wechatferry_client.grpc.model import Functions, Request
+from wechatferry_client.grpc.model import Functions, Request, Response
 from wechatferry_client.log import logger
 
+from .send_scheduler import Lane, SendScheduler
+
+LOGIN_POLL_MIN = 0.2
+"""登录状态首次轮询间隔(s)，之后每次翻倍"""
+LOGIN_POLL_MAX = 2
+"""登录状态最长轮询间隔(s)"""
+
 
 class Action(str, Enum):
     """
@@ -29,6 +41,41 @@ class Action(str, Enum):
     """接受好友请求"""
     FUNC_ADD_ROOM_MEMBERS = "add_room_members"
     """拉好友进群"""
+    FUNC_EXEC_DB_QUERY = "exec_db_query"
+    """执行数据库查询"""
+    CACHE_GET_CONTACT = "get_contact"
+    """从缓存获取单个联系人，参数为wxid或code"""
+    CACHE_FIND_CONTACTS = "find_contacts"
+    """从缓存按昵称查找联系人"""
+    CACHE_GET_CONTACTS = "get_cached_contacts"
+    """从缓存获取所有联系人"""
+    STORE_REPLAY_MSGS = "replay_msgs"
+    """从消息存储回放消息，参数为after_id、after_seq或since_time"""
+    SCHED_GET_STATS = "get_send_stats"
+    """获取发送调度器的排队情况"""
+    JOB_ADD = "add_job"
+    """添加定时任务，到期后执行指定的action"""
+    JOB_GET_LIST = "get_jobs"
+    """获取所有定时任务"""
+    JOB_REMOVE = "remove_job"
+    """删除定时任务"""
+
+    @property
+    def is_send(self) -> bool:
+        """是否为发送消息，发送消息需要限速"""
+        return self in (
+            Action.FUNC_SEND_TXT,
+            Action.FUNC_SEND_IMG,
+            Action.FUNC_SEND_FILE,
+            Action.FUNC_SEND_XML,
+        )
+
+    @property
+    def default_lane(self) -> Lane:
+        """未指定通道时使用的优先级通道"""
+        if self == Action.FUNC_EXEC_DB_QUERY:
+            return "query"
+        return "interactive"
 
     def action_to_function(self) -> Functions:
         """
@@ -48,49 +95,100 @@ class ApiManager:
     """
     grpc通信管理器
     """
+    scheduler: SendScheduler
+    """
+    发送调度器
+    """
+    inject: bool
+    """
+    是否由本程序注入微信，关闭时需要卸载注入
+    """
 
     def __init__(self) -> None:
         self.grpc = GrpcManager()
+        self.scheduler = SendScheduler(self.grpc)
+        self.inject = True
 
-    def init(self) -> None:
+    def init(self, config: Config, account: AccountConfig) -> None:
         """
-        初始化grpc
+        初始化grpc设置，连接由 `WeChatManager.start` 发起
         """
-        self.grpc.init()
-        if not self.check_is_login():
-            logger.info("<r>微信未登录，请登陆后操作</r>")
-            result = self.grpc.wait_for_login()
-            if not result:
-                logger.info("<g>进程退出...</g>")
-                self.close()
-                exit(0)
-        logger.info("<g>微信已登录，出发...</g>")
+        self.inject = account.inject
+        self.grpc.init(config, account)
+        self.scheduler.init(config)
+
+    async def wait_for_login(self) -> None:
+        """
+        说明:
+            按退避间隔轮询登录状态直到登录，后端暂时无法应答时继续轮询
+        """
+        delay = LOGIN_POLL_MIN
+        notified = False
+        while True:
+            try:
+                if await self.check_is_login():
+                    return
+                if not notified:
+                    logger.info("<r>微信未登录，请登陆后操作</r>")
+                    notified = True
+            except Exception as e:
+                logger.debug(f"<y>查询登录状态失败：{e}</y>")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, LOGIN_POLL_MAX)
 
     def close(self) -> None:
         """
         关闭
         """
+        self.scheduler.stop()
         self.grpc.close()
-        uninstall("./wcf.exe")
+        if self.inject:
+            uninstall("./wcf.exe")
 
-    def connect_msg_socket(self) -> bool:
+    async def connect_msg_socket(self) -> None:
         """
-        连接到接收socket
+        连接到接收socket，失败时重试直到成功
         """
-        return self.grpc.connect_msg_socket()
+        await self.grpc.connect_msg_socket()
 
-    def get_wxid(self) -> str:
+    async def request(
+        self, request: Request, lane: Lane, raw: bool = False
+    ) -> Union[Response, Message]:
+        """
+        说明:
+            经由发送调度器调用api，发送消息按接收人限速
+
+        参数:
+            * `request`：grpc请求
+            * `lane`：优先级通道
+            * `raw`：是否直接返回 `wcf_pb2.Response`
+        """
+        receiver = None
+        for msg in (request.txt, request.file, request.xml):
+            if msg is not None:
+                receiver = msg.receiver
+        return await self.scheduler.submit(request, lane, receiver, raw)
+
+    async def get_wxid(self) -> str:
         """
         获取wxid
         """
         request = Request(func=Functions.FUNC_GET_SELF_WXID)
-        result = self.grpc.request_sync(request)
+        result = await self.grpc.request(request)
         return result.string
 
-    def check_is_login(self) -> bool:
+    async def get_msg_types(self) -> dict[int, str]:
+        """
+        获取消息类型表
+        """
+        request = Request(func=Functions.FUNC_GET_MSG_TYPES)
+        result = await self.grpc.request_raw(request)
+        return dict(result.types.types)
+
+    async def check_is_login(self) -> bool:
         """
         检测是否登录
         """
         request = Request(func=Functions.FUNC_IS_LOGIN)
-        result = self.grpc.request_sync(request)
+        result = await self.grpc.request(request)
         return result.status == 1
@@ -0,0 +1,106 @@
+"""
+联系人缓存，按wxid、微信号、昵称建立索引，定时增量刷新
+"""
+from typing import Optional
+
+from wechatferry_client.grpc import GrpcManager
+from wechatferry_client.grpc.model import Functions, Request, Response, RpcContact
+from wechatferry_client.log import logger
+
+
+class ContactCache:
+    """
+    联系人缓存
+    """
+
+    grpc: GrpcManager
+    """grpc通信管理器"""
+    by_wxid: dict[str, RpcContact]
+    """wxid索引"""
+    by_code: dict[str, str]
+    """微信号 -> wxid"""
+    by_name: dict[str, set[str]]
+    """昵称 -> wxid集合，昵称可能重复"""
+
+    def __init__(self, grpc: GrpcManager) -> None:
+        self.grpc = grpc
+        self.by_wxid = {}
+        self.by_code = {}
+        self.by_name = {}
+
+    @property
+    def ready(self) -> bool:
+        """缓存是否已加载"""
+        return bool(self.by_wxid)
+
+    async def refresh(self) -> None:
+        """
+        异步刷新联系人，启动时加载和定时器调用，失败时保留当前缓存
+        """
+        request = Request(func=Functions.FUNC_GET_CONTACTS)
+        try:
+            result = await self.grpc.request(request)
+        except Exception as e:
+            logger.error(f"<m>contact_cache</m> - <r>刷新联系人失败：{e}</r>")
+            return
+        self._update(result)
+
+    def get(self, wxid: str) -> Optional[RpcContact]:
+        """通过wxid获取联系人"""
+        return self.by_wxid.get(wxid)
+
+    def get_by_code(self, code: str) -> Optional[RpcContact]:
+        """通过微信号获取联系人"""
+        wxid = self.by_code.get(code)
+        return self.by_wxid.get(wxid) if wxid is not None else None
+
+    def find_by_name(self, name: str) -> list[RpcContact]:
+        """通过昵称查找联系人"""
+        return [self.by_wxid[wxid] for wxid in self.by_name.get(name, ())]
+
+    def all(self) -> list[RpcContact]:
+        """所有联系人"""
+        return list(self.by_wxid.values())
+
+    def _update(self, result: Response) -> None:
+        """
+        与当前缓存做差异比较，只更新变化的联系人
+        """
+        if result.contacts is None:
+            logger.warning("<m>contact_cache</m> - <y>联系人返回为空，跳过刷新</y>")
+            return
+        latest = {contact.wxid: contact for contact in result.contacts.contacts}
+        removed = self.by_wxid.keys() - latest.keys()
+        changed = [
+            contact
+            for wxid, contact in latest.items()
+            if self.by_wxid.get(wxid) != contact
+        ]
+        for wxid in removed:
+            self._remove(wxid)
+        for contact in changed:
+            self._remove(contact.wxid)
+            self._add(contact)
+        logger.debug(
+            f"<m>contact_cache</m> - 联系人已刷新，共 {len(self.by_wxid)} 个，"
+            f"变化 {len(changed)} 个，删除 {len(removed)} 个"
+        )
+
+    def _add(self, contact: RpcContact) -> None:
+        self.by_wxid[contact.wxid] = contact
+        if contact.code:
+            self.by_code[contact.code] = contact.wxid
+        if contact.name:
+            self.by_name.setdefault(contact.name, set()).add(contact.wxid)
+
+    def _remove(self, wxid: str) -> None:
+        contact = self.by_wxid.pop(wxid, None)
+        if contact is None:
+            return
+        if self.by_code.get(contact.code) == wxid:
+            del self.by_code[contact.code]
+        wxids = self.by_name.get(contact.name)
+        if wxids is not None:
+            wxids.discard(wxid)
+            if not wxids:
+                del self.by_name[contact.name]
@@ -0,0 +1,85 @@
+"""
+定时发送，任务持久化在sqlite中，到期后经由正常的api调用流程执行
+"""
+import time
+from datetime import datetime
+from typing import Any, Optional, Union
+
+from apscheduler.job import Job
+from apscheduler.triggers.base import BaseTrigger
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+
+from wechatferry_client.log import logger
+
+
+async def run_action(action: str, params: dict, self_id: Optional[str] = None) -> None:
+    """
+    定时任务的执行函数，任务中只保存该函数的引用和参数，`self_id` 为空时使用默认账号。
+    账号已不在设置中或尚未就绪时跳过本次执行
+    """
+    from . import get_wechat
+
+    wechat = get_wechat(self_id)
+    if wechat is None or not wechat.ready:
+        logger.warning(
+            f"<m>scheduler</m> - <y>账号 {self_id} 不存在或尚未就绪，跳过定时任务：{action}</y>"
+        )
+        return
+    await wechat.run_job(action, params)
+
+
+def build_trigger(params: dict, timezone: Any) -> BaseTrigger:
+    """
+    说明:
+        根据参数构造触发器，`run_date`、`delay`、`cron`、`interval` 必须且只能指定一个
+
+    参数:
+        * `params`：任务参数
+            * `run_date`：执行时间，时间戳或ISO格式字符串
+            * `delay`：延迟执行的秒数
+            * `cron`：crontab表达式，如 `0 9 * * 1-5`
+            * `interval`：重复执行的间隔秒数
+        * `timezone`：时区
+
+    异常:
+        * `ValueError`：参数不正确
+    """
+    keys = [key for key in ("run_date", "delay", "cron", "interval") if key in params]
+    if len(keys) != 1:
+        raise ValueError("run_date、delay、cron、interval 必须且只能指定一个")
+    key = keys[0]
+    value = params[key]
+    if key == "run_date":
+        return DateTrigger(_parse_date(value, timezone), timezone=timezone)
+    if key == "delay":
+        return DateTrigger(
+            datetime.fromtimestamp(time.time() + float(value), timezone),
+            timezone=timezone,
+        )
+    if key == "cron":
+        return CronTrigger.from_crontab(str(value), timezone=timezone)
+    seconds = float(value)
+    if seconds <= 0:
+        raise ValueError("interval 必须大于0")
+    return IntervalTrigger(seconds=seconds, timezone=timezone)
+
+
+def _parse_date(value: Union[int, float, str], timezone: Any) -> datetime:
+    """时间戳或ISO格式字符串转为datetime"""
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, timezone)
+    return datetime.fromisoformat(value)
+
+
+def job_to_dict(job: Job) -> dict:
+    """任务转为dict"""
+    return {
+        "job_id": job.id,
+        "action": job.kwargs["action"],
+        "params": job.kwargs["params"],
+        "self_id": job.kwargs.get("self_id"),
+        "trigger": str(job.trigger),
+        "next_run_time": job.next_run_time.timestamp() if job.next_run_time else None,
+    }
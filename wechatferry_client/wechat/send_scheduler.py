@@ -0,0 +1,340 @@
+"""
+发送调度器，请求按优先级通道排队，发送类请求按全局和接收人两级令牌桶限速
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Literal, Optional, Union
+
+from google.protobuf.message import Message
+
+from wechatferry_client.config import Config
+from wechatferry_client.grpc import DispatcherBusy, DispatcherTimeout, GrpcManager
+from wechatferry_client.grpc.model import Request, Response
+from wechatferry_client.log import logger
+from wechatferry_client.timing import bind, current, record
+
+Lane = Literal["interactive", "bulk", "query"]
+"""优先级通道"""
+LANES: tuple[Lane, ...] = ("interactive", "bulk", "query")
+"""所有通道，按优先级从高到低排列"""
+
+
+class TokenBucket:
+    """
+    令牌桶，速率为0时不限速
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """距离下一个令牌可用的时间(s)"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        """取走一个令牌，调用前需确认 `delay` 为0"""
+        if self.rate <= 0:
+            return
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        """令牌是否已满，满的桶可以丢弃"""
+        if self.rate <= 0:
+            return True
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class _Job:
+    """通道中的一次请求"""
+
+    __slots__ = (
+        "request",
+        "receiver",
+        "raw",
+        "future",
+        "enqueued",
+        "deadline",
+        "timing",
+    )
+
+    def __init__(
+        self,
+        request: Request,
+        receiver: Optional[str],
+        raw: bool,
+        future: asyncio.Future,
+        timeout: float,
+    ) -> None:
+        self.request = request
+        self.receiver = receiver
+        self.raw = raw
+        self.future = future
+        self.enqueued = time.monotonic()
+        self.deadline = self.enqueued + timeout
+        self.timing = current()
+
+
+class _LaneStats:
+    """通道统计"""
+
+    __slots__ = ("served", "total_wait", "max_wait")
+
+    def __init__(self) -> None:
+        self.served = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+class SendScheduler:
+    """
+    发送调度器
+
+    位于api层与请求调度器之间：高优先级通道的请求总是先交给请求调度器，
+    同时只放行 `send_inflight` 个请求，大查询不会让交互回复排在它后面太久。
+    发送类请求需同时拿到全局和接收人的令牌才会放行，未拿到令牌的请求不阻塞同通道的其他请求。
+    通道中的排队时间也计入 `timeout`，超时的请求从通道中移除。
+    """
+
+    grpc: GrpcManager
+    """grpc通信管理器"""
+    lane_size: int
+    """每个通道的最大排队数"""
+    inflight: int
+    """同时放行的请求数"""
+    timeout: float
+    """请求截止时间(s)，包含通道和请求调度器中的排队时间"""
+    receiver_rate: float
+    """每个接收人的发送速率(条/s)"""
+    receiver_burst: int
+    """每个接收人的突发条数"""
+    global_bucket: TokenBucket
+    """全局令牌桶"""
+
+    def __init__(self, grpc: GrpcManager) -> None:
+        self.grpc = grpc
+        self.lane_size = 256
+        self.inflight = 1
+        self.timeout = 2
+        self.receiver_rate = 0
+        self.receiver_burst = 1
+        self.global_bucket = TokenBucket(0, 1)
+        self._lanes: dict[Lane, deque[_Job]] = {lane: deque() for lane in LANES}
+        self._stats: dict[Lane, _LaneStats] = {lane: _LaneStats() for lane in LANES}
+        self._buckets: dict[str, TokenBucket] = {}
+        self._running: set[asyncio.Task] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def init(self, config: Config) -> None:
+        """
+        读取限速设置
+        """
+        self.lane_size = config.send_lane_size
+        self.inflight = max(config.send_inflight, 1)
+        self.timeout = config.api_timeout
+        self.receiver_rate = config.send_receiver_rate
+        self.receiver_burst = config.send_receiver_burst
+        self.global_bucket = TokenBucket(config.send_rate, config.send_burst)
+
+    def start(self) -> None:
+        """
+        启动调度任务，需要在事件循环中调用
+        """
+        if self._task is not None and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        """
+        停止调度任务，未完成的请求全部取消
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in self._running:
+            task.cancel()
+        for queue in self._lanes.values():
+            while queue:
+                job = queue.popleft()
+                if not job.future.done():
+                    job.future.cancel()
+
+    async def submit(
+        self,
+        request: Request,
+        lane: Lane,
+        receiver: Optional[str] = None,
+        raw: bool = False,
+    ) -> Union[Response, Message]:
+        """
+        说明:
+            请求放入通道排队，放行后交给请求调度器并等待结果
+
+        参数:
+            * `request`：grpc请求
+            * `lane`：优先级通道
+            * `receiver`：接收人，不为空时按发送请求限速
+            * `raw`：是否直接返回protobuf消息
+
+        返回:
+            * `Response | wcf_pb2.Response`：grpc响应
+
+        异常:
+            * `DispatcherBusy`：通道已满
+            * `DispatcherTimeout`：超过截止时间，包括在通道中等待令牌的时间
+        """
+        self.start()
+        queue = self._lanes[lane]
+        if len(queue) >= self.lane_size:
+            raise DispatcherBusy(f"{lane} 通道已满({self.lane_size})")
+        loop = asyncio.get_running_loop()
+        job = _Job(request, receiver, raw, loop.create_future(), self.timeout)
+        queue.append(job)
+        self._wakeup.set()
+        try:
+            return await asyncio.wait_for(asyncio.shield(job.future), self.timeout)
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+        except asyncio.TimeoutError:
+            job.future.cancel()
+            if job in queue:
+                queue.remove(job)
+                raise DispatcherTimeout(f"{request.func.name} 排队超时") from None
+            raise DispatcherTimeout(f"{request.func.name} 请求超时") from None
+
+    def stats(self) -> dict[str, Any]:
+        """
+        说明:
+            各通道的积压和等待时间
+
+        返回:
+            * `dict`：`lanes` 中 `depth` 为当前排队数，`oldest_wait` 为最早请求已等待时间(s)，
+              `avg_wait`/`max_wait` 为已放行请求的排队时间(s)
+        """
+        now = time.monotonic()
+        lanes = {}
+        for lane in LANES:
+            queue = self._lanes[lane]
+            stats = self._stats[lane]
+            lanes[lane] = {
+                "depth": len(queue),
+                "oldest_wait": round(now - queue[0].enqueued, 6) if queue else 0.0,
+                "served": stats.served,
+                "avg_wait": round(stats.total_wait / stats.served, 6)
+                if stats.served
+                else 0.0,
+                "max_wait": round(stats.max_wait, 6),
+            }
+        return {
+            "inflight": len(self._running),
+            "receivers": len(self._buckets),
+            "lanes": lanes,
+        }
+
+    async def _run(self) -> None:
+        """调度循环，放行数达到上限时等待已放行的请求完成"""
+        slots = asyncio.Semaphore(self.inflight)
+        while True:
+            await slots.acquire()
+            job = None
+            while job is None:
+                job, wait = self._pick(time.monotonic())
+                if job is not None:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+            task = asyncio.create_task(self._execute(job))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+    def _pick(self, now: float) -> tuple[Optional[_Job], Optional[float]]:
+        """
+        按优先级取出第一个可放行的请求
+
+        返回:
+            * `(请求, None)`：可放行的请求
+            * `(None, 等待时间)`：需要等待令牌的最短时间，没有请求时为空
+        """
+        global_wait = self.global_bucket.delay(now)
+        min_wait: Optional[float] = None
+        for lane in LANES:
+            queue = self._lanes[lane]
+            for job in list(queue):
+                if job.future.done():
+                    queue.remove(job)
+                    continue
+                if job.receiver is not None:
+                    bucket = self._bucket(job.receiver, now)
+                    wait = max(global_wait, bucket.delay(now))
+                    if wait > 0:
+                        min_wait = wait if min_wait is None else min(min_wait, wait)
+                        continue
+                    self.global_bucket.take(now)
+                    bucket.take(now)
+                    global_wait = self.global_bucket.delay(now)
+                queue.remove(job)
+                stats = self._stats[lane]
+                waited = now - job.enqueued
+                stats.served += 1
+                stats.total_wait += waited
+                stats.max_wait = max(stats.max_wait, waited)
+                record(job.timing, "lane", waited)
+                return job, None
+        return None, min_wait
+
+    def _bucket(self, receiver: str, now: float) -> TokenBucket:
+        """获取接收人的令牌桶，数量过多时丢弃已满的桶"""
+        bucket = self._buckets.get(receiver)
+        if bucket is None:
+            if len(self._buckets) >= 4096:
+                self._buckets = {
+                    key: value
+                    for key, value in self._buckets.items()
+                    if not value.full(now)
+                }
+            bucket = TokenBucket(self.receiver_rate, self.receiver_burst)
+            self._buckets[receiver] = bucket
+        return bucket
+
+    async def _execute(self, job: _Job) -> None:
+        """交给请求调度器执行"""
+        bind(job.timing)
+        try:
+            result = await self.grpc.dispatcher.submit(
+                job.request,
+                timeout=max(job.deadline - time.monotonic(), 0),
+                raw=job.raw,
+            )
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+            logger.debug(f"<m>send_scheduler</m> - {job.request.func.name} 执行失败：{e}")
+            return
+        if not job.future.done():
+            job.future.set_result(result)
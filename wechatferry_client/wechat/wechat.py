@@ -1,13 +1,77 @@
+import asyncio
+import inspect
 import time
+from pathlib import Path
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterator,
+    Literal,
+    Optional,
+    Union,
+)
+from uuid import uuid4
 
-from pynng.exceptions import Timeout
+import httpx
+from apscheduler.jobstores.base import ConflictingIdError, JobLookupError
+from google.protobuf.message import Message
 
-from wechatferry_client.config import Config
+from wechatferry_client.config import AccountConfig, Config
+from wechatferry_client.event_bus import EventBus, Overflow, Subscriber
+from wechatferry_client.file_cache import FileCache, FileTooLarge
+from wechatferry_client.grpc import (
+    DispatcherBusy,
+    DispatcherTimeout,
+    DispatcherUnavailable,
+)
+from wechatferry_client.grpc.codec import iter_rows_ndjson
+from wechatferry_client.grpc.columnar import (
+    encode_columnar_binary,
+    encode_columnar_json,
+)
+from wechatferry_client.grpc.model import Functions
 from wechatferry_client.grpc.model import Request as GrpcRequest
-from wechatferry_client.log import logger
-from wechatferry_client.model import HttpRequest, HttpResponse, Request, Response
+from wechatferry_client.grpc.model import Response as GrpcResponse
+from wechatferry_client.image_decoder import ImageDecoder, find_dat_path
+from wechatferry_client.log import default_filter, log_writer, logger
+from wechatferry_client.metrics import (
+    api_requests,
+    api_seconds,
+    queue_depth,
+    subscriber_depth,
+    subscriber_dropped,
+    subscriber_lag,
+)
+from wechatferry_client.model import (
+    BatchItem,
+    BatchRequest,
+    BatchResult,
+    HttpRequest,
+    HttpResponse,
+    MessageEvent,
+    Request,
+    Response,
+    WsRequest,
+    WsResponse,
+)
+from wechatferry_client.msg_store import MsgStore, wxmsg_to_dict
+from wechatferry_client.scheduler import SEND_JOBSTORE, scheduler
+from wechatferry_client.timing import current, record
+from wechatferry_client.utils import escape_tag
 
 from .api_manager import Action, ApiManager
+from .contact_cache import ContactCache
+from .scheduled_send import build_trigger, job_to_dict, run_action
+from .send_scheduler import LANES, Lane
+
+Stage = Literal["starting", "login", "loading", "ready"]
+"""启动阶段：连接后端、等待登录、加载账号数据、就绪"""
+
+
+def _not_ready() -> Response:
+    """就绪前api调用的响应"""
+    return Response(status=503, msg="微信尚未就绪，请稍后再试", data={})
 
 
 class WeChatManager:
@@ -25,76 +89,717 @@ class WeChatManager:
     """
     self_id: str
     """自身微信id"""
+    contact_cache: ContactCache
+    """联系人缓存"""
+    event_bus: EventBus[MessageEvent]
+    """事件总线，多个账号共用，事件以 `self_id` 区分"""
+    msg_store: Optional[MsgStore]
+    """消息存储，未开启时为空"""
+    file_cache: FileCache
+    """文件缓存，init之后可用"""
+    image_decoder: Optional[ImageDecoder]
+    """图片解密器，未开启时为空"""
+    stage: Stage
+    """启动阶段，就绪前api调用返回503"""
+    msg_types: dict[int, str]
+    """消息类型表，就绪后可用"""
 
-    def __init__(self) -> None:
+    def __init__(self, event_bus: Optional[EventBus[MessageEvent]] = None) -> None:
         self.config = None
         self.api_manager = ApiManager()
         self.self_id = None
+        self.contact_cache = ContactCache(self.api_manager.grpc)
+        self._local_handlers: dict[
+            Action, Callable[[dict], Union[Response, Awaitable[Response]]]
+        ] = {
+            Action.CACHE_GET_CONTACT: self._get_contact,
+            Action.CACHE_FIND_CONTACTS: self._find_contacts,
+            Action.CACHE_GET_CONTACTS: self._get_cached_contacts,
+            Action.STORE_REPLAY_MSGS: self._replay_msgs,
+            Action.SCHED_GET_STATS: self._get_send_stats,
+            Action.JOB_ADD: self._add_job,
+            Action.JOB_GET_LIST: self._get_jobs,
+            Action.JOB_REMOVE: self._remove_job,
+        }
+        if event_bus is None:
+            event_bus = EventBus()
+            event_bus.consume("log", self._log_event)
+        self.event_bus = event_bus
+        self.msg_store = None
+        self.file_cache = None
+        self.image_decoder = None
+        self.stage = "starting"
+        self.msg_types = {}
+        self._primary: Optional[WeChatManager] = None
+        self._image_tasks: set[asyncio.Task] = set()
+        self.api_manager.grpc.msg_handlers.append(self._handle_msg)
+        queue_depth.collect(self._queue_depths)
+        subscriber_depth.collect(lambda: self._subscriber_stats("depth"))
+        subscriber_lag.collect(lambda: self._subscriber_stats("lag"))
+        subscriber_dropped.collect(lambda: self._subscriber_stats("dropped"))
 
-    def init(self, config: Config) -> None:
+    def init(
+        self,
+        config: Config,
+        account: Optional[AccountConfig] = None,
+        primary: Optional["WeChatManager"] = None,
+    ) -> None:
         """
-        初始化wechat管理端，需要在uvicorn.run之前执行
+        说明:
+            初始化wechat管理端，只做本地的准备，不连接后端，需要在uvicorn.run之前执行
+
+        参数:
+            * `config`：应用设置
+            * `account`：后端连接设置，为空则使用默认账号的设置
+            * `primary`：默认账号的管理端，不为空时共用它的文件缓存和图片解密器
         """
         self.config = config
-        self.api_manager.init()
+        self._primary = primary
+        if account is None:
+            account = AccountConfig(
+                api_address=config.api_address,
+                msg_address=config.msg_address,
+                inject=config.inject,
+            )
+        if primary is None:
+            self.event_bus.set_maxsize(config.event_queue_size)
+        self.api_manager.init(config, account)
+        if primary is not None:
+            self.file_cache = primary.file_cache
+            self.image_decoder = primary.image_decoder
+            return
+        self.file_cache = FileCache(config)
+        if config.cache_days > 0:
+            scheduler.add_job(
+                self.file_cache.cleanup,
+                trigger="interval",
+                minutes=1,
+                id="file_cache_cleanup",
+                replace_existing=True,
+            )
+        if config.image_decode:
+            self.image_decoder = ImageDecoder(config)
+            if config.image_days > 0:
+                scheduler.add_job(
+                    self.image_decoder.cleanup,
+                    trigger="cron",
+                    hour=0,
+                    minute=0,
+                    id="image_cleanup",
+                    replace_existing=True,
+                )
 
-        logger.debug("<y>开始获取wxid...</y>")
-        self.self_id = self.api_manager.get_wxid()
-        logger.debug("<g>微信id获取成功...</g>")
+    def _store_msg(self, event: MessageEvent) -> None:
+        """只存储本账号的消息"""
+        if event.self_id == self.self_id:
+            self.msg_store.append(event)
 
-    def wait_for_login(self) -> bool:
+    @property
+    def ready(self) -> bool:
+        """是否已登录并加载完账号数据"""
+        return self.stage == "ready"
+
+    async def start(self) -> None:
         """
-        等待微信登录完成
+        说明:
+            连接后端并等待登录，之后并发获取wxid、消息类型表、联系人和连接消息socket，
+            全部完成后开始接收消息。开启接收消息失败时一直重试，期间保持 `loading`
         """
-        while True:
-            try:
-                result = self.api_manager.check_is_login()
-                if result:
-                    return True
-                time.sleep(1)
-            except KeyboardInterrupt:
-                return False
-            except Timeout:
-                return False
+        self.event_bus.start()
+        await self.api_manager.grpc.connect()
+        self.stage = "login"
+        await self.api_manager.wait_for_login()
+        logger.info("<g>微信已登录，出发...</g>")
+        self.stage = "loading"
+        self.self_id, self.msg_types, _, _ = await asyncio.gather(
+            self.api_manager.get_wxid(),
+            self.api_manager.get_msg_types(),
+            self.contact_cache.refresh(),
+            self.api_manager.connect_msg_socket(),
+        )
+        logger.debug(f"<g>微信id获取成功：{self.self_id}</g>")
+        if self.config.contact_refresh_interval > 0:
+            scheduler.add_job(
+                self.contact_cache.refresh,
+                trigger="interval",
+                seconds=self.config.contact_refresh_interval,
+                id=f"contact_cache_refresh_{self.self_id}",
+                replace_existing=True,
+            )
+        if self.config.msg_store:
+            path = None
+            if self._primary is not None:
+                path = Path(self.config.msg_store_path) / self.self_id
+            self.msg_store = MsgStore(self.config, path)
+            self.msg_store.open()
+            # 写入时只按条数刷新，不足时定时刷新，在线程中执行
+            scheduler.add_job(
+                self.msg_store.flush,
+                trigger="interval",
+                seconds=self.config.msg_store_flush_interval,
+                id=f"msg_store_flush_{self.self_id}",
+                replace_existing=True,
+            )
+            self.on_event(
+                self._store_msg,
+                name=f"msg_store_{self.self_id}",
+                overflow="drop_newest",
+            )
+        self.api_manager.grpc.start_receiving()
+        self.stage = "ready"
 
-    def connect_msg_socket(self) -> bool:
+    def on_event(
+        self,
+        handler: Callable[[MessageEvent], Union[None, Awaitable[None]]],
+        name: str,
+        maxsize: Optional[int] = None,
+        overflow: Overflow = "drop_oldest",
+    ) -> Subscriber[MessageEvent]:
         """
-        连接到接收socket
+        说明:
+            注册事件处理函数，处理函数在独立的任务中执行，不会阻塞消息接收
+
+        参数:
+            * `handler`：处理函数，可以是同步或异步函数
+            * `name`：订阅者名称
+            * `maxsize`：队列长度，为空则使用 `event_queue_size`
+            * `overflow`：队列已满时的处理策略
+        """
+        return self.event_bus.consume(name, handler, maxsize, overflow)
+
+    def _queue_depths(self) -> Iterator[tuple[tuple[str, ...], int]]:
+        """各队列当前积压，采集指标时调用"""
+        self_id = self.self_id or ""
+        yield (self_id, "dispatcher"), self.api_manager.grpc.dispatcher.depth
+        for lane, stats in self.api_manager.scheduler.stats()["lanes"].items():
+            yield (self_id, f"send_{lane}"), stats["depth"]
+        yield (self_id, "image_decode"), len(self._image_tasks)
+        if self._primary is None:
+            for subscriber in self.event_bus.subscribers:
+                yield ("", f"event_{subscriber.name}"), subscriber.depth
+            yield ("", "log_writer"), log_writer.depth
+
+    def _subscriber_stats(self, key: str) -> Iterator[tuple[tuple[str, ...], float]]:
+        """事件订阅者的一项统计，采集指标时调用，多个账号共用总线，只由默认账号输出"""
+        if self._primary is not None:
+            return
+        for subscriber in self.event_bus.subscribers:
+            yield (subscriber.name,), getattr(subscriber, key)
+
+    def _handle_msg(self, msg: GrpcResponse) -> None:
+        """
+        将收到的消息包装为事件发布到总线，需要解密的图片消息在解密完成后再发布
         """
-        return self.api_manager.connect_msg_socket()
+        event = MessageEvent.construct(
+            self_id=self.self_id, time=int(time.time()), message=msg.wxmsg
+        )
+        if self.image_decoder is not None and msg.wxmsg.type == 3:
+            src = find_dat_path(msg.wxmsg)
+            if src is not None:
+                task = asyncio.create_task(self._decode_image(event, src))
+                self._image_tasks.add(task)
+                task.add_done_callback(self._image_tasks.discard)
+                return
+        self.event_bus.publish(event)
+
+    async def _decode_image(self, event: MessageEvent, src: str) -> None:
+        """
+        解密图片后发布事件，超时时按 `timeout_image_send` 决定是否继续发布
+        """
+        try:
+            path = await self.image_decoder.decode(src)
+        except asyncio.TimeoutError:
+            logger.warning(f"<y>图片解密超时：</y>{escape_tag(src)}")
+            if not self.config.timeout_image_send:
+                return
+            path = None
+        except Exception as e:
+            logger.error(f"<r>图片解密出错：{escape_tag(str(e))}</r>")
+            path = None
+        if path is not None:
+            event.image = str(path)
+        self.event_bus.publish(event)
+
+    def _log_event(self, event: MessageEvent) -> None:
+        """记录收到的消息，日志等级高于DEBUG时不做序列化"""
+        if not default_filter.enabled("DEBUG"):
+            return
+        msg_type = self.msg_types.get(event.message.type, event.message.type)
+        logger.debug(
+            f"收到{msg_type}消息 - "
+            f"{escape_tag(event.message.json(skip_defaults=True,ensure_ascii=False))}"
+        )
 
     def close(self) -> None:
         """
         管理微信管理模块
         """
+        self.event_bus.stop()
         self.api_manager.close()
+        if self.msg_store is not None:
+            self.msg_store.close()
+        if self.image_decoder is not None and self._primary is None:
+            self.image_decoder.close()
 
     async def _handle_api(self, request: Request) -> Response:
         """
-        处理api调用请求
+        处理api调用请求，记录调用次数和耗时
         """
+        start = time.perf_counter()
         # 确认action
         try:
             action = Action(request.action)
         except ValueError:
             logger.error("调用api出错：<r>功能未实现</r>")
+            api_requests.inc("unknown", "404")
             return Response(status=404, msg=f"{request.action} :该功能未实现", data={})
+        if not self.ready:
+            api_requests.inc(action.value, "503")
+            return _not_ready()
+        response = await self._call_api(action, request)
+        api_requests.inc(action.value, str(response.status))
+        api_seconds.observe(time.perf_counter() - start, action.value, "total")
+        return response
+
+    async def _call_api(self, action: Action, request: Request) -> Response:
+        """
+        执行api调用
+        """
+        # 本地处理的action
+        handler = self._local_handlers.get(action)
+        if handler is not None:
+            response = handler(request.params)
+            if inspect.isawaitable(response):
+                response = await response
+            return response
+        # 列式返回的查询
+        if (
+            action == Action.FUNC_EXEC_DB_QUERY
+            and request.params.get("format") == "columnar"
+        ):
+            rows = await self._query_rows(request.params)
+            if isinstance(rows, Response):
+                return rows
+            return Response(status=200, msg="请求成功", data=encode_columnar_json(rows))
+        # 发送图片和文件时，url或base64先存入文件缓存
+        if action in (Action.FUNC_SEND_IMG, Action.FUNC_SEND_FILE):
+            error = await self._resolve_file(request.params)
+            if error is not None:
+                return error
         # 调用action
+        start = time.perf_counter()
         try:
+            lane = self._lane(action, request.params)
             request.params["func"] = action.action_to_function()
             grpc_request = GrpcRequest.parse_obj(request.params)
         except Exception as e:
             logger.error(f"调用api出错：<r>{e}</r>")
             return Response(status=500, msg="请求参数错误", data={})
+        elapsed = time.perf_counter() - start
+        api_seconds.observe(elapsed, action.value, "validate")
+        record(current(), "validate", elapsed)
         try:
-            result = await self.api_manager.grpc.request(grpc_request)
+            result = await self.api_manager.request(grpc_request, lane)
         except Exception as e:
-            logger.error(f"调用api出错：<r>{e}</r>")
-            return Response(status=500, msg="响应错误", data={})
+            return self._error_response(e)
         data = result.dict(exclude_defaults=True)
         del data["func"]
         return Response(status=200, msg="请求成功", data=data)
 
+    async def _resolve_file(self, params: dict) -> Optional[Response]:
+        """
+        `file` 参数中没有 `path` 时，将 `url` 或 `base64` 存入文件缓存并填入路径，出错时返回响应
+        """
+        file = params.get("file")
+        if not isinstance(file, dict) or file.get("path"):
+            return None
+        name = file.pop("name", None)
+        try:
+            if "url" in file:
+                path = await self.file_cache.save_url(file.pop("url"), name)
+            elif "base64" in file:
+                path = await self.file_cache.save_base64(file.pop("base64"), name)
+            else:
+                return None
+        except FileTooLarge as e:
+            logger.error(f"缓存文件出错：<r>{e}</r>")
+            return Response(status=413, msg="文件过大", data={})
+        except (httpx.HTTPError, httpx.InvalidURL) as e:
+            # InvalidURL不是HTTPError的子类
+            logger.error(f"下载文件出错：<r>{e}</r>")
+            return Response(status=502, msg="文件下载失败", data={})
+        except ValueError as e:
+            logger.error(f"缓存文件出错：<r>{e}</r>")
+            return Response(status=500, msg="请求参数错误", data={})
+        file["path"] = str(path)
+        return None
+
+    def _lane(self, action: Action, params: dict) -> Lane:
+        """
+        取出请求指定的优先级通道，未指定时使用action的默认通道
+        """
+        lane = params.pop("lane", None) or action.default_lane
+        if lane not in LANES:
+            raise ValueError(f"优先级通道不存在：{lane}")
+        return lane
+
+    def _error_response(self, e: Exception) -> Response:
+        """
+        grpc请求异常转换为api响应
+        """
+        if isinstance(e, DispatcherBusy):
+            logger.warning(f"调用api出错：<y>{e}</y>")
+            return Response(status=503, msg="请求繁忙，请稍后再试", data={})
+        if isinstance(e, DispatcherUnavailable):
+            logger.warning(f"调用api出错：<y>{e}</y>")
+            return Response(status=503, msg="后端暂时不可用，请稍后再试", data={})
+        if isinstance(e, DispatcherTimeout):
+            logger.error(f"调用api出错：<r>{e}</r>")
+            return Response(status=504, msg="响应超时", data={})
+        logger.error(f"调用api出错：<r>{e}</r>")
+        return Response(status=500, msg="响应错误", data={})
+
+    async def handle_stream_query(
+        self, params: dict
+    ) -> Union[Response, Iterator[bytes]]:
+        """
+        说明:
+            执行数据库查询，结果不构造模型，直接逐行编码为NDJSON
+
+        参数:
+            * `params`：查询参数，同 `exec_db_query`
+
+        返回:
+            * `Response`：请求出错时的响应
+            * `Iterator[bytes]`：NDJSON数据块
+        """
+        rows = await self._query_rows(params)
+        if isinstance(rows, Response):
+            return rows
+        return iter_rows_ndjson(rows)
+
+    async def handle_columnar_query(self, params: dict) -> Union[Response, bytes]:
+        """
+        说明:
+            执行数据库查询，结果编码为二进制列式格式
+
+        参数:
+            * `params`：查询参数，同 `exec_db_query`
+
+        返回:
+            * `Response`：请求出错时的响应
+            * `bytes`：编码结果，格式见 `grpc.columnar`
+        """
+        rows = await self._query_rows(params)
+        if isinstance(rows, Response):
+            return rows
+        return encode_columnar_binary(rows)
+
+    async def _query_rows(self, params: dict) -> Union[Response, Message]:
+        """
+        执行数据库查询，返回 `wcf_pb2.DbRows`，出错时返回响应
+        """
+        if not self.ready:
+            return _not_ready()
+        try:
+            lane = self._lane(Action.FUNC_EXEC_DB_QUERY, params)
+            grpc_request = GrpcRequest(func=Functions.FUNC_EXEC_DB_QUERY, **params)
+        except Exception as e:
+            logger.error(f"调用api出错：<r>{e}</r>")
+            return Response(status=500, msg="请求参数错误", data={})
+        try:
+            result = await self.api_manager.request(grpc_request, lane, raw=True)
+        except Exception as e:
+            return self._error_response(e)
+        if result.WhichOneof("msg") != "rows":
+            return Response(status=500, msg="响应错误", data={})
+        return result.rows
+
+    def _get_contact(self, params: dict) -> Response:
+        """
+        从缓存获取单个联系人
+        """
+        if "wxid" in params:
+            contact = self.contact_cache.get(params["wxid"])
+        elif "code" in params:
+            contact = self.contact_cache.get_by_code(params["code"])
+        else:
+            return Response(status=500, msg="请求参数错误", data={})
+        if contact is None:
+            return Response(status=404, msg="联系人不存在", data={})
+        return Response(status=200, msg="请求成功", data=contact.dict())
+
+    def _find_contacts(self, params: dict) -> Response:
+        """
+        从缓存按昵称查找联系人
+        """
+        if "name" not in params:
+            return Response(status=500, msg="请求参数错误", data={})
+        contacts = self.contact_cache.find_by_name(params["name"])
+        data = {"contacts": [contact.dict() for contact in contacts]}
+        return Response(status=200, msg="请求成功", data=data)
+
+    def _get_cached_contacts(self, params: dict) -> Response:
+        """
+        从缓存获取所有联系人
+        """
+        data = {"contacts": [contact.dict() for contact in self.contact_cache.all()]}
+        return Response(status=200, msg="请求成功", data=data)
+
+    async def _replay_msgs(self, params: dict) -> Response:
+        """
+        从消息存储回放消息，`after_id` 优先于 `after_seq`，可同时指定 `since_time`，
+        `limit` 不超过 `msg_store_replay_limit`。读取文件在线程中进行，不阻塞事件循环
+        """
+        if self.msg_store is None:
+            return Response(status=404, msg="消息存储未开启", data={})
+        try:
+            after_seq = params.get("after_seq")
+            if "after_id" in params:
+                after_seq = await asyncio.to_thread(
+                    self.msg_store.find_seq, str(params["after_id"])
+                )
+                if after_seq is None:
+                    return Response(status=404, msg="消息不存在", data={})
+            limit = min(
+                int(params.get("limit", 100)), self.config.msg_store_replay_limit
+            )
+            records = await asyncio.to_thread(
+                self.msg_store.replay,
+                after_seq=None if after_seq is None else int(after_seq),
+                since_time=params.get("since_time"),
+                limit=max(limit, 0),
+            )
+        except (TypeError, ValueError):
+            return Response(status=500, msg="请求参数错误", data={})
+        data = {
+            "messages": [
+                {"seq": seq, "time": time, "message": wxmsg_to_dict(msg)}
+                for seq, time, msg in records
+            ],
+            "next_seq": self.msg_store.next_seq,
+        }
+        return Response(status=200, msg="请求成功", data=data)
+
+    def _get_send_stats(self, params: dict) -> Response:
+        """
+        获取发送调度器各通道的积压和等待时间
+        """
+        return Response(status=200, msg="请求成功", data=self.api_manager.scheduler.stats())
+
+    def _add_job(self, params: dict) -> Response:
+        """
+        添加定时任务，参数为 `action`、`params`、可选的 `job_id` 以及触发方式，见 `build_trigger`，
+        `params` 在添加时按调用时的方式校验
+        """
+        try:
+            action = Action(params.get("action"))
+        except ValueError:
+            return Response(status=404, msg=f"{params.get('action')} :该功能未实现", data={})
+        if action in (Action.JOB_ADD, Action.JOB_GET_LIST, Action.JOB_REMOVE):
+            return Response(status=500, msg="定时任务不能执行该功能", data={})
+        try:
+            trigger = build_trigger(params, scheduler.timezone)
+        except (TypeError, ValueError) as e:
+            logger.error(f"添加定时任务出错：<r>{e}</r>")
+            return Response(status=500, msg="请求参数错误", data={})
+        # 到期时才发现参数错误就无法告知调用方，添加时先校验
+        job_params = params.get("params") or {}
+        try:
+            if not isinstance(job_params, dict):
+                raise TypeError("params 必须是对象")
+            self._validate_params(action, job_params)
+        except Exception as e:
+            logger.error(f"添加定时任务出错：<r>{e}</r>")
+            return Response(status=500, msg="请求参数错误", data={})
+        try:
+            job = scheduler.add_job(
+                run_action,
+                trigger=trigger,
+                kwargs={
+                    "action": action.value,
+                    "params": job_params,
+                    "self_id": self.self_id,
+                },
+                id=params.get("job_id") or uuid4().hex,
+                jobstore=SEND_JOBSTORE,
+                misfire_grace_time=self.config.job_misfire_grace_time,
+                coalesce=self.config.job_coalesce,
+            )
+        except ConflictingIdError:
+            return Response(status=409, msg="任务id已存在", data={})
+        return Response(status=200, msg="请求成功", data=job_to_dict(job))
+
+    def _get_jobs(self, params: dict) -> Response:
+        """
+        获取所有定时任务
+        """
+        jobs = scheduler.get_jobs(jobstore=SEND_JOBSTORE)
+        data = {"jobs": [job_to_dict(job) for job in jobs if self._owns_job(job)]}
+        return Response(status=200, msg="请求成功", data=data)
+
+    def _remove_job(self, params: dict) -> Response:
+        """
+        删除定时任务
+        """
+        job_id = str(params.get("job_id"))
+        job = scheduler.get_job(job_id, jobstore=SEND_JOBSTORE)
+        if job is None or not self._owns_job(job):
+            return Response(status=404, msg="任务不存在", data={})
+        try:
+            scheduler.remove_job(job_id, jobstore=SEND_JOBSTORE)
+        except JobLookupError:
+            return Response(status=404, msg="任务不存在", data={})
+        return Response(status=200, msg="请求成功", data={})
+
+    def _owns_job(self, job) -> bool:
+        """任务是否属于本账号，未记录账号的任务属于默认账号"""
+        self_id = job.kwargs.get("self_id")
+        if self_id is None:
+            return self._primary is None
+        return self_id == self.self_id
+
+    async def run_job(self, action: str, params: dict) -> None:
+        """
+        说明:
+            执行到期的定时任务，与api调用走相同的流程，发送消息默认走bulk通道
+
+        参数:
+            * `action`：action名称
+            * `params`：action参数
+        """
+        params = dict(params)
+        if Action(action).is_send:
+            params.setdefault("lane", "bulk")
+        response = await self._handle_api(Request(action=action, params=params))
+        if response.status != 200:
+            logger.error(f"<m>scheduler</m> - <r>定时任务执行失败：{action} {response.msg}</r>")
+
+    def check_batch(self, request: BatchRequest) -> Optional[Response]:
+        """
+        说明:
+            在执行前校验批量请求
+
+        参数:
+            * `request`：批量请求
+
+        返回:
+            * `Response | None`：校验失败时的响应，`data` 为出错的请求
+        """
+        if len(request.requests) > self.config.batch_max_size:
+            return Response(
+                status=413,
+                msg=f"批量请求数超过上限：{self.config.batch_max_size}",
+                data={},
+            )
+        unknown = []
+        invalid = []
+        for index, item in enumerate(request.requests):
+            try:
+                action = Action(item.action)
+            except ValueError:
+                unknown.append({"index": index, "id": item.id, "action": item.action})
+                continue
+            try:
+                self._validate_params(action, item.params or {})
+            except Exception as e:
+                invalid.append(
+                    {
+                        "index": index,
+                        "id": item.id,
+                        "action": item.action,
+                        "error": str(e),
+                    }
+                )
+        if unknown:
+            return Response(status=404, msg="存在未实现的功能", data=unknown)
+        if invalid:
+            # 与单个调用参数错误时的响应一致，`data` 中列出出错的请求
+            return Response(status=500, msg="请求参数错误", data=invalid)
+        return None
+
+    def _validate_params(self, action: Action, params: dict) -> None:
+        """
+        说明:
+            按调用时的方式构造grpc请求，只校验不执行，本地处理的action不校验
+
+        异常:
+            * `Exception`：参数不正确
+        """
+        if action in self._local_handlers:
+            return
+        params = dict(params)
+        self._lane(action, params)
+        file = params.get("file")
+        if isinstance(file, dict) and not file.get("path"):
+            if "url" in file or "base64" in file:
+                # 路径在调用时由文件缓存填入
+                params["file"] = {**file, "path": ""}
+        GrpcRequest(func=action.action_to_function(), **params)
+
+    async def _handle_batch_item(self, item: BatchItem) -> BatchResult:
+        """执行批量请求中的单个请求，发送消息默认走bulk通道"""
+        params = item.params or {}
+        if Action(item.action).is_send:
+            params.setdefault("lane", "bulk")
+        request = Request(action=item.action, params=params)
+        response = await self._handle_api(request)
+        return BatchResult(
+            id=item.id, status=response.status, msg=response.msg, data=response.data
+        )
+
+    async def iter_batch(self, request: BatchRequest) -> AsyncIterator[BatchResult]:
+        """
+        说明:
+            执行批量请求，请求会同时提交到调度器排队，结果按完成顺序产出；
+            开启 `stop_on_failure` 时按顺序逐个执行，失败后剩余请求直接跳过
+
+        参数:
+            * `request`：已校验的批量请求
+
+        返回:
+            * `AsyncIterator[BatchResult]`：单个请求的结果
+        """
+        if request.stop_on_failure:
+            failed = False
+            for item in request.requests:
+                if failed:
+                    yield BatchResult(id=item.id, status=424, msg="前序请求失败，已跳过", data={})
+                    continue
+                result = await self._handle_batch_item(item)
+                failed = result.status != 200
+                yield result
+            return
+        tasks = [
+            asyncio.create_task(self._handle_batch_item(item))
+            for item in request.requests
+        ]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def handle_batch(self, request: BatchRequest) -> list[BatchResult]:
+        """
+        说明:
+            执行批量请求，结果与请求顺序一致
+
+        参数:
+            * `request`：已校验的批量请求
+
+        返回:
+            * `list[BatchResult]`：结果列表
+        """
+        if request.stop_on_failure:
+            return [result async for result in self.iter_batch(request)]
+        return list(
+            await asyncio.gather(
+                *(self._handle_batch_item(item) for item in request.requests)
+            )
+        )
+
     async def handle_http_api(self, request: HttpRequest) -> HttpResponse:
         """
         说明:
@@ -111,3 +816,21 @@ class WeChatManager:
         return HttpResponse(
             status=response.status, msg=response.msg, data=response.data
         )
+
+    async def handle_ws_api(self, request: WsRequest) -> WsResponse:
+        """
+        说明:
+            处理websocket api请求
+
+        参数:
+            * `request`：websocket请求
+
+        返回:
+            * `WsResponse`：websocket响应
+        """
+        echo = request.echo
+        request = Request(action=request.action, params=request.params or {})
+        response = await self._handle_api(request)
+        return WsResponse(
+            status=response.status, msg=response.msg, data=response.data, echo=echo
+        )